@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Load test for the Order Service.
+
+Keeps --concurrency requests in flight against the order service for
+--duration seconds and reports throughput and latency. Run it once against
+the order service served by WSGI and once served by ASGI with the async
+views, with the same number of worker processes, to compare them (see the
+README). The user and product services must be running.
+
+Scenarios:
+  create  POST /orders/ - user lookup, stock hold and confirm per request
+  list    GET /orders/?page_size=20 - one page of orders with enrichment
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+# Service URLs
+USER_SERVICE = "http://localhost:8000"
+PRODUCT_SERVICE = "http://localhost:8001"
+ORDER_SERVICE = "http://localhost:8002"
+
+
+def setup(user_service, product_service):
+    """Create a user and a product with plenty of stock to order"""
+    suffix = uuid.uuid4().hex[:8]
+    user = httpx.post(f"{user_service}/users/", json={
+        "username": f"loadtest_{suffix}",
+        "email": f"loadtest_{suffix}@example.com",
+        "password": "password123",
+        "address": "1 Load Test Road",
+    }).json()
+    category = httpx.post(f"{product_service}/categories/", json={
+        "name": f"Load test {suffix}",
+        "description": "Created by load_test.py",
+    }).json()
+    product = httpx.post(f"{product_service}/products/", json={
+        "name": f"Load test product {suffix}",
+        "description": "Created by load_test.py",
+        "price": "1.00",
+        "category_id": category["id"],
+        "stock_quantity": 10_000_000,
+    }).json()
+    return user["id"], product["id"]
+
+
+async def run(order_service, scenario, concurrency, duration, user_id, product_id):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies = []
+    statuses = {}
+    deadline = time.monotonic() + duration
+
+    async with httpx.AsyncClient(base_url=order_service, limits=limits, timeout=30.0) as client:
+        async def one_request():
+            if scenario == "create":
+                return await client.post("/orders/", json={
+                    "user_id": user_id,
+                    "shipping_address": "1 Load Test Road",
+                    "items": [{"product_id": product_id, "quantity": 1, "price": "1.00"}],
+                })
+            return await client.get("/orders/", params={"page_size": 20})
+
+        async def worker():
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await one_request()
+                    key = response.status_code
+                except httpx.HTTPError as e:
+                    key = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[key] = statuses.get(key, 0) + 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    return latencies, statuses, elapsed
+
+
+def report(latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)] * 1000
+
+    print(f"Requests: {len(latencies)} in {elapsed:.1f}s -> {len(latencies) / elapsed:.1f} req/s")
+    print(f"Statuses: {statuses}")
+    print(f"Latency ms: mean {statistics.mean(latencies) * 1000:.1f}, p50 {percentile(50):.1f}, "
+          f"p95 {percentile(95):.1f}, p99 {percentile(99):.1f}, max {latencies[-1] * 1000:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["create", "list"], default="create")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds")
+    parser.add_argument("--order-service", default=ORDER_SERVICE)
+    parser.add_argument("--user-service", default=USER_SERVICE)
+    parser.add_argument("--product-service", default=PRODUCT_SERVICE)
+    args = parser.parse_args()
+
+    user_id, product_id = setup(args.user_service, args.product_service)
+    print(f"Scenario '{args.scenario}' against {args.order_service}: "
+          f"{args.concurrency} concurrent requests for {args.duration:.0f}s")
+    report(*asyncio.run(run(args.order_service, args.scenario, args.concurrency, args.duration,
+                            user_id, product_id)))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -77,11 +78,51 @@ WSGI_APPLICATION = "order_service.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db_order_service.sqlite3",
+# SQLite by default. Set DB_ENGINE=postgresql (with DB_NAME, DB_USER, DB_PASSWORD,
+# DB_HOST, DB_PORT) to use a database server; put PgBouncer in front of it for
+# pooling across processes and set DB_DISABLE_SERVER_SIDE_CURSORS=true when it
+# runs in transaction pooling mode.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+
+# Longest a statement waits for a lock before failing, in ms: SQLite's busy_timeout and
+# PostgreSQL's lock_timeout (SQLITE_BUSY_TIMEOUT is the older name of this setting)
+DB_LOCK_TIMEOUT = int(os.environ.get('DB_LOCK_TIMEOUT', os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)))
+
+if DB_ENGINE == 'sqlite3':
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get('DB_NAME', BASE_DIR / "db_order_service.sqlite3"),
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": f"django.db.backends.{DB_ENGINE}",
+            "NAME": os.environ.get('DB_NAME', "order_service"),
+            "USER": os.environ.get('DB_USER', ''),
+            "PASSWORD": os.environ.get('DB_PASSWORD', ''),
+            "HOST": os.environ.get('DB_HOST', 'localhost'),
+            "PORT": os.environ.get('DB_PORT', ''),
+            "DISABLE_SERVER_SIDE_CURSORS": os.environ.get('DB_DISABLE_SERVER_SIDE_CURSORS', 'false').lower() == 'true',
+        }
     }
+    if DB_ENGINE == 'postgresql':
+        DATABASES["default"]["OPTIONS"] = {"options": f"-c lock_timeout={DB_LOCK_TIMEOUT}"}
+
+# Keep connections open between requests (per thread) for this many seconds and
+# check them before reuse, instead of connecting on every request
+DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# Applied to every new SQLite connection (see orders/db.py): WAL lets readers run
+# while a write is in progress, busy_timeout (ms) makes a writer wait for the lock
+# instead of failing with "database is locked", and synchronous=NORMAL drops the
+# fsync per commit, which WAL keeps safe against corruption.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': DB_LOCK_TIMEOUT,
+    'synchronous': 'NORMAL',
 }
 
 
@@ -147,11 +188,142 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 # External Services URLs
-USER_SERVICE_URL = "http://localhost:8000"
-PRODUCT_SERVICE_URL = "http://localhost:8001"
+USER_SERVICE_URL = os.environ.get('USER_SERVICE_URL', "http://localhost:8000")
+PRODUCT_SERVICE_URL = os.environ.get('PRODUCT_SERVICE_URL', "http://localhost:8001")
+
+# Pooled keep-alive HTTP clients for the external services (see orders/http_client.py).
+# Timeouts are in seconds; MAX_CONNECTIONS caps concurrent connections per upstream and
+# a call waiting longer than MAX_WAIT seconds for a free connection is rejected (bulkhead).
+UPSTREAM_SERVICES = {
+    'user': {
+        'URL': USER_SERVICE_URL,
+        'MAX_CONNECTIONS': int(os.environ.get('USER_SERVICE_MAX_CONNECTIONS', 20)),
+        'CONNECT_TIMEOUT': float(os.environ.get('USER_SERVICE_CONNECT_TIMEOUT', 1.0)),
+        'READ_TIMEOUT': float(os.environ.get('USER_SERVICE_READ_TIMEOUT', 5.0)),
+        'MAX_WAIT': float(os.environ.get('USER_SERVICE_MAX_WAIT', 0.5)),
+    },
+    'product': {
+        'URL': PRODUCT_SERVICE_URL,
+        'MAX_CONNECTIONS': int(os.environ.get('PRODUCT_SERVICE_MAX_CONNECTIONS', 20)),
+        'CONNECT_TIMEOUT': float(os.environ.get('PRODUCT_SERVICE_CONNECT_TIMEOUT', 1.0)),
+        'READ_TIMEOUT': float(os.environ.get('PRODUCT_SERVICE_READ_TIMEOUT', 5.0)),
+        'MAX_WAIT': float(os.environ.get('PRODUCT_SERVICE_MAX_WAIT', 0.5)),
+    },
+}
+
+# Per-upstream circuit breakers (see orders/resilience.py). The breaker opens when, over
+# the last WINDOW_SIZE calls (and at least MINIMUM_CALLS), the share of failed calls
+# reaches FAILURE_RATE or the share of calls slower than SLOW_CALL_DURATION seconds
+# reaches SLOW_CALL_RATE. It stays open for OPEN_DURATION seconds, then lets a trial
+# call through. Override per upstream with a 'CIRCUIT_BREAKER' dict in UPSTREAM_SERVICES.
+CIRCUIT_BREAKER = {
+    'WINDOW_SIZE': 20,
+    'MINIMUM_CALLS': 10,
+    'FAILURE_RATE': 0.5,
+    'SLOW_CALL_DURATION': 2.0,
+    'SLOW_CALL_RATE': 0.8,
+    'OPEN_DURATION': float(os.environ.get('CIRCUIT_BREAKER_OPEN_DURATION', 10.0)),
+}
+
+# Retries for transient upstream failures (connection errors, timeouts, 502/503/504),
+# per ExternalServiceClient method; methods not listed are not retried. Backoff is
+# exponential from BASE_DELAY up to MAX_DELAY seconds with full jitter. Stock changes
+# are only retried when they carry a reservation ID or an Idempotency-Key.
+_LOOKUP_RETRY = {
+    'MAX_ATTEMPTS': int(os.environ.get('LOOKUP_RETRY_MAX_ATTEMPTS', 3)),
+    'BASE_DELAY': 0.05,
+    'MAX_DELAY': 0.5,
+}
+_STOCK_RETRY = {
+    'MAX_ATTEMPTS': int(os.environ.get('STOCK_RETRY_MAX_ATTEMPTS', 3)),
+    'BASE_DELAY': 0.1,
+    'MAX_DELAY': 1.0,
+}
+RETRY_POLICIES = {
+    'get_user_info': _LOOKUP_RETRY,
+    'get_users_info': _LOOKUP_RETRY,
+    'get_product_info': _LOOKUP_RETRY,
+    'get_products_info': _LOOKUP_RETRY,
+    'reserve_stock': _STOCK_RETRY,
+    'confirm_reservation': _STOCK_RETRY,
+    'release_stock': _STOCK_RETRY,
+    'reserve_stock_batch': _STOCK_RETRY,
+    'confirm_reservations': _STOCK_RETRY,
+    'release_reservations': _STOCK_RETRY,
+    'fetch_events': _LOOKUP_RETRY,
+}
+
+# Process-wide cap on retries: over the last WINDOW seconds, retries may not exceed
+# RATIO of all upstream requests plus MIN_PER_SECOND retries per second, so that
+# retrying cannot multiply the load on an upstream that is already failing.
+RETRY_BUDGET = {
+    'RATIO': float(os.environ.get('RETRY_BUDGET_RATIO', 0.1)),
+    'MIN_PER_SECOND': 1.0,
+    'WINDOW': 10,
+}
+
+# Seconds Product Service holds stock for an order before the hold is confirmed;
+# unconfirmed holds are given back after this (see orders/saga.py).
+STOCK_RESERVATION_TTL = int(os.environ.get('STOCK_RESERVATION_TTL', 120))
+
+# In-process caches for user/product lookups (see orders/cache.py). TTLs are in
+# seconds; NEGATIVE_TTL applies to IDs the upstream reported as not found.
+# Product data is only used for display names, so it can be cached briefly.
+ENTITY_CACHES = {
+    'user': {
+        'TTL': float(os.environ.get('USER_CACHE_TTL', 60)),
+        'NEGATIVE_TTL': float(os.environ.get('USER_CACHE_NEGATIVE_TTL', 5)),
+        'MAX_ENTRIES': int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000)),
+    },
+    'product': {
+        'TTL': float(os.environ.get('PRODUCT_CACHE_TTL', 30)),
+        'NEGATIVE_TTL': float(os.environ.get('PRODUCT_CACHE_NEGATIVE_TTL', 5)),
+        'MAX_ENTRIES': int(os.environ.get('PRODUCT_CACHE_MAX_ENTRIES', 10000)),
+    },
+}
+
+# Order enrichment: user and product lookups run concurrently and give up after
+# ENRICHMENT_DEADLINE seconds, returning partial data marked with X-Enrichment-Degraded.
+ENRICHMENT_DEADLINE = float(os.environ.get('ENRICHMENT_DEADLINE', 2.0))
+ENRICHMENT_MAX_WORKERS = int(os.environ.get('ENRICHMENT_MAX_WORKERS', 16))
+
+# Enrich from the local copies of user/product data kept by `manage.py consume_events`
+# (see orders/read_model.py) before calling the other services.
+ENRICHMENT_READ_MODEL = os.environ.get('ENRICHMENT_READ_MODEL', 'true').lower() == 'true'
+
+# Serve the order endpoints with the async views (orders/async_views.py). Only worth it
+# under an ASGI server, e.g. `uvicorn order_service.asgi:application`.
+ORDER_SERVICE_ASYNC_VIEWS = os.environ.get('ORDER_SERVICE_ASYNC_VIEWS', 'false').lower() == 'true'
+
+# Asynchronous order placement (POST /orders/ with `Prefer: respond-async`, see
+# orders/worker.py): worker threads per process, and how often a placement that failed
+# because another service was unavailable is retried (backoff starts at RETRY_DELAY
+# seconds and doubles) before the order is cancelled.
+ORDER_PLACEMENT_WORKERS = int(os.environ.get('ORDER_PLACEMENT_WORKERS', 4))
+ORDER_PLACEMENT_MAX_ATTEMPTS = int(os.environ.get('ORDER_PLACEMENT_MAX_ATTEMPTS', 5))
+ORDER_PLACEMENT_RETRY_DELAY = float(os.environ.get('ORDER_PLACEMENT_RETRY_DELAY', 2.0))
+
+# Most orders accepted by one POST /orders/bulk/ (see orders/bulk.py); Product Service
+# takes at most 500 reservations per batch call.
+BULK_ORDER_MAX_BATCH = int(os.environ.get('BULK_ORDER_MAX_BATCH', 500))
+
+# Orders read, enriched and sent per batch by the streaming export, GET /orders/export/
+# (see orders/export.py); bounds its memory use.
+ORDER_EXPORT_BATCH_SIZE = int(os.environ.get('ORDER_EXPORT_BATCH_SIZE', 500))
+
+# Change feed, GET /orders/changes/ (see orders/changes.py): changes enter the feed this
+# many seconds after their updated_at, once the transactions that made them have
+# committed or failed their lock wait (DB_LOCK_TIMEOUT, plus a second for the rest of the
+# transaction); the longest ?wait= for new changes, and how often a waiting poll checks.
+ORDER_CHANGES_SETTLE = float(os.environ.get('ORDER_CHANGES_SETTLE', DB_LOCK_TIMEOUT / 1000 + 1))
+ORDER_CHANGES_MAX_WAIT = float(os.environ.get('ORDER_CHANGES_MAX_WAIT', 30.0))
+ORDER_CHANGES_POLL_INTERVAL = float(os.environ.get('ORDER_CHANGES_POLL_INTERVAL', 0.5))
+
+# Responses to requests carrying an Idempotency-Key header are replayed for
+# repeats of the same key for this many seconds (see idempotency.py).
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
 
 # OpenTelemetry Database Configuration
-import os
 os.environ.setdefault('OTEL_RESOURCE_ATTRIBUTES', 
     'service.name=order_service,'
     'service.version=1.0.0,'
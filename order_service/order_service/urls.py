@@ -15,10 +15,11 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("", include('orders.urls')),
+    path("", include('orders.async_urls' if settings.ORDER_SERVICE_ASYNC_VIEWS else 'orders.urls')),
 ]
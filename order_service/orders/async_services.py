@@ -0,0 +1,261 @@
+"""
+Non-blocking client for the other microservices, used by the async views.
+
+Mirrors ``http_client.py`` and ``services.py`` on top of ``httpx.AsyncClient``:
+each upstream gets one keep-alive connection pool per event loop, limited to
+``MAX_CONNECTIONS`` with the same timeouts and ``MAX_WAIT`` bulkhead. The
+circuit breakers, retry policies, retry budget and lookup caches are the ones
+the blocking client uses, so both kinds of views share their view of upstream
+health and cached data.
+"""
+
+import asyncio
+import functools
+import time
+import weakref
+
+import httpx
+from django.conf import settings
+
+from .cache import get_cache
+from .http_client import RETRYABLE_STATUS_CODES, get_pool, get_retry_budget, retry_policy
+from .resilience import NO_RETRY, UpstreamUnavailable
+from .services import _stock_items
+
+
+class AsyncUpstreamPool:
+    """Keep-alive ``httpx`` connection pool for a single upstream service on one event loop"""
+
+    def __init__(self, name, base_url, max_connections=10, connect_timeout=1.0, read_timeout=5.0,
+                 max_wait=0.5, breaker=None):
+        self.name = name
+        self.max_connections = max_connections
+        self.max_wait = max_wait
+        self.breaker = breaker
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip('/'),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        self._slots = asyncio.Semaphore(max_connections)
+        self._active = 0
+        self._requests = 0
+        self._bulkhead_rejections = 0
+        self._retries = 0
+
+    async def request(self, method, path, retry=NO_RETRY, **kwargs):
+        """Send a request to ``path`` on this upstream; see ``UpstreamPool.request``"""
+        budget = get_retry_budget()
+        budget.record_request()
+
+        attempt = 1
+        while True:
+            try:
+                response = await self._send(method, path, **kwargs)
+            except UpstreamUnavailable:
+                raise
+            except httpx.TransportError:
+                if attempt >= retry.max_attempts or not budget.try_acquire_retry():
+                    raise
+            else:
+                if (response.status_code not in RETRYABLE_STATUS_CODES
+                        or attempt >= retry.max_attempts or not budget.try_acquire_retry()):
+                    return response
+            await asyncio.sleep(retry.delay(attempt))
+            attempt += 1
+            self._retries += 1
+
+    async def _send(self, method, path, **kwargs):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._bulkhead_rejections += 1
+            raise UpstreamUnavailable(f'No free connection to {self.name} within {self.max_wait}s')
+        try:
+            self.breaker.before_call()
+        except UpstreamUnavailable:
+            self._slots.release()
+            raise
+        self._active += 1
+        self._requests += 1
+
+        success = False
+        call_started = time.monotonic()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            success = response.status_code < 500
+            return response
+        finally:
+            self.breaker.record(success, time.monotonic() - call_started)
+            self._active -= 1
+            self._slots.release()
+
+    async def get(self, path, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request('POST', path, **kwargs)
+
+    def stats(self):
+        return {
+            'max_connections': self.max_connections,
+            'active_connections': self._active,
+            'requests': self._requests,
+            'bulkhead_rejections': self._bulkhead_rejections,
+            'retries': self._retries,
+        }
+
+
+# Connections and semaphores belong to the event loop they were created on
+_async_pools = weakref.WeakKeyDictionary()  # loop -> {name: AsyncUpstreamPool}
+
+
+def get_async_pool(name):
+    """Return the pool for upstream ``name`` on the running event loop, creating it on first use"""
+    pools = _async_pools.setdefault(asyncio.get_running_loop(), {})
+    pool = pools.get(name)
+    if pool is None:
+        config = settings.UPSTREAM_SERVICES[name]
+        pool = pools[name] = AsyncUpstreamPool(
+            name,
+            config['URL'],
+            max_connections=config.get('MAX_CONNECTIONS', 10),
+            connect_timeout=config.get('CONNECT_TIMEOUT', 1.0),
+            read_timeout=config.get('READ_TIMEOUT', 5.0),
+            max_wait=config.get('MAX_WAIT', 0.5),
+            breaker=get_pool(name).breaker,
+        )
+    return pool
+
+
+def async_pool_stats():
+    """Stats for the async pools of every event loop, summed per upstream"""
+    totals = {}
+    for pools in list(_async_pools.values()):
+        for name, pool in list(pools.items()):
+            stats = totals.setdefault(name, {})
+            for key, value in pool.stats().items():
+                stats[key] = stats.get(key, 0) + value
+    return totals
+
+
+async def _fetch_one(upstream, path, key, retry=NO_RETRY):
+    try:
+        response = await get_async_pool(upstream).get(path, retry=retry)
+        if response.status_code == 200:
+            return {key: response.json()}
+        if response.status_code == 404:
+            return {}
+        return None
+    except (httpx.HTTPError, UpstreamUnavailable):
+        return None
+
+
+async def _fetch_many(upstream, path, ids, key_of, retry=NO_RETRY):
+    try:
+        response = await get_async_pool(upstream).get(
+            path,
+            params={"ids": ",".join(str(entity_id) for entity_id in sorted(ids))},
+            retry=retry,
+        )
+        if response.status_code == 200:
+            return {key_of(entity): entity for entity in response.json()}
+        return None
+    except (httpx.HTTPError, UpstreamUnavailable):
+        return None
+
+
+async def _fetch_users(user_ids, method):
+    retry = retry_policy(method)
+    if len(user_ids) == 1:
+        return await _fetch_one('user', f"/api/user/{user_ids[0]}/", user_ids[0], retry)
+    return await _fetch_many('user', "/api/users/batch/", user_ids, lambda profile: profile['user']['id'], retry)
+
+
+async def _fetch_products(product_ids, method):
+    retry = retry_policy(method)
+    if len(product_ids) == 1:
+        return await _fetch_one('product', f"/api/product/{product_ids[0]}/", product_ids[0], retry)
+    return await _fetch_many('product', "/api/products/batch/", product_ids, lambda product: product['id'], retry)
+
+
+class AsyncExternalServiceClient:
+    """Async counterpart of ``ExternalServiceClient``, with the same methods and results"""
+
+    @staticmethod
+    async def get_user_info(user_id):
+        """Get user information from User Service"""
+        users = await get_cache('user').aget_many([user_id], functools.partial(_fetch_users, method='get_user_info'))
+        return users.get(user_id)
+
+    @staticmethod
+    async def get_users_info(user_ids):
+        """Get information for several users from User Service in one call"""
+        return await get_cache('user').aget_many(
+            set(user_ids), functools.partial(_fetch_users, method='get_users_info')
+        )
+
+    @staticmethod
+    async def get_products_info(product_ids):
+        """Get information for several products from Product Service in one call"""
+        return await get_cache('product').aget_many(
+            set(product_ids), functools.partial(_fetch_products, method='get_products_info')
+        )
+
+    @staticmethod
+    async def reserve_stock(items, reservation_id=None, ttl=None, idempotency_key=None):
+        """Take stock for all order items in Product Service, all-or-nothing"""
+        payload = {"items": _stock_items(items)}
+        if reservation_id is not None:
+            payload["reservation_id"] = reservation_id
+        if ttl is not None:
+            payload["ttl"] = ttl
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        safe_to_repeat = reservation_id is not None or idempotency_key
+        try:
+            response = await get_async_pool('product').post(
+                "/api/reserve-stock/",
+                json=payload,
+                headers=headers,
+                retry=retry_policy('reserve_stock') if safe_to_repeat else NO_RETRY,
+            )
+            if response.status_code in (200, 400, 409):
+                return response.json()
+            return None
+        except (httpx.HTTPError, UpstreamUnavailable):
+            return None
+
+    @staticmethod
+    async def confirm_reservation(reservation_id):
+        """Make a stock hold permanent in Product Service"""
+        try:
+            response = await get_async_pool('product').post(
+                "/api/confirm-reservation/",
+                json={"reservation_id": reservation_id},
+                retry=retry_policy('confirm_reservation'),
+            )
+            return response.status_code == 200
+        except (httpx.HTTPError, UpstreamUnavailable):
+            return False
+
+    @staticmethod
+    async def release_stock(items=None, reservation_id=None, idempotency_key=None):
+        """Put stock back in Product Service, either for ``items`` or for a whole reservation"""
+        if reservation_id is not None:
+            payload = {"reservation_id": reservation_id}
+        else:
+            payload = {"items": _stock_items(items)}
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        safe_to_repeat = reservation_id is not None or idempotency_key
+        try:
+            response = await get_async_pool('product').post(
+                "/api/release-stock/",
+                json=payload,
+                headers=headers,
+                retry=retry_policy('release_stock') if safe_to_repeat else NO_RETRY,
+            )
+            if reservation_id is not None and response.status_code == 404:
+                return True
+            return response.status_code == 200
+        except (httpx.HTTPError, UpstreamUnavailable):
+            return False
@@ -0,0 +1,261 @@
+"""
+Async (ASGI-native) versions of the order views.
+
+Same URLs, request and response formats as ``views.py``, but the calls to the
+other services are awaited on the event loop through
+``AsyncExternalServiceClient``, so under an ASGI server a single worker
+process keeps serving requests while many orders wait on upstreams. Database
+work runs through ``sync_to_async``. Enabled with
+``ORDER_SERVICE_ASYNC_VIEWS=true`` (see ``async_urls.py``).
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import views
+from .async_services import AsyncExternalServiceClient
+from .changes import await_changes, parse_wait
+from .enrichment import aenrich_orders, mark_degraded
+from .export import aiterate, export_stream
+from .http_client import upstream_available
+from .idempotency import aidempotent
+from .models import Order
+from .pagination import ChangeFeedPagination, KeysetPagination
+from .rollups import change_status
+from .saga import OrderPlacementError, aplace_order, new_reservation_id
+from .serializers import OrderCreateSerializer, OrderSerializer
+from .worker import store_pending_order
+
+
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    """Render ``data`` the way DRF's Response would"""
+    return HttpResponse(JSONRenderer().render(data), status=status, headers=headers,
+                        content_type='application/json')
+
+
+def api_endpoint(view):
+    """Exempt ``view`` from CSRF checks, as DRF's views are; ``csrf_exempt`` would make it sync"""
+    view.csrf_exempt = True
+    return view
+
+
+class AsyncAPIView(View):
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return api_endpoint(super().as_view(**initkwargs))
+
+
+@sync_to_async
+def _serialize_orders(queryset):
+    return OrderSerializer(queryset, many=True).data
+
+
+@sync_to_async
+def _get_order(**lookup):
+    return Order.objects.prefetch_related('items').filter(**lookup).first()
+
+
+@sync_to_async
+def _call_sync_view(view, request, **kwargs):
+    response = view(request, **kwargs)
+    response.render()
+    return response
+
+
+class OrderListCreateView(AsyncAPIView):
+    """Async ``GET/POST /orders/``"""
+
+    async def get(self, request):
+        paginator = KeysetPagination()
+        drf_request = Request(request)
+        user_id = drf_request.query_params.get('user_id')
+
+        def load_page():
+            queryset = Order.objects.prefetch_related('items')
+            if user_id:
+                queryset = queryset.filter(user_id=user_id)
+            page = paginator.paginate_queryset(queryset, drf_request, view=self)
+            return OrderSerializer(page, many=True).data, paginator.get_next_link()
+
+        try:
+            orders_data, next_link = await sync_to_async(load_page)()
+        except NotFound as e:
+            return json_response({'detail': str(e.detail)}, status=status.HTTP_404_NOT_FOUND)
+
+        # Enrich the page of orders with user and product information
+        degraded = await aenrich_orders(orders_data)
+        return mark_degraded(json_response({'next': next_link, 'results': orders_data}), degraded)
+
+    async def post(self, request):
+        # Parsed as DRF would, before aidempotent hashes the body
+        drf_request = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+        try:
+            await sync_to_async(getattr)(drf_request, 'data')
+        except APIException as e:
+            return json_response({'detail': str(e.detail)}, status=e.status_code)
+        return await self.create(request, drf_request)
+
+    @aidempotent('orders-create')
+    async def create(self, request, drf_request):
+        serializer = OrderCreateSerializer(data=drf_request.data)
+        if not await sync_to_async(serializer.is_valid)():
+            return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # The Idempotency-Key header also becomes the order's stock reservation ID, so
+        # a retry finds the order it already created
+        reservation_id = request.headers.get('Idempotency-Key') or new_reservation_id()
+        if len(reservation_id) > 64:
+            return json_response({'error': 'Idempotency-Key must be at most 64 characters'},
+                                 status=status.HTTP_400_BAD_REQUEST)
+        existing = await _get_order(reservation_id=reservation_id)
+        if existing is not None:
+            order_data = await _serialize_orders([existing])
+            return mark_degraded(json_response(order_data[0]), await aenrich_orders(order_data))
+
+        if views.prefers_async(request):
+            order = await sync_to_async(store_pending_order)(serializer, reservation_id)
+            status_url = request.build_absolute_uri(reverse('order-status', args=[order.id]))
+            return json_response(
+                {'id': order.id, 'status': order.status, 'status_url': status_url},
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Location': status_url, 'Preference-Applied': 'respond-async'},
+            )
+
+        # Validate user exists
+        user_info = await AsyncExternalServiceClient.get_user_info(serializer.validated_data['user_id'])
+        if not user_info:
+            if not upstream_available('user'):
+                return json_response({'error': 'User service unavailable'},
+                                     status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            return json_response({'error': 'User not found'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Hold stock, commit the order, confirm the hold (compensating on failure)
+        try:
+            order, _ = await aplace_order(serializer, reservation_id)
+        except OrderPlacementError as e:
+            return json_response({'error': str(e)}, status=e.status_code)
+
+        # Return created order enriched with user info (product names are stored on the items)
+        order = await _get_order(pk=order.pk)
+        order_data = await _serialize_orders([order])
+        degraded = await aenrich_orders(order_data, users={order.user_id: user_info})
+        return mark_degraded(json_response(order_data[0], status=status.HTTP_201_CREATED), degraded)
+
+
+class OrderDetailView(AsyncAPIView):
+    """Async ``GET /orders/{id}/``; updates and deletes are handed to the sync view"""
+
+    sync_view = staticmethod(views.OrderDetailView.as_view())
+
+    async def get(self, request, pk):
+        order = await _get_order(pk=pk)
+        if order is None:
+            return json_response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        order_data = await _serialize_orders([order])
+
+        # Enrich with user info and product names
+        degraded = await aenrich_orders(order_data)
+        return mark_degraded(json_response(order_data[0]), degraded)
+
+    async def put(self, request, pk):
+        return await _call_sync_view(self.sync_view, request, pk=pk)
+
+    async def patch(self, request, pk):
+        return await _call_sync_view(self.sync_view, request, pk=pk)
+
+    async def delete(self, request, pk):
+        return await _call_sync_view(self.sync_view, request, pk=pk)
+
+
+async def _release_order_stock(order, items):
+    """Async :func:`views.release_order_stock`, with the order's items read beforehand"""
+    if order.reservation_id:
+        return await AsyncExternalServiceClient.release_stock(reservation_id=order.reservation_id)
+    return not items or await AsyncExternalServiceClient.release_stock(
+        items, idempotency_key=f'order-{order.id}-cancel'
+    )
+
+
+@api_endpoint
+async def cancel_order(request, order_id):
+    """Cancel an order and restore stock"""
+    if request.method != 'POST':
+        return json_response({'detail': f'Method "{request.method}" not allowed.'},
+                             status=status.HTTP_405_METHOD_NOT_ALLOWED, headers={'Allow': 'POST, OPTIONS'})
+
+    order = await _get_order(id=order_id)
+    if order is None:
+        return json_response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+    if order.status in ['delivered', 'cancelled']:
+        return json_response({'error': 'Cannot cancel order with status: ' + order.status},
+                             status=status.HTTP_400_BAD_REQUEST)
+
+    items = [{'product_id': item.product_id, 'quantity': item.quantity} for item in order.items.all()]
+    for _ in range(views.CANCEL_ATTEMPTS):
+        if not await _release_order_stock(order, items):
+            return json_response({'error': 'Could not restore stock, order was not cancelled'},
+                                 status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        # Only if its status is still the one read before the release (see views.cancel_order)
+        if await sync_to_async(change_status)(Order.objects.filter(pk=order.pk, status=order.status), 'cancelled'):
+            break
+        await order.arefresh_from_db()
+        if order.status == 'cancelled':
+            break
+        if order.status == 'delivered':
+            return json_response({'error': 'Cannot cancel order with status: delivered'},
+                                 status=status.HTTP_400_BAD_REQUEST)
+    else:
+        return json_response({'error': 'Order changed while it was being cancelled, try again'},
+                             status=status.HTTP_409_CONFLICT)
+    await order.arefresh_from_db()
+    order_data = await _serialize_orders([order])
+    return json_response(order_data[0])
+
+
+@api_endpoint
+async def export_orders(request):
+    """Stream every order as NDJSON or CSV, for analytics jobs (see export.py)"""
+    if request.method != 'GET':
+        return json_response({'detail': f'Method "{request.method}" not allowed.'},
+                             status=status.HTTP_405_METHOD_NOT_ALLOWED, headers={'Allow': 'GET'})
+
+    try:
+        chunks, content_type = export_stream(request.GET)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return StreamingHttpResponse(aiterate(chunks), content_type=content_type)
+
+
+@api_endpoint
+async def order_changes(request):
+    """Async ``GET /orders/changes/``: a waiting poll holds no thread (see changes.py)"""
+    if request.method != 'GET':
+        return json_response({'detail': f'Method "{request.method}" not allowed.'},
+                             status=status.HTTP_405_METHOD_NOT_ALLOWED, headers={'Allow': 'GET'})
+
+    drf_request = Request(request)
+    try:
+        wait = parse_wait(drf_request.query_params.get('wait'))
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = ChangeFeedPagination()
+    try:
+        orders_data = await await_changes(paginator, drf_request, wait)
+    except NotFound as e:
+        return json_response({'detail': str(e.detail)}, status=status.HTTP_404_NOT_FOUND)
+
+    degraded = await aenrich_orders(orders_data)
+    return mark_degraded(json_response({
+        'next': paginator.get_next_link(),
+        'has_more': paginator.has_next,
+        'results': orders_data,
+    }), degraded)
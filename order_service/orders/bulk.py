@@ -0,0 +1,190 @@
+"""
+Bulk order placement for ``POST /orders/bulk/``.
+
+Runs the order placement saga (see saga.py) for a whole batch of orders at
+once, so the number of upstream calls and database round trips depends on
+the batch, not on how many orders it holds:
+
+1. Validate every order and look up all their users in one batched call
+2. Hold the stock for every order in one call, each hold all-or-nothing
+3. Insert the orders (``pending``) and their items with one ``bulk_create`` each
+4. Confirm all holds in one call and mark those orders ``confirmed``
+
+Each order succeeds or fails on its own, with the HTTP status it would have
+had from ``POST /orders/``. Holds of orders that fail after step 2 are given
+back in one call. An order may carry an ``idempotency_key``, used as its
+reservation ID like the Idempotency-Key header of ``POST /orders/``, so
+retrying a batch returns the orders already placed instead of placing them
+again.
+"""
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .enrichment import enrich_orders
+from .models import Order, OrderItem
+from .rollups import change_status, record
+from .saga import copy_reserved, new_reservation_id
+from .serializers import OrderCreateSerializer, OrderSerializer
+from .services import ExternalServiceClient
+
+
+UNCONFIRMED = 'Could not confirm stock reservation, order was cancelled'
+
+
+def _failure(index, status_code, error):
+    return {'index': index, 'status': status_code, 'error': error}
+
+
+def _idempotency_key(raw_order):
+    key = raw_order.get('idempotency_key') if isinstance(raw_order, dict) else None
+    if key is not None and (not isinstance(key, str) or not 0 < len(key) <= 64):
+        raise ValueError('idempotency_key must be a string of at most 64 characters')
+    return key
+
+
+def _validate(raw_orders, results):
+    """Returns ``{reservation_id: (index, validated_data)}`` for the valid orders"""
+    orders = {}
+    for index, raw_order in enumerate(raw_orders):
+        try:
+            reservation_id = _idempotency_key(raw_order) or new_reservation_id()
+        except ValueError as e:
+            results[index] = _failure(index, 400, str(e))
+            continue
+        serializer = OrderCreateSerializer(data=raw_order)
+        if not serializer.is_valid():
+            results[index] = {'index': index, 'status': 400, 'errors': serializer.errors}
+        elif reservation_id in orders:
+            results[index] = _failure(index, 400, 'idempotency_key is repeated in the batch')
+        else:
+            orders[reservation_id] = (index, serializer.validated_data)
+    return orders
+
+
+def _new_order(reservation_id, data):
+    fields = {name: value for name, value in data.items() if name != 'items'}
+    total_amount = sum(item['quantity'] * item['price'] for item in data['items'])
+    return Order(reservation_id=reservation_id, total_amount=total_amount, **fields)
+
+
+def _insert(orders):
+    """Step 3: insert all orders and their items; returns ``{reservation_id: order}``"""
+    new_orders = [_new_order(reservation_id, data) for reservation_id, (_, data) in orders.items()]
+    with transaction.atomic():
+        Order.objects.bulk_create(new_orders)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, **item)
+            for order in new_orders
+            for item in orders[order.reservation_id][1]['items']
+        ])
+        record(added=new_orders, items={})  # New orders are pending: only their status counts
+    return {order.reservation_id: order for order in new_orders}
+
+
+def _insert_one_by_one(orders, results, placed):
+    """Step 3 when the batch insert collided with a concurrent retry of some of its orders"""
+    created = {}
+    for reservation_id, (index, data) in orders.items():
+        try:
+            with transaction.atomic():
+                order = _new_order(reservation_id, data)
+                order.save()
+                OrderItem.objects.bulk_create([OrderItem(order=order, **item) for item in data['items']])
+                record(added=[order], items={})
+            created[reservation_id] = order
+        except IntegrityError:
+            # The concurrent retry owns the hold, so it must not be released here
+            existing = Order.objects.filter(reservation_id=reservation_id).first()
+            if existing is not None:
+                placed[index] = (200, existing.pk)
+            else:
+                ExternalServiceClient.release_reservations([reservation_id])
+                results[index] = _failure(index, 500, 'Could not save order')
+    return created
+
+
+def place_orders(raw_orders):
+    """Place every order of ``raw_orders`` (payloads as for ``POST /orders/``).
+
+    Returns ``(results, degraded)``: one result per order, in order, with its
+    ``index``, HTTP ``status`` and either the ``order`` or the ``error``; and
+    the enrichment sources that were unavailable (see ``enrich_orders``).
+    """
+    results = [None] * len(raw_orders)
+    placed = {}  # index -> (status, order ID)
+    orders = _validate(raw_orders, results)
+
+    # Orders placed by an earlier attempt at the same batch
+    for order_id, reservation_id in Order.objects.filter(reservation_id__in=list(orders)).values_list(
+            'id', 'reservation_id'):
+        index, _ = orders.pop(reservation_id)
+        placed[index] = (200, order_id)
+
+    # 1. Validate the users
+    users = ExternalServiceClient.get_users_info(data['user_id'] for _, data in orders.values()) if orders else {}
+    for reservation_id, (index, data) in list(orders.items()):
+        if data['user_id'] in users:
+            continue
+        del orders[reservation_id]
+        if data['user_id'] in users.failed:
+            results[index] = _failure(index, 503, 'User service unavailable')
+        else:
+            results[index] = _failure(index, 400, 'User not found')
+
+    # 2. Hold the stock
+    holds = ExternalServiceClient.reserve_stock_batch(
+        {reservation_id: data['items'] for reservation_id, (_, data) in orders.items()},
+        ttl=settings.STOCK_RESERVATION_TTL,
+    ) if orders else {}
+    for reservation_id, (index, data) in list(orders.items()):
+        hold = holds.get(reservation_id) if holds is not None else None
+        if hold is None or not hold.get('success'):
+            del orders[reservation_id]
+            if hold is None:
+                results[index] = _failure(index, 503, 'Product service unavailable')
+            else:
+                results[index] = _failure(index, 400, hold.get('error', 'Insufficient stock'))
+            continue
+        reserved = {item['product_id']: item for item in hold['items']}
+        for item in data['items']:
+            copy_reserved(item, reserved)
+
+    # 3. Insert the orders
+    created = {}
+    if orders:
+        try:
+            created = _insert(orders)
+        except IntegrityError:
+            created = _insert_one_by_one(orders, results, placed)
+        except Exception as e:
+            ExternalServiceClient.release_reservations(list(orders))
+            for index, _ in orders.values():
+                results[index] = _failure(index, 500, str(e) or 'Could not save order')
+
+    # 4. Confirm the holds
+    if created:
+        confirmed = ExternalServiceClient.confirm_reservations(list(created))
+        unconfirmed = [reservation_id for reservation_id in created if reservation_id not in confirmed]
+        if unconfirmed:
+            ExternalServiceClient.release_reservations(unconfirmed)
+            change_status(Order.objects.filter(reservation_id__in=unconfirmed), 'cancelled',
+                          failure_reason=UNCONFIRMED)
+        # Conditional, so an order cancelled in the meantime stays cancelled
+        change_status(Order.objects.filter(reservation_id__in=confirmed, status='pending'), 'confirmed')
+        for reservation_id, order in created.items():
+            index, _ = orders[reservation_id]
+            if reservation_id in confirmed:
+                placed[index] = (201, order.pk)
+            else:
+                results[index] = _failure(index, 503, UNCONFIRMED)
+
+    # Serialize all placed orders together, with the users already looked up
+    degraded = []
+    if placed:
+        by_id = Order.objects.prefetch_related('items').in_bulk([order_id for _, order_id in placed.values()])
+        orders_data = OrderSerializer([by_id[order_id] for _, order_id in placed.values()], many=True).data
+        degraded = enrich_orders(orders_data, users=users)
+        for (index, (status_code, _)), order_data in zip(placed.items(), orders_data):
+            results[index] = {'index': index, 'status': status_code, 'order': order_data}
+    return results, degraded
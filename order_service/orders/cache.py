@@ -0,0 +1,271 @@
+"""
+In-process cache for user and product lookups made by the order service.
+
+Entries expire after a per-entity TTL and the least recently used entry is
+evicted once the cache is full. Lookups that came back "not found" are cached
+too (for a shorter TTL), and concurrent misses for the same key share a single
+upstream call. Expired entries are kept until evicted so that they can be
+served (stale) while the upstream is failing or its circuit breaker is open.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+# Stored for keys the upstream reported as not found (negative caching)
+NOT_FOUND = object()
+
+
+class CacheResult(dict):
+    """Values found by :meth:`TTLCache.get_many`, plus the keys that could not be loaded
+
+    ``stale`` holds keys served from an expired entry because the upstream
+    call failed, ``failed`` the keys for which there was nothing to serve.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.stale = set()
+        self.failed = set()
+
+    @property
+    def complete(self):
+        return not self.stale and not self.failed
+
+
+class _Load:
+    """A load in progress: threads block on it, coroutines await it"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def set(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def wait(self, timeout):
+        return self._event.wait(timeout)
+
+    async def wait_async(self, timeout):
+        # Parking on event.wait in an executor would tie up the threads the loader
+        # itself may need (e.g. for DNS lookups), so be woken up on the loop instead
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        def wake():
+            if not done.done():
+                done.set_result(None)
+
+        def notify():
+            try:
+                loop.call_soon_threadsafe(wake)
+            except RuntimeError:  # the loop has been closed meanwhile
+                pass
+
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._callbacks.append(notify)
+        try:
+            await asyncio.wait_for(done, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class TTLCache:
+    """Bounded TTL + LRU cache with single-flight loading of missing keys"""
+
+    def __init__(self, name, max_entries=10000, ttl=60.0, negative_ttl=5.0, wait_timeout=10.0):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.wait_timeout = wait_timeout
+
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._inflight = {}  # key -> _Load set when its load finishes
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._coalesced = 0
+        self._stale_hits = 0
+        self._loads = 0
+        self._load_failures = 0
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= now:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, value, now):
+        ttl = self.negative_ttl if value is NOT_FOUND else self.ttl
+        self._entries[key] = (value, now + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def get_many(self, keys, loader):
+        """Return a :class:`CacheResult` for the cached or freshly loaded ``keys``.
+
+        ``loader(missing_keys)`` is called at most once with the keys that are
+        neither cached nor already being loaded by another thread. It returns
+        a dict of found values, omitting keys that do not exist upstream, or
+        ``None`` if the upstream call failed; expired values are then served
+        for keys that have one. Keys that are not found are left out.
+        """
+        results, to_load, waiting = self._begin(keys)
+        if to_load:
+            loaded = None
+            try:
+                loaded = loader(to_load)
+            finally:
+                self._finish(to_load, loaded, results)
+        for key, load in waiting.items():
+            load.wait(self.wait_timeout)
+            self._collect(key, results)
+        return results
+
+    async def aget_many(self, keys, loader):
+        """Async variant of :meth:`get_many`; ``loader`` is a coroutine function"""
+        results, to_load, waiting = self._begin(keys)
+        if to_load:
+            loaded = None
+            try:
+                loaded = await loader(to_load)
+            finally:
+                self._finish(to_load, loaded, results)
+        for key, load in waiting.items():
+            await load.wait_async(self.wait_timeout)
+            self._collect(key, results)
+        return results
+
+    def _begin(self, keys):
+        """Split ``keys`` into cached results, keys to load and keys being loaded elsewhere"""
+        results = CacheResult()
+        to_load = []
+        waiting = {}
+
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                entry = self._lookup(key, now)
+                if entry is not None:
+                    self._hits += 1
+                    if entry[0] is not NOT_FOUND:
+                        results[key] = entry[0]
+                    continue
+
+                self._misses += 1
+                load = self._inflight.get(key)
+                if load is not None:
+                    self._coalesced += 1
+                    waiting[key] = load
+                else:
+                    self._inflight[key] = _Load()
+                    to_load.append(key)
+        return results, to_load, waiting
+
+    def _finish(self, to_load, loaded, results):
+        """Store what the loader returned (``None`` on failure) and wake up waiters"""
+        with self._lock:
+            self._loads += 1
+            now = time.monotonic()
+            if loaded is None:
+                self._load_failures += 1
+                for key in to_load:
+                    entry = self._entries.get(key)
+                    if entry is not None and entry[0] is not NOT_FOUND:
+                        self._stale_hits += 1
+                        results[key] = entry[0]
+                        results.stale.add(key)
+                    elif entry is None:
+                        results.failed.add(key)
+            else:
+                for key in to_load:
+                    self._store(key, loaded.get(key, NOT_FOUND), now)
+            for key in to_load:
+                self._inflight.pop(key).set()
+        if loaded:
+            results.update((key, loaded[key]) for key in to_load if key in loaded)
+
+    def _collect(self, key, results):
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+        if entry is None:
+            results.failed.add(key)
+        elif entry[0] is not NOT_FOUND:
+            results[key] = entry[0]
+
+    def get(self, key, loader):
+        """Single-key variant of :meth:`get_many`; returns ``None`` when not found"""
+        return self.get_many([key], loader).get(key)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'coalesced': self._coalesced,
+                'stale_hits': self._stale_hits,
+                'loads': self._loads,
+                'load_failures': self._load_failures,
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name):
+    """Return the shared cache for entity ``name``, creating it on first use"""
+    cache = _caches.get(name)
+    if cache is not None:
+        return cache
+
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            config = settings.ENTITY_CACHES[name]
+            cache = TTLCache(
+                name,
+                max_entries=config.get('MAX_ENTRIES', 10000),
+                ttl=config.get('TTL', 60.0),
+                negative_ttl=config.get('NEGATIVE_TTL', 5.0),
+            )
+            _caches[name] = cache
+        return cache
+
+
+def cache_stats():
+    """Stats for every entity cache created so far"""
+    return {name: cache.stats() for name, cache in list(_caches.items())}
+
+
+def reset_caches():
+    """Forget all caches (used when settings change, e.g. in tests)"""
+    with _caches_lock:
+        _caches.clear()
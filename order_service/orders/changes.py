@@ -0,0 +1,85 @@
+"""
+Change feed of orders for downstream systems: ``GET /orders/changes/``.
+
+Instead of polling ``GET /orders/`` and diffing every page, a consumer keeps
+the ``next`` link of its last response and fetches only the orders created
+or updated after that cursor, in ``(updated_at, id)`` order. That key is
+indexed, so a poll costs the same however large the table grows, and a poll
+with no changes reads no rows. Every write to an order sets ``updated_at``:
+``save()`` through ``auto_now`` and queryset updates explicitly (see
+``rollups.change_status``).
+
+With ``?wait=<seconds>`` (at most ``ORDER_CHANGES_MAX_WAIT``), a poll that
+finds no changes checks again every ``ORDER_CHANGES_POLL_INTERVAL`` seconds
+and returns as soon as there are some, or empty when the wait is over. Under
+the sync views each waiting poll holds a worker thread; the async views
+(``ORDER_SERVICE_ASYNC_VIEWS``) wait on the event loop instead.
+
+``updated_at`` is stamped before a write waits for its lock, and the write
+only becomes visible when its transaction commits, possibly after a later
+write was already read. A cursor that moved past it would then never return
+it, so changes enter the feed ``ORDER_CHANGES_SETTLE`` seconds after their
+``updated_at``. It defaults to ``DB_LOCK_TIMEOUT`` plus a second: a write
+that cannot get its lock by then fails instead of committing late, and the
+order service's transactions are short. Transactions that wait for several
+locks in turn, or keep working for longer after stamping a row, need a
+larger setting. Deleted orders do not appear in the feed.
+"""
+
+import asyncio
+import math
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Order
+from .serializers import OrderSerializer
+
+
+def parse_wait(raw_wait):
+    """``?wait=`` as seconds, capped at ORDER_CHANGES_MAX_WAIT; raises ValueError"""
+    if not raw_wait:
+        return 0.0
+    try:
+        wait = float(raw_wait)
+    except ValueError:
+        wait = math.nan
+    if not wait >= 0:
+        raise ValueError('wait must be a non-negative number of seconds')
+    return min(wait, settings.ORDER_CHANGES_MAX_WAIT)
+
+
+def changes_queryset():
+    """Orders whose last change has settled (see module docstring)"""
+    settled = timezone.now() - timedelta(seconds=settings.ORDER_CHANGES_SETTLE)
+    return Order.objects.prefetch_related('items').filter(updated_at__lte=settled)
+
+
+def read_changes(paginator, request):
+    """The serialized page of changes after the cursor of ``request``"""
+    return OrderSerializer(paginator.paginate_queryset(changes_queryset(), request), many=True).data
+
+
+def wait_for_changes(paginator, request, wait):
+    """``read_changes``, polling for up to ``wait`` seconds until the page is not empty"""
+    deadline = time.monotonic() + wait
+    while True:
+        orders_data = read_changes(paginator, request)
+        remaining = deadline - time.monotonic()
+        if orders_data or remaining <= 0:
+            return orders_data
+        time.sleep(min(settings.ORDER_CHANGES_POLL_INTERVAL, remaining))
+
+
+async def await_changes(paginator, request, wait):
+    """``wait_for_changes`` for the async views: sleeps without holding a thread"""
+    deadline = time.monotonic() + wait
+    while True:
+        orders_data = await sync_to_async(read_changes)(paginator, request)
+        remaining = deadline - time.monotonic()
+        if orders_data or remaining <= 0:
+            return orders_data
+        await asyncio.sleep(min(settings.ORDER_CHANGES_POLL_INTERVAL, remaining))
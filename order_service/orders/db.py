@@ -0,0 +1,14 @@
+"""
+Per-connection database settings.
+"""
+
+from django.conf import settings
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply ``settings.SQLITE_PRAGMAS`` to a newly opened SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
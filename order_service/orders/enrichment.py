@@ -0,0 +1,172 @@
+"""
+Enrichment of serialized orders with data owned by the other services.
+
+Users and products are read from the local read model first (see
+``read_model.py``). Any left over are looked up in the other services,
+concurrently on a shared thread pool and bounded by a per-request deadline.
+Lookups that miss the deadline are left out and reported as degraded instead
+of blocking the response.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .async_services import AsyncExternalServiceClient
+from .http_client import upstream_available
+from .read_model import products_from_read_model, users_from_read_model
+from .services import ExternalServiceClient
+
+
+DEGRADED_HEADER = 'X-Enrichment-Degraded'
+
+UPSTREAMS = {'users': 'user', 'products': 'product'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.ENRICHMENT_MAX_WORKERS,
+                    thread_name_prefix='order-enrichment',
+                )
+    return _executor
+
+
+def _lookups_needed(orders_data, users, products):
+    """Fill ``users``/``products`` from the read model; returns the IDs still missing"""
+    missing_user_ids = {order_data['user_id'] for order_data in orders_data} - set(users)
+    # Items store the product name they were ordered under; only older items need a lookup
+    missing_product_ids = {
+        item['product_id']
+        for order_data in orders_data for item in order_data.get('items', [])
+        if not item.get('product_name')
+    } - set(products)
+
+    if settings.ENRICHMENT_READ_MODEL:
+        if missing_user_ids:
+            users.update(users_from_read_model(missing_user_ids))
+            missing_user_ids -= set(users)
+        if missing_product_ids:
+            products.update(products_from_read_model(missing_product_ids))
+            missing_product_ids -= set(products)
+    return missing_user_ids, missing_product_ids
+
+
+def _attach(orders_data, users, products):
+    for order_data in orders_data:
+        order_data['user_info'] = users.get(order_data['user_id'])
+        for item in order_data.get('items', []):
+            if item.get('product_name'):
+                continue
+            product_info = products.get(item['product_id'])
+            if product_info:
+                item['product_name'] = product_info.get('name', 'Unknown Product')
+
+
+def enrich_orders(orders_data, users=None, products=None, deadline=None):
+    """Attach user info, and product names for items that lack one, to serialized orders in place.
+
+    IDs missing from the read model are fetched with one batched call per
+    upstream service for the whole page of orders, with both calls in flight
+    at the same time. ``users`` and ``products`` may carry already known info
+    keyed by ID. ``deadline`` is in seconds and defaults to
+    ``settings.ENRICHMENT_DEADLINE``.
+
+    Returns the list of sources ('users', 'products') whose data could not be
+    fetched in time or was unavailable (failed call or open circuit breaker,
+    in which case previously cached data is used where there is any); an
+    empty list means the response is complete.
+    """
+    if deadline is None:
+        deadline = settings.ENRICHMENT_DEADLINE
+    started = time.monotonic()
+
+    users = dict(users or {})
+    products = dict(products or {})
+    missing_user_ids, missing_product_ids = _lookups_needed(orders_data, users, products)
+
+    executor = _get_executor()
+    futures = {}
+    if missing_user_ids:
+        futures['users'] = executor.submit(ExternalServiceClient.get_users_info, missing_user_ids)
+    if missing_product_ids:
+        futures['products'] = executor.submit(ExternalServiceClient.get_products_info, missing_product_ids)
+
+    wait(futures.values(), timeout=max(deadline - (time.monotonic() - started), 0))
+
+    degraded = []
+    results = {}
+    for source, future in futures.items():
+        if future.done() and future.exception() is None:
+            results[source] = future.result()
+            if results[source].complete and upstream_available(UPSTREAMS[source]):
+                continue
+        degraded.append(source)
+
+    users.update(results.get('users', {}))
+    products.update(results.get('products', {}))
+    _attach(orders_data, users, products)
+    return degraded
+
+
+async def aenrich_orders(orders_data, users=None, products=None, deadline=None):
+    """Async variant of :func:`enrich_orders`, for the async views.
+
+    The upstream lookups run as tasks on the event loop instead of on the
+    shared thread pool.
+    """
+    if deadline is None:
+        deadline = settings.ENRICHMENT_DEADLINE
+    started = time.monotonic()
+
+    users = dict(users or {})
+    products = dict(products or {})
+    missing_user_ids, missing_product_ids = await sync_to_async(_lookups_needed)(orders_data, users, products)
+
+    tasks = {}
+    if missing_user_ids:
+        tasks['users'] = asyncio.ensure_future(AsyncExternalServiceClient.get_users_info(missing_user_ids))
+    if missing_product_ids:
+        tasks['products'] = asyncio.ensure_future(AsyncExternalServiceClient.get_products_info(missing_product_ids))
+
+    if tasks:
+        await asyncio.wait(tasks.values(), timeout=max(deadline - (time.monotonic() - started), 0))
+
+    degraded = []
+    results = {}
+    for source, task in tasks.items():
+        if task.done() and not task.cancelled() and task.exception() is None:
+            results[source] = task.result()
+            if results[source].complete and upstream_available(UPSTREAMS[source]):
+                continue
+        else:
+            # Let it finish in the background so the cache still gets the result
+            task.add_done_callback(_discard_result)
+        degraded.append(source)
+
+    users.update(results.get('users', {}))
+    products.update(results.get('products', {}))
+    _attach(orders_data, users, products)
+    return degraded
+
+
+def _discard_result(task):
+    if not task.cancelled():
+        task.exception()  # Mark any exception as retrieved
+
+
+def mark_degraded(response, degraded):
+    """Flag a partially enriched response with the sources that are missing"""
+    if degraded:
+        response[DEGRADED_HEADER] = ','.join(degraded)
+    return response
@@ -0,0 +1,246 @@
+"""
+Process-wide pooled HTTP sessions for calls to the other microservices.
+
+Each upstream service (see ``settings.UPSTREAM_SERVICES``) gets one
+``requests.Session`` with its own keep-alive connection pool, a hard limit on
+concurrent connections and default connect/read timeouts. The connection
+limit doubles as a bulkhead: a call that cannot get a free slot within
+``MAX_WAIT`` seconds is rejected, and every call passes through the
+upstream's circuit breaker (see ``resilience.py``).
+
+Callers may pass a ``RetryPolicy``; transient failures (connection errors,
+timeouts, 502/503/504) are then retried with jittered backoff, as long as the
+process-wide retry budget allows it.
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from .resilience import NO_RETRY, CircuitBreaker, RetryBudget, RetryPolicy, UpstreamUnavailable
+
+
+RETRYABLE_STATUS_CODES = (502, 503, 504)
+
+
+class UpstreamPool:
+    """Keep-alive connection pool for a single upstream service"""
+
+    def __init__(self, name, base_url, max_connections=10, connect_timeout=1.0, read_timeout=5.0,
+                 max_wait=0.5, breaker=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_wait = max_wait
+        self.breaker = breaker or CircuitBreaker(name)
+
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max_connections,
+            pool_block=True,
+            max_retries=0,
+        )
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        # Bounds in-flight requests to the pool size so waiting for a free
+        # connection happens here, where it can be measured.
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._requests = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._bulkhead_rejections = 0
+        self._retries = 0
+
+    def request(self, method, path, retry=NO_RETRY, **kwargs):
+        """Send a request to ``path`` on this upstream, reusing pooled connections.
+
+        Only pass a ``retry`` policy for requests that are safe to repeat.
+        Calls rejected locally (open breaker, full bulkhead) are never retried.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        budget = get_retry_budget()
+        budget.record_request()
+
+        attempt = 1
+        while True:
+            try:
+                response = self._send(method, path, **kwargs)
+            except UpstreamUnavailable:
+                raise
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= retry.max_attempts or not budget.try_acquire_retry():
+                    raise
+            else:
+                if (response.status_code not in RETRYABLE_STATUS_CODES
+                        or attempt >= retry.max_attempts or not budget.try_acquire_retry()):
+                    return response
+                response.close()
+            time.sleep(retry.delay(attempt))
+            attempt += 1
+            with self._lock:
+                self._retries += 1
+
+    def _send(self, method, path, **kwargs):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.max_wait):
+            with self._lock:
+                self._bulkhead_rejections += 1
+            raise UpstreamUnavailable(f'No free connection to {self.name} within {self.max_wait}s')
+        waited = time.monotonic() - started
+        try:
+            self.breaker.before_call()
+        except UpstreamUnavailable:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._active += 1
+            self._requests += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+        success = False
+        call_started = time.monotonic()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            success = response.status_code < 500
+            return response
+        finally:
+            self.breaker.record(success, time.monotonic() - call_started)
+            with self._lock:
+                self._active -= 1
+            self._slots.release()
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def _idle_connections(self):
+        idle = 0
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            # Unused slots in the urllib3 queue are filled with None
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return idle
+
+    def stats(self):
+        """Snapshot of pool usage, for sizing the pool under load"""
+        with self._lock:
+            requests_total = self._requests
+            return {
+                'base_url': self.base_url,
+                'max_connections': self.max_connections,
+                'active_connections': self._active,
+                'idle_connections': self._idle_connections(),
+                'requests': requests_total,
+                'wait_time_total': round(self._wait_total, 6),
+                'wait_time_avg': round(self._wait_total / requests_total, 6) if requests_total else 0.0,
+                'wait_time_max': round(self._wait_max, 6),
+                'bulkhead_rejections': self._bulkhead_rejections,
+                'retries': self._retries,
+                'circuit_breaker': self.breaker.stats(),
+            }
+
+    def close(self):
+        self.session.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name):
+    """Return the shared pool for upstream ``name``, creating it on first use"""
+    pool = _pools.get(name)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            config = settings.UPSTREAM_SERVICES[name]
+            breaker_config = {**settings.CIRCUIT_BREAKER, **config.get('CIRCUIT_BREAKER', {})}
+            pool = UpstreamPool(
+                name,
+                config['URL'],
+                max_connections=config.get('MAX_CONNECTIONS', 10),
+                connect_timeout=config.get('CONNECT_TIMEOUT', 1.0),
+                read_timeout=config.get('READ_TIMEOUT', 5.0),
+                max_wait=config.get('MAX_WAIT', 0.5),
+                breaker=CircuitBreaker(
+                    name,
+                    window_size=breaker_config['WINDOW_SIZE'],
+                    minimum_calls=breaker_config['MINIMUM_CALLS'],
+                    failure_rate=breaker_config['FAILURE_RATE'],
+                    slow_call_duration=breaker_config['SLOW_CALL_DURATION'],
+                    slow_call_rate=breaker_config['SLOW_CALL_RATE'],
+                    open_duration=breaker_config['OPEN_DURATION'],
+                ),
+            )
+            _pools[name] = pool
+        return pool
+
+
+_retry_budget = None
+
+
+def get_retry_budget():
+    """The retry budget shared by every upstream pool in this process"""
+    global _retry_budget
+    if _retry_budget is None:
+        with _pools_lock:
+            if _retry_budget is None:
+                config = settings.RETRY_BUDGET
+                _retry_budget = RetryBudget(
+                    ratio=config['RATIO'],
+                    min_per_second=config['MIN_PER_SECOND'],
+                    window=config['WINDOW'],
+                )
+    return _retry_budget
+
+
+def retry_policy(name):
+    """The retry policy configured for client method ``name`` (no retries if unset)"""
+    config = settings.RETRY_POLICIES.get(name)
+    if not config:
+        return NO_RETRY
+    return RetryPolicy(
+        max_attempts=config['MAX_ATTEMPTS'],
+        base_delay=config['BASE_DELAY'],
+        max_delay=config['MAX_DELAY'],
+    )
+
+
+def upstream_available(name):
+    """False while the circuit breaker for upstream ``name`` is open"""
+    return get_pool(name).breaker.allows_requests()
+
+
+def pool_stats():
+    """Stats for every upstream pool created so far"""
+    return {name: pool.stats() for name, pool in list(_pools.items())}
+
+
+def retry_budget_stats():
+    return get_retry_budget().stats()
+
+
+def reset_pools():
+    """Close and forget all pools (used when settings change, e.g. in tests)"""
+    global _retry_budget
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+        _retry_budget = None
@@ -0,0 +1,161 @@
+"""
+Idempotency-Key support for mutating endpoints.
+
+The first request with a given key runs normally and its response is stored
+for ``settings.IDEMPOTENCY_KEY_TTL`` seconds. Repeats of that request get the
+stored response back without running the view again; a repeat that arrives
+while the first is still running gets 409, and reusing a key for a different
+request body gets 422. Server errors (5xx) are not stored, so they can be
+retried. The headers of ``STORED_HEADERS`` are stored and replayed with the
+body; the others (Date, Content-Length, ...) are regenerated.
+"""
+
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+# Response headers that are part of the answer, not of the transport
+STORED_HEADERS = ('Location', 'Preference-Applied', 'Retry-After', 'X-Enrichment-Degraded')
+
+
+def _request_hash(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode('utf-8')).hexdigest()
+
+
+def _replay(record, request_hash):
+    if record.request_hash != request_hash:
+        return Response({'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    if record.status_code is None:
+        return Response({'error': f'A request with this {IDEMPOTENCY_HEADER} is still in progress'},
+                        status=status.HTTP_409_CONFLICT)
+    return Response(record.response_body, status=record.status_code,
+                    headers={**(record.response_headers or {}), REPLAYED_HEADER: 'true'})
+
+
+def _claim(scope, key, request_hash):
+    """Returns ``(record, None)`` if the request with ``key`` should run, else ``(None, response)``"""
+    if len(key) > 64:
+        return None, Response({'error': f'{IDEMPOTENCY_HEADER} must be at most 64 characters'},
+                              status=status.HTTP_400_BAD_REQUEST)
+
+    now = timezone.now()
+    IdempotencyRecord.objects.filter(scope=scope, key=key, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            return IdempotencyRecord.objects.create(
+                scope=scope,
+                key=key,
+                request_hash=request_hash,
+                expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+            ), None
+    except IntegrityError:
+        record = IdempotencyRecord.objects.filter(scope=scope, key=key).first()
+        if record is None:
+            return None, Response({'error': f'A request with this {IDEMPOTENCY_HEADER} is still in progress'},
+                                  status=status.HTTP_409_CONFLICT)
+        return None, _replay(record, request_hash)
+
+
+def _store(record, response, data):
+    """Keep ``response`` (with body ``data``) for repeats; server errors are dropped instead"""
+    if response.status_code >= 500:
+        record.delete()
+        return
+    record.status_code = response.status_code
+    record.response_body = data
+    record.response_headers = {name: response[name] for name in STORED_HEADERS if name in response}
+    record.save(update_fields=['status_code', 'response_body', 'response_headers'])
+
+
+def idempotent(scope):
+    """Decorate a view (function or method) so ``Idempotency-Key`` requests run at most once"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            request = next(arg for arg in args if isinstance(arg, Request))
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view(*args, **kwargs)
+
+            record, answer = _claim(scope, key, _request_hash(request))
+            if answer is not None:
+                return answer
+
+            try:
+                response = view(*args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+
+            if not isinstance(response, Response):
+                record.delete()
+                return response
+            _store(record, response, json.loads(JSONRenderer().render(response.data) or b'null'))
+            return response
+        return wrapper
+    return decorator
+
+
+def _as_http_response(response):
+    """A plain Django response for the DRF ``response``, which async views cannot return"""
+    return HttpResponse(JSONRenderer().render(response.data), status=response.status_code,
+                        headers={name: response[name] for name in (*STORED_HEADERS, REPLAYED_HEADER)
+                                 if name in response},
+                        content_type='application/json')
+
+
+def aidempotent(scope):
+    """``idempotent`` for async views (see async_views.py), which return JSON responses.
+
+    The DRF Request among the view's arguments must have been parsed already,
+    as reading its body here would block the event loop.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            request = next(arg for arg in args if isinstance(arg, Request))
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return await view(*args, **kwargs)
+
+            record, answer = await sync_to_async(_claim)(scope, key, _request_hash(request))
+            if answer is not None:
+                return _as_http_response(answer)
+
+            try:
+                response = await view(*args, **kwargs)
+            except Exception:
+                await sync_to_async(record.delete)()
+                raise
+
+            if response.get('Content-Type') != 'application/json':
+                await sync_to_async(record.delete)()
+                return response
+            await sync_to_async(_store)(record, response, json.loads(response.content or b'null'))
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_expired_records(now=None):
+    """Delete stored responses whose key has expired; returns how many were deleted"""
+    deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from orders.models import Order, OrderItem, ProductSales
+from orders.services import ExternalServiceClient
+
+
+class Command(BaseCommand):
+    help = ('Copy product names and categories from Product Service onto order items '
+            'created before they were stored with the order, and product names onto the '
+            'sales rollup rows built from those items')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Products looked up per call to Product Service')
+
+    def handle(self, *args, **options):
+        product_ids = sorted(
+            OrderItem.objects.filter(product_name='').values_list('product_id', flat=True).distinct()
+        )
+        batch_size = options['batch_size']
+        updated = unknown = failed = 0
+        for start in range(0, len(product_ids), batch_size):
+            batch = product_ids[start:start + batch_size]
+            products = ExternalServiceClient.get_products_info(batch)
+            failed += len(products.failed)
+            for product_id in batch:
+                product = products.get(product_id)
+                if product_id in products.failed:
+                    continue
+                if product is None:
+                    unknown += 1
+                    continue
+                items = OrderItem.objects.filter(product_id=product_id, product_name='')
+                with transaction.atomic():
+                    # The orders show their items, so they changed too (see orders/changes.py)
+                    Order.objects.filter(pk__in=items.values('order_id')).update(updated_at=timezone.now())
+                    updated += items.update(
+                        product_name=product['name'],
+                        category_name=(product.get('category') or {}).get('name', ''),
+                    )
+                    ProductSales.objects.filter(product_id=product_id, product_name='').update(
+                        product_name=product['name'],
+                    )
+        self.stdout.write(f'Updated {updated} order item(s); {unknown} product(s) could not be found')
+        if failed:
+            self.stderr.write(f'Product Service did not answer for {failed} product(s); run again later')
@@ -0,0 +1,73 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+
+from orders.models import Order, OrderItem
+from orders.rollups import delete_orders, record
+from orders.serializers import OrderCreateSerializer
+
+BENCH_ADDRESS = 'bench-order-items'
+
+
+def legacy_create(validated_data):
+    """The previous write path of OrderCreateSerializer.create, kept for comparison"""
+    items_data = validated_data.pop('items')
+    total_amount = sum(item['quantity'] * item['price'] for item in items_data)
+    order = Order.objects.create(total_amount=total_amount, **validated_data)
+    for item_data in items_data:
+        OrderItem.objects.create(order=order, **item_data)
+    record(added=[order], items={})  # As the current path does
+    return order
+
+
+def bulk_create(validated_data):
+    return OrderCreateSerializer().create(validated_data)
+
+
+class Command(BaseCommand):
+    help = ('Time storing an order with carts of several sizes, comparing the legacy '
+            'one-INSERT-per-item path with the bulk insert. The orders it creates are '
+            'deleted at the end.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,10,100,1000',
+                            help='Comma separated numbers of items per order')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Orders stored per cart size and path')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        try:
+            for size in sizes:
+                for label, create in (('legacy', legacy_create), ('bulk', bulk_create)):
+                    timings = []
+                    for _ in range(options['repeat']):
+                        validated_data = self.cart(size)
+                        started = time.perf_counter()
+                        with transaction.atomic():  # As in the placement saga
+                            create(validated_data)
+                        timings.append((time.perf_counter() - started) * 1000)
+                    reset_queries()
+                    with CaptureQueriesContext(connection) as queries, transaction.atomic():
+                        create(self.cart(size))
+                    self.stdout.write(
+                        f'{size:>5} items {label:>6}: {len(queries)} queries | ms per order: '
+                        f'median {statistics.median(timings):.2f}, max {max(timings):.2f}'
+                    )
+        finally:
+            delete_orders(Order.objects.filter(shipping_address=BENCH_ADDRESS))
+
+    def cart(self, size):
+        return {
+            'user_id': 1,
+            'shipping_address': BENCH_ADDRESS,
+            'items': [
+                {'product_id': product_id, 'quantity': 2, 'price': Decimal('9.99'),
+                 'product_name': f'Product {product_id}', 'category_name': 'Benchmark'}
+                for product_id in range(1, size + 1)
+            ],
+        }
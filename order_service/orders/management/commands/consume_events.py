@@ -0,0 +1,37 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from orders.read_model import SOURCES, consume
+
+
+class Command(BaseCommand):
+    help = ('Apply the change events published by the user and product services '
+            'to the local read model used to enrich orders')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=SOURCES, action='append',
+                            help='Only consume this source (may be repeated; default: all)')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds between polls of the event feeds')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--once', action='store_true',
+                            help='Consume what is available and exit')
+
+    def handle(self, *args, **options):
+        sources = options['source'] or SOURCES
+        while True:
+            close_old_connections()
+            for source in sources:
+                try:
+                    applied = consume(source, batch_size=options['batch_size'])
+                except requests.RequestException as e:
+                    self.stderr.write(f'Could not read {source} events: {e}')
+                    continue
+                if applied:
+                    self.stdout.write(f'Applied {applied} {source} event(s)')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,66 @@
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from orders.models import DailySales, Order, OrderItem, ProductSales, UserSales
+from orders.pagination import ChangeFeedPagination, KeysetPagination
+
+# Plan lines that mean every row of a table is read (SQLite, PostgreSQL)
+FULL_SCAN = re.compile(r'\b(SCAN (?!.*\b(USING|VIRTUAL TABLE)\b)\S+|Seq Scan on \S+)')
+
+
+def page(queryset, after=None, pagination_class=KeysetPagination):
+    """The query ``pagination_class`` runs for a page of ``queryset``"""
+    paginator = pagination_class()
+    queryset = queryset.order_by(*paginator.ordering)
+    if after is not None:
+        queryset = queryset.filter(paginator.after_position(after))
+    return queryset[:paginator.page_size + 1]
+
+
+def endpoint_queries():
+    now = timezone.now()
+    last_row = [now.isoformat(), 1]
+    return [
+        ('GET /orders/', page(Order.objects.all())),
+        ('GET /orders/?cursor=', page(Order.objects.all(), after=last_row)),
+        ('GET /orders/?user_id=', page(Order.objects.filter(user_id=1))),
+        ('GET /orders/?user_id=&cursor=', page(Order.objects.filter(user_id=1), after=last_row)),
+        ('GET /orders/{id}/', Order.objects.filter(pk=1)),
+        ('order items (prefetch)', OrderItem.objects.filter(order_id__in=[1, 2, 3])),
+        ('GET /orders/changes/?cursor=', page(Order.objects.filter(updated_at__lte=now), after=last_row,
+                                              pagination_class=ChangeFeedPagination)),
+        ('GET /orders/export/?since=', Order.objects.filter(created_at__gte=now).order_by('created_at', 'id')),
+        ('GET /api/analytics/revenue/', DailySales.objects.filter(orders__gt=0, day__gte=now.date())
+         .order_by('day')),
+        ('GET /api/analytics/top-products/', ProductSales.objects.filter(quantity__gt=0)
+         .order_by('-quantity', 'product_id')[:10]),
+        ('GET /api/analytics/top-users/', UserSales.objects.filter(orders__gt=0)
+         .order_by('-revenue', 'user_id')[:10]),
+        ('process_pending_orders', Order.objects.filter(status='pending', created_at__lte=now)
+         .order_by('created_at').values_list('id', flat=True)),
+    ]
+
+
+class Command(BaseCommand):
+    help = ("Print the query plan of each endpoint's queries and flag full table scans. "
+            "Run it against a database of realistic size: on nearly empty tables the "
+            "planner may prefer a scan even where an index exists.")
+
+    def handle(self, *args, **options):
+        queries = endpoint_queries()
+        flagged = 0
+        for name, queryset in queries:
+            plan = queryset.explain()
+            scans = [match.group(1) for match in map(FULL_SCAN.search, plan.splitlines()) if match]
+            if scans:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(f'{name}: full scan ({", ".join(scans)})'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+            for line in plan.splitlines():
+                self.stdout.write(f'    {line}')
+        self.stdout.write(f'{flagged} of {len(queries)} queries scan a whole table '
+                          f'({connection.vendor})')
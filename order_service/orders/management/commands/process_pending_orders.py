@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.models import Order
+from orders.worker import process_order
+
+
+class Command(BaseCommand):
+    help = ('Place orders left pending by asynchronous creation, e.g. because the process '
+            'that queued them stopped before its worker got to them')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=60.0,
+                            help='Only orders pending for at least this many seconds, so orders '
+                                 'still being placed by a running server are left alone')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['min_age'])
+        order_ids = list(
+            Order.objects.filter(status='pending', created_at__lte=cutoff)
+            .order_by('created_at').values_list('id', flat=True)
+        )
+        for order_id in order_ids:
+            process_order(order_id)
+        placed = Order.objects.filter(id__in=order_ids, status='confirmed').count()
+        self.stdout.write(f'Processed {len(order_ids)} pending order(s), {placed} confirmed')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from orders.idempotency import purge_expired_records
+
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key responses that have expired'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_records()
+        self.stdout.write(f'Deleted {deleted} expired idempotency record(s)')
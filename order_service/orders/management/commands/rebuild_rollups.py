@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from orders.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Recompute the analytics rollups from all orders. Run it once after upgrading, '
+            'and after changing orders outside the order service.')
+
+    def handle(self, *args, **options):
+        counted = rebuild()
+        self.stdout.write(f'Rebuilt the rollups from {counted} order(s)')
@@ -14,6 +14,9 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     shipping_address = models.TextField()
+    # Stock reservation in Product Service; doubles as the order's idempotency key
+    reservation_id = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    failure_reason = models.CharField(max_length=255, blank=True, default='')  # Why it was cancelled on placement
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -23,11 +26,23 @@ class Order(models.Model):
     class Meta:
         db_table = 'order'
         ordering = ['-created_at']
+        indexes = [
+            # Order list pages, newest first, overall and per user (see KeysetPagination)
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+            models.Index(fields=['user_id', 'created_at', 'id'], name='order_user_created_idx'),
+            # Change feed, oldest change first (see changes.py)
+            models.Index(fields=['updated_at', 'id'], name='order_updated_idx'),
+            # process_pending_orders
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ]
 
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product_id = models.IntegerField()  # Reference to Product Service
+    # Name and category at time of order; blank for items created before they were stored
+    product_name = models.CharField(max_length=200, blank=True, default='')
+    category_name = models.CharField(max_length=100, blank=True, default='')
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Price at time of order
     
@@ -36,3 +51,142 @@ class OrderItem(models.Model):
 
     class Meta:
         db_table = 'order_item'
+
+
+class IdempotencyRecord(models.Model):
+    """Stored response for a request that carried an Idempotency-Key header"""
+    scope = models.CharField(max_length=100)  # Endpoint the key was used on
+    key = models.CharField(max_length=64)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)  # None while the request is in progress
+    response_body = models.JSONField(null=True)
+    response_headers = models.JSONField(default=dict)  # Those of STORED_HEADERS (see idempotency.py)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
+
+    class Meta:
+        db_table = 'idempotency_record'
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_key_per_scope'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expiry_idx'),
+        ]
+
+
+class EventCursor(models.Model):
+    """Position of the order service in an upstream service's change event feed"""
+    source = models.CharField(max_length=20, unique=True)  # 'user' or 'product'
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} @ {self.last_event_id}"
+
+    class Meta:
+        db_table = 'event_cursor'
+
+
+class ProductSnapshot(models.Model):
+    """Local copy of the product data orders display, kept current from Product Service events"""
+    product_id = models.IntegerField(primary_key=True)  # Reference to Product Service
+    name = models.CharField(max_length=200)
+    price = models.DecimalField(max_digits=10, decimal_places=2)  # Current price, not the ordered one
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        db_table = 'product_snapshot'
+
+
+class UserSnapshot(models.Model):
+    """Local copy of a user's profile, kept current from User Service events"""
+    user_id = models.IntegerField(primary_key=True)  # Reference to User Service
+    profile = models.JSONField()  # Same shape as User Service's /api/user/<id>/
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"User {self.user_id}"
+
+    class Meta:
+        db_table = 'user_snapshot'
+
+
+# Rollups of the orders for the analytics endpoints, kept current as orders are
+# created and change status (see rollups.py)
+
+class StatusCount(models.Model):
+    """Rollup: how many orders are in each status"""
+    status = models.CharField(max_length=20, primary_key=True)
+    orders = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.status}: {self.orders}"
+
+    class Meta:
+        db_table = 'rollup_status_count'
+
+
+class TotalSales(models.Model):
+    """Rollup: sold orders and their revenue overall, in a single row"""
+    id = models.PositiveSmallIntegerField(primary_key=True, default=1)
+    orders = models.BigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"All time: {self.revenue}"
+
+    class Meta:
+        db_table = 'rollup_total_sales'
+
+
+class DailySales(models.Model):
+    """Rollup: sold orders and their revenue per day the orders were placed"""
+    day = models.DateField(primary_key=True)
+    orders = models.BigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.revenue}"
+
+    class Meta:
+        db_table = 'rollup_daily_sales'
+
+
+class ProductSales(models.Model):
+    """Rollup: units of each product sold and their revenue"""
+    product_id = models.IntegerField(primary_key=True)  # Reference to Product Service
+    product_name = models.CharField(max_length=200, blank=True, default='')  # As when first sold
+    quantity = models.BigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"Product {self.product_id}: {self.quantity}"
+
+    class Meta:
+        db_table = 'rollup_product_sales'
+        indexes = [
+            models.Index(fields=['-quantity', 'product_id'], name='rollup_product_quantity_idx'),
+        ]
+
+
+class UserSales(models.Model):
+    """Rollup: sold orders and revenue per user"""
+    user_id = models.IntegerField(primary_key=True)  # Reference to User Service
+    orders = models.BigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"User {self.user_id}: {self.revenue}"
+
+    class Meta:
+        db_table = 'rollup_user_sales'
+        indexes = [
+            models.Index(fields=['-revenue', 'user_id'], name='rollup_user_revenue_idx'),
+        ]
@@ -0,0 +1,126 @@
+"""
+Local read model of the user and product data orders display.
+
+The user and product services publish change events through an outbox and
+expose them at ``/api/events/``. ``consume_events`` (see the management
+command) reads each feed in order and applies the events to the
+``UserSnapshot`` and ``ProductSnapshot`` tables. The events of a batch and the
+new feed position (``EventCursor``) are committed together, so every event is
+applied exactly once even if the consumer is restarted.
+
+Enrichment reads from these tables first and only asks the other services for
+IDs the read model has never seen, so with the consumer running, order reads
+make no network calls. The copies lag the upstream data by roughly the
+consumer's polling interval, plus the upstreams' ``OUTBOX_SETTLE``.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+
+from .http_client import get_pool, retry_policy
+from .models import EventCursor, ProductSnapshot, UserSnapshot
+
+
+EVENT_FEED_PATH = '/api/events/'
+# Name the feeds know this consumer by: they keep events until it has read them
+CONSUMER_NAME = 'order-service'
+SOURCES = ('user', 'product')
+
+
+def _apply_product_event(event):
+    payload = event['payload']
+    if event['event_type'] == 'product.deleted':
+        ProductSnapshot.objects.filter(product_id=event['aggregate_id']).delete()
+    elif event['event_type'] in ('product.created', 'product.renamed', 'product.price_changed',
+                                 'product.availability_changed'):
+        ProductSnapshot.objects.update_or_create(
+            product_id=event['aggregate_id'],
+            defaults={
+                'name': payload['name'],
+                'price': Decimal(payload['price']),
+                'is_active': payload['is_active'],
+            },
+        )
+
+
+def _apply_user_event(event):
+    if event['event_type'] == 'user.deleted':
+        UserSnapshot.objects.filter(user_id=event['aggregate_id']).delete()
+    elif event['event_type'] in ('user.created', 'user.profile_updated'):
+        UserSnapshot.objects.update_or_create(
+            user_id=event['aggregate_id'],
+            defaults={'profile': event['payload']},
+        )
+
+
+# Event types a source does not know about are skipped, so upstreams can add new ones
+APPLY_EVENT = {'user': _apply_user_event, 'product': _apply_product_event}
+
+
+def fetch_events(source, after, limit):
+    """Read up to ``limit`` events after event ID ``after`` from ``source``'s feed.
+
+    Raises ``requests.RequestException`` if the feed cannot be read.
+    """
+    response = get_pool(source).get(
+        EVENT_FEED_PATH,
+        params={'after': after, 'limit': limit, 'consumer': CONSUMER_NAME},
+        retry=retry_policy('fetch_events'),
+    )
+    response.raise_for_status()
+    return response.json()['events']
+
+
+def apply_events(source, events):
+    """Apply a batch of ``source``'s events in order and move its cursor past them"""
+    if not events:
+        return 0
+    with transaction.atomic():
+        cursor, _ = EventCursor.objects.select_for_update().get_or_create(source=source)
+        applied = 0
+        for event in events:
+            # Skip events a concurrent consumer has already applied
+            if event['id'] <= cursor.last_event_id:
+                continue
+            APPLY_EVENT[source](event)
+            cursor.last_event_id = event['id']
+            applied += 1
+        cursor.save(update_fields=['last_event_id', 'updated_at'])
+    return applied
+
+
+def consume(source, batch_size=500):
+    """Apply every event ``source`` has published since the last run; returns how many"""
+    total = 0
+    while True:
+        cursor = EventCursor.objects.filter(source=source).first()
+        events = fetch_events(source, cursor.last_event_id if cursor else 0, batch_size)
+        total += apply_events(source, events)
+        if len(events) < batch_size:
+            return total
+
+
+def users_from_read_model(user_ids):
+    """Profiles of the given users known to the read model, keyed by user ID"""
+    return {
+        snapshot.user_id: snapshot.profile
+        for snapshot in UserSnapshot.objects.filter(user_id__in=user_ids)
+    }
+
+
+def products_from_read_model(product_ids):
+    """Products known to the read model, keyed by ID.
+
+    Inactive products map to None: Product Service reports them as not found,
+    so there is no point in asking it.
+    """
+    return {
+        snapshot.product_id: {
+            'id': snapshot.product_id,
+            'name': snapshot.name,
+            'price': str(snapshot.price),
+            'is_active': True,
+        } if snapshot.is_active else None
+        for snapshot in ProductSnapshot.objects.filter(product_id__in=product_ids)
+    }
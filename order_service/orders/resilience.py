@@ -0,0 +1,187 @@
+"""
+Failure isolation for calls to the other microservices.
+
+Each upstream has a circuit breaker that watches the outcome and latency of
+recent calls. When too many of them fail or are slow, the breaker opens and
+calls fail immediately with UpstreamUnavailable instead of tying up a worker
+until a timeout. After a cool-down a few trial calls are let through
+(half-open); if they succeed the breaker closes again.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+
+
+class UpstreamUnavailable(requests.RequestException):
+    """The call was rejected locally without reaching the upstream service"""
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a sliding window of recent calls"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, window_size=20, minimum_calls=10, failure_rate=0.5,
+                 slow_call_duration=2.0, slow_call_rate=0.8, open_duration=10.0,
+                 half_open_calls=1):
+        self.name = name
+        self.window_size = window_size
+        self.minimum_calls = minimum_calls
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.open_duration = open_duration
+        self.half_open_calls = half_open_calls
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._window = deque(maxlen=window_size)  # (failed, slow) per call
+        self._opened_at = 0.0
+        self._trial_calls = 0
+        self._rejected = 0
+        self._times_opened = 0
+
+    def _refresh_state(self, now):
+        if self._state == self.OPEN and now - self._opened_at >= self.open_duration:
+            self._state = self.HALF_OPEN
+            self._trial_calls = 0
+
+    def _open(self, now):
+        self._state = self.OPEN
+        self._opened_at = now
+        self._times_opened += 1
+        self._window.clear()
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh_state(time.monotonic())
+            return self._state
+
+    def allows_requests(self):
+        """Whether a call made now would be let through (without reserving it)"""
+        return self.state != self.OPEN
+
+    def before_call(self):
+        """Reserve permission for one call, or raise UpstreamUnavailable"""
+        with self._lock:
+            self._refresh_state(time.monotonic())
+            if self._state == self.OPEN:
+                self._rejected += 1
+                raise UpstreamUnavailable(f'Circuit breaker for {self.name} is open')
+            if self._state == self.HALF_OPEN:
+                if self._trial_calls >= self.half_open_calls:
+                    self._rejected += 1
+                    raise UpstreamUnavailable(f'Circuit breaker for {self.name} is half-open')
+                self._trial_calls += 1
+
+    def record(self, success, duration):
+        """Record the outcome of a call let through by :meth:`before_call`"""
+        slow = duration >= self.slow_call_duration
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.HALF_OPEN:
+                if success and not slow:
+                    self._state = self.CLOSED
+                    self._window.clear()
+                else:
+                    self._open(now)
+                return
+
+            self._window.append((not success, slow))
+            calls = len(self._window)
+            if calls < self.minimum_calls:
+                return
+            failures = sum(1 for failed, _ in self._window if failed)
+            slow_calls = sum(1 for _, was_slow in self._window if was_slow)
+            if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_call_rate:
+                self._open(now)
+
+    def stats(self):
+        with self._lock:
+            self._refresh_state(time.monotonic())
+            calls = len(self._window)
+            return {
+                'state': self._state,
+                'window_calls': calls,
+                'window_failures': sum(1 for failed, _ in self._window if failed),
+                'window_slow_calls': sum(1 for _, slow in self._window if slow),
+                'times_opened': self._times_opened,
+                'rejected_calls': self._rejected,
+            }
+
+
+class RetryPolicy:
+    """How often and how patiently to retry a failed call.
+
+    Delays grow exponentially from ``base_delay`` up to ``max_delay`` with
+    full jitter, so clients that failed together do not retry together.
+    """
+
+    def __init__(self, max_attempts=1, base_delay=0.05, max_delay=1.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number ``attempt`` (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+class RetryBudget:
+    """Caps retries at a share of recent traffic so they cannot turn an outage into a storm.
+
+    Over the last ``window`` seconds, retries are allowed while they stay below
+    ``ratio`` of first attempts plus ``min_per_second`` retries per second.
+    """
+
+    def __init__(self, ratio=0.1, min_per_second=1.0, window=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+
+        self._lock = threading.Lock()
+        self._buckets = {}  # second -> [requests, retries]
+        self._exhausted = 0
+
+    def _totals(self, now):
+        horizon = now - self.window
+        for second in [second for second in self._buckets if second <= horizon]:
+            del self._buckets[second]
+        requests_total = sum(bucket[0] for bucket in self._buckets.values())
+        retries_total = sum(bucket[1] for bucket in self._buckets.values())
+        return requests_total, retries_total
+
+    def record_request(self):
+        with self._lock:
+            self._buckets.setdefault(int(time.monotonic()), [0, 0])[0] += 1
+
+    def try_acquire_retry(self):
+        """Spend one retry from the budget; False when the budget is used up"""
+        with self._lock:
+            now = int(time.monotonic())
+            requests_total, retries_total = self._totals(now)
+            if retries_total >= self.ratio * requests_total + self.min_per_second * self.window:
+                self._exhausted += 1
+                return False
+            self._buckets.setdefault(now, [0, 0])[1] += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            requests_total, retries_total = self._totals(int(time.monotonic()))
+            return {
+                'window_seconds': self.window,
+                'window_requests': requests_total,
+                'window_retries': retries_total,
+                'retries_denied': self._exhausted,
+            }
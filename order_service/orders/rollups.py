@@ -0,0 +1,193 @@
+"""
+Sales rollups behind the analytics endpoints (``/api/analytics/...``).
+
+Counting orders per status, revenue per day, units per product or revenue per
+user from the orders themselves means reading every order. Instead each
+rollup table holds the running totals, and every write that creates an order,
+changes its status or deletes it adds its difference in the same transaction,
+so dashboards read a handful of rows.
+
+An order counts towards the sales rollups (all time, days, products, users) while its
+status is one of ``SOLD_STATUSES``, i.e. once its stock was confirmed and
+until it is cancelled; ``StatusCount`` covers every status. Writes that
+bypass :func:`change_status` and :func:`record` (raw SQL, queryset updates
+elsewhere) leave the rollups stale: run ``manage.py rebuild_rollups``.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailySales, Order, OrderItem, ProductSales, StatusCount, TotalSales, UserSales
+
+
+SOLD_STATUSES = ('confirmed', 'shipped', 'delivered')
+
+
+def _increment(model, key, defaults=None, **deltas):
+    """Add ``deltas`` to the rollup row ``key``, creating it (with ``defaults``) if needed"""
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**key).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **(defaults or {}), **deltas)
+    except IntegrityError:
+        # Created concurrently
+        model.objects.filter(**key).update(**updates)
+
+
+class _Changes:
+    """Differences to the rollups, accumulated per row so each row is written once"""
+
+    def __init__(self):
+        self.statuses = defaultdict(int)
+        self.total = [0, Decimal('0')]
+        self.days = defaultdict(lambda: [0, Decimal('0')])
+        self.users = defaultdict(lambda: [0, Decimal('0')])
+        self.products = defaultdict(lambda: [0, Decimal('0')])
+        self.product_names = {}
+
+    def add(self, order, items, sign):
+        self.statuses[order.status] += sign
+        if order.status not in SOLD_STATUSES:
+            return
+        for totals in (self.total, self.days[timezone.localdate(order.created_at)], self.users[order.user_id]):
+            totals[0] += sign
+            totals[1] += sign * order.total_amount
+        for item in items:
+            totals = self.products[item.product_id]
+            totals[0] += sign * item.quantity
+            totals[1] += sign * item.quantity * item.price
+            if item.product_name:
+                self.product_names[item.product_id] = item.product_name
+
+    def apply(self):
+        for status, orders in self.statuses.items():
+            if orders:
+                _increment(StatusCount, {'status': status}, orders=orders)
+        orders, revenue = self.total
+        if orders or revenue:
+            _increment(TotalSales, {'id': 1}, orders=orders, revenue=revenue)
+        for day, (orders, revenue) in self.days.items():
+            if orders or revenue:
+                _increment(DailySales, {'day': day}, orders=orders, revenue=revenue)
+        for user_id, (orders, revenue) in self.users.items():
+            if orders or revenue:
+                _increment(UserSales, {'user_id': user_id}, orders=orders, revenue=revenue)
+        for product_id, (quantity, revenue) in self.products.items():
+            if quantity or revenue:
+                _increment(ProductSales, {'product_id': product_id},
+                           defaults={'product_name': self.product_names.get(product_id, '')},
+                           quantity=quantity, revenue=revenue)
+
+
+def _sold_items(orders):
+    """Items of the sold orders among ``orders``, by order ID"""
+    items = defaultdict(list)
+    sold_ids = [order.pk for order in orders if order.status in SOLD_STATUSES]
+    if sold_ids:
+        for item in OrderItem.objects.filter(order_id__in=sold_ids):
+            items[item.order_id].append(item)
+    return items
+
+
+def record(removed=(), added=(), items=None):
+    """Update the rollups for orders as they were (``removed``) and as they are now (``added``).
+
+    A new order is only ``added``, a deleted one only ``removed``, and a
+    changed one appears in both, once with its old and once with its new
+    field values. Items are read from the database unless ``items`` maps
+    order ID to them. Call it in the transaction that made the change.
+    """
+    if items is None:
+        items = _sold_items([*removed, *added])
+    changes = _Changes()
+    for order in removed:
+        changes.add(order, items.get(order.pk, ()), -1)
+    for order in added:
+        changes.add(order, items.get(order.pk, ()), 1)
+    changes.apply()
+
+
+def change_status(orders, status, **fields):
+    """Move the orders of queryset ``orders`` to ``status`` and update the rollups.
+
+    Like ``orders.exclude(status=status).update(status=status, ...)``, and
+    just as safe under concurrency: only orders still in the status they were
+    read with are changed. Returns how many orders were changed.
+    """
+    read = defaultdict(list)
+    for order_id, old_status in orders.exclude(status=status).values_list('pk', 'status'):
+        read[old_status].append(order_id)
+    if not read:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        old_statuses = {}
+        for old_status, order_ids in read.items():
+            changed = Order.objects.filter(pk__in=order_ids, status=old_status).update(
+                status=status, updated_at=now, **fields,
+            )
+            if changed < len(order_ids):
+                # Some changed in the meantime: ours are those we just stamped
+                order_ids = Order.objects.filter(pk__in=order_ids, status=status, updated_at=now) \
+                    .values_list('pk', flat=True)
+            old_statuses.update(dict.fromkeys(order_ids, old_status))
+        if not old_statuses:
+            return 0
+
+        changed_orders = list(Order.objects.filter(pk__in=list(old_statuses)))
+        previous = [
+            Order(pk=order.pk, user_id=order.user_id, total_amount=order.total_amount,
+                  created_at=order.created_at, status=old_statuses[order.pk])
+            for order in changed_orders
+        ]
+        record(removed=previous, added=changed_orders)
+    return len(changed_orders)
+
+
+def delete_orders(orders):
+    """Delete the orders of queryset ``orders`` (and their items), updating the rollups"""
+    with transaction.atomic():
+        deleted = list(orders.select_for_update())
+        record(removed=deleted)
+        Order.objects.filter(pk__in=[order.pk for order in deleted]).delete()
+    return len(deleted)
+
+
+def rebuild():
+    """Recompute every rollup from the orders; returns the number of orders counted"""
+    sold = Order.objects.filter(status__in=SOLD_STATUSES)
+    with transaction.atomic():
+        for model in (StatusCount, TotalSales, DailySales, ProductSales, UserSales):
+            model.objects.all().delete()
+        StatusCount.objects.bulk_create([
+            StatusCount(status=row['status'], orders=row['orders'])
+            for row in Order.objects.order_by().values('status').annotate(orders=Count('id'))
+        ])
+        total = sold.aggregate(orders=Count('id'), revenue=Sum('total_amount'))
+        if total['orders']:
+            TotalSales.objects.create(id=1, orders=total['orders'], revenue=total['revenue'])
+        DailySales.objects.bulk_create([
+            DailySales(day=row['day'], orders=row['orders'], revenue=row['revenue'])
+            for row in sold.order_by().annotate(day=TruncDate('created_at')).values('day')
+            .annotate(orders=Count('id'), revenue=Sum('total_amount'))
+        ])
+        UserSales.objects.bulk_create([
+            UserSales(user_id=row['user_id'], orders=row['orders'], revenue=row['revenue'])
+            for row in sold.order_by().values('user_id').annotate(orders=Count('id'), revenue=Sum('total_amount'))
+        ])
+        ProductSales.objects.bulk_create([
+            ProductSales(product_id=row['product_id'], product_name=row['name'] or '',
+                         quantity=row['units'], revenue=row['sales'])
+            for row in OrderItem.objects.filter(order__status__in=SOLD_STATUSES).order_by()
+            .values('product_id').annotate(units=Sum('quantity'), name=Max('product_name'),
+                                           sales=Sum(F('quantity') * F('price'), output_field=DecimalField()))
+        ])
+        return sum(StatusCount.objects.values_list('orders', flat=True))
@@ -0,0 +1,221 @@
+"""
+Order placement saga.
+
+1. Hold stock in Product Service under the order's reservation ID, with a TTL
+2. Commit the order locally (status ``pending``)
+3. Confirm the hold and mark the order ``confirmed``
+
+A failure after step 1 is compensated by releasing the hold. A hold that is
+neither confirmed nor released (e.g. the order service died mid-saga) expires
+and is given back by the product service's ``sweep_reservations`` command.
+The reservation ID is stored on the order, so retrying with the same ID never
+takes the stock twice.
+
+For asynchronous placement the order is committed first, as ``pending``, and
+``complete_pending_order`` then holds the stock and confirms it.
+"""
+
+import uuid
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import Order, OrderItem
+from .rollups import change_status
+from .async_services import AsyncExternalServiceClient
+from .services import ExternalServiceClient
+
+
+class OrderPlacementError(Exception):
+    """Order could not be placed; ``status_code`` is the HTTP status to answer with"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def new_reservation_id():
+    return uuid.uuid4().hex
+
+
+def _hold_stock(items_data, reservation_id):
+    """Step 1: hold the stock for every item, all-or-nothing; returns the reserved items by product ID"""
+    reservation = ExternalServiceClient.reserve_stock(
+        items_data, reservation_id=reservation_id, ttl=settings.STOCK_RESERVATION_TTL
+    )
+    if reservation is None:
+        raise OrderPlacementError('Product service unavailable', 503)
+    if not reservation.get('success'):
+        raise OrderPlacementError(reservation.get('error', 'Insufficient stock'), 400)
+    return {item['product_id']: item for item in reservation['items']}
+
+
+def copy_reserved(item, reserved):
+    """Use the current product price returned by the reservation, and keep the
+    product's name and category as they were when it was ordered"""
+    reserved_item = reserved[item['product_id']]
+    item['price'] = Decimal(reserved_item['price'])
+    item['product_name'] = reserved_item['product_name']
+    item['category_name'] = reserved_item.get('category_name') or ''
+
+
+def mark_cancelled(order, reason):
+    """Cancel an order that could not be placed, recording why"""
+    change_status(Order.objects.filter(pk=order.pk), 'cancelled', failure_reason=reason[:255])
+    order.refresh_from_db(fields=['status', 'failure_reason', 'updated_at'])
+
+
+def _confirm(order):
+    """Step 3: confirm the hold and mark the order ``confirmed``"""
+    if not ExternalServiceClient.confirm_reservation(order.reservation_id):
+        ExternalServiceClient.release_stock(reservation_id=order.reservation_id)
+        message = 'Could not confirm stock reservation, order was cancelled'
+        mark_cancelled(order, message)
+        raise OrderPlacementError(message, 503)
+
+    if not _mark_confirmed(order):
+        ExternalServiceClient.release_stock(reservation_id=order.reservation_id)
+
+
+def _mark_confirmed(order):
+    """Mark a pending order ``confirmed`` once its hold is; False if it was cancelled meanwhile.
+
+    The order then stays cancelled, and its stock must be released again: the
+    cancellation may have released the reservation before it was held.
+    """
+    change_status(Order.objects.filter(pk=order.pk, status='pending'), 'confirmed')
+    order.refresh_from_db(fields=['status', 'updated_at'])
+    return order.status != 'cancelled'
+
+
+def place_order(serializer, reservation_id):
+    """Run the saga for a validated ``OrderCreateSerializer``.
+
+    Returns ``(order, reserved)`` where ``reserved`` maps product ID to the
+    reserved item (with current ``product_name`` and ``price``).
+    Raises OrderPlacementError after compensating.
+    """
+    items_data = serializer.validated_data['items']
+
+    # 1. Hold the stock
+    reserved = _hold_stock(items_data, reservation_id)
+    for item_data in items_data:
+        copy_reserved(item_data, reserved)
+
+    # 2. Commit the order
+    try:
+        with transaction.atomic():
+            order = serializer.save(reservation_id=reservation_id)
+    except IntegrityError:
+        # A concurrent retry with the same reservation ID committed first; the
+        # hold belongs to that order, so it must not be released here
+        existing = Order.objects.filter(reservation_id=reservation_id).first()
+        if existing is not None:
+            return existing, reserved
+        ExternalServiceClient.release_stock(reservation_id=reservation_id)
+        raise OrderPlacementError('Could not save order', 500)
+    except Exception as e:
+        ExternalServiceClient.release_stock(reservation_id=reservation_id)
+        raise OrderPlacementError(str(e), 500)
+
+    # 3. Confirm the hold
+    _confirm(order)
+    return order, reserved
+
+
+def complete_pending_order(order):
+    """Run the saga for an order already stored as ``pending`` without any stock held.
+
+    Used for asynchronous placement (see ``worker.py``): holds the stock,
+    rewrites the items with the reserved prices and names, then confirms.
+    Raises OrderPlacementError after compensating; the order is only
+    cancelled here when the hold could not be confirmed.
+    """
+    items = list(order.items.all())
+    items_data = [{'product_id': item.product_id, 'quantity': item.quantity} for item in items]
+
+    # 1. Hold the stock
+    reserved = _hold_stock(items_data, order.reservation_id)
+
+    # 2. Store the reserved prices and names, unless the order was cancelled meanwhile
+    try:
+        with transaction.atomic():
+            current_status = Order.objects.select_for_update().values_list('status', flat=True).get(pk=order.pk)
+            if current_status != 'pending':
+                raise OrderPlacementError(f'Order is {current_status}', 409)
+            for item, item_data in zip(items, items_data):
+                copy_reserved(item_data, reserved)
+                item.price = item_data['price']
+                item.product_name = item_data['product_name']
+                item.category_name = item_data['category_name']
+            OrderItem.objects.bulk_update(items, ['price', 'product_name', 'category_name'])
+            order.total_amount = sum(item.quantity * item.price for item in items)
+            order.save(update_fields=['total_amount', 'updated_at'])
+    except OrderPlacementError:
+        ExternalServiceClient.release_stock(reservation_id=order.reservation_id)
+        raise
+    except Exception as e:
+        ExternalServiceClient.release_stock(reservation_id=order.reservation_id)
+        raise OrderPlacementError(str(e), 500)
+
+    # 3. Confirm the hold
+    _confirm(order)
+    return order
+
+
+async def _ahold_stock(items_data, reservation_id):
+    """Async variant of :func:`_hold_stock`"""
+    reservation = await AsyncExternalServiceClient.reserve_stock(
+        items_data, reservation_id=reservation_id, ttl=settings.STOCK_RESERVATION_TTL
+    )
+    if reservation is None:
+        raise OrderPlacementError('Product service unavailable', 503)
+    if not reservation.get('success'):
+        raise OrderPlacementError(reservation.get('error', 'Insufficient stock'), 400)
+    return {item['product_id']: item for item in reservation['items']}
+
+
+@sync_to_async
+def _save_order(serializer, reservation_id):
+    """Step 2 of :func:`aplace_order`; returns ``(order, created)``"""
+    try:
+        with transaction.atomic():
+            return serializer.save(reservation_id=reservation_id), True
+    except IntegrityError:
+        existing = Order.objects.filter(reservation_id=reservation_id).first()
+        if existing is not None:
+            return existing, False
+        raise
+
+
+async def aplace_order(serializer, reservation_id):
+    """Async variant of :func:`place_order`, for the async views"""
+    items_data = serializer.validated_data['items']
+
+    # 1. Hold the stock
+    reserved = await _ahold_stock(items_data, reservation_id)
+    for item_data in items_data:
+        copy_reserved(item_data, reserved)
+
+    # 2. Commit the order
+    try:
+        order, created = await _save_order(serializer, reservation_id)
+    except Exception as e:
+        await AsyncExternalServiceClient.release_stock(reservation_id=reservation_id)
+        raise OrderPlacementError(str(e) or 'Could not save order', 500)
+    if not created:
+        # A concurrent retry with the same reservation ID committed first and owns the hold
+        return order, reserved
+
+    # 3. Confirm the hold
+    if not await AsyncExternalServiceClient.confirm_reservation(reservation_id):
+        await AsyncExternalServiceClient.release_stock(reservation_id=reservation_id)
+        message = 'Could not confirm stock reservation, order was cancelled'
+        await sync_to_async(mark_cancelled)(order, message)
+        raise OrderPlacementError(message, 503)
+
+    if not await sync_to_async(_mark_confirmed)(order):
+        await AsyncExternalServiceClient.release_stock(reservation_id=reservation_id)
+    return order, reserved
@@ -1,13 +1,17 @@
+from decimal import Decimal
+
+from django.db import transaction
 from rest_framework import serializers
-from .models import Order, OrderItem
+from .models import DailySales, Order, OrderItem, ProductSales, UserSales
+from .rollups import record
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    product_name = serializers.CharField(read_only=True)  # Will be populated from Product Service
-    
     class Meta:
         model = OrderItem
-        fields = ['id', 'product_id', 'product_name', 'quantity', 'price']
+        fields = ['id', 'product_id', 'product_name', 'category_name', 'quantity', 'price']
+        # Copied from Product Service when the order is placed
+        read_only_fields = ['product_name', 'category_name']
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -30,13 +34,39 @@ class OrderCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         items_data = validated_data.pop('items')
         
-        # Calculate total amount
-        total_amount = sum(item['quantity'] * item['price'] for item in items_data)
-        
-        order = Order.objects.create(total_amount=total_amount, **validated_data)
-        
-        # Create order items
+        # Build the items and the total amount in one pass
+        items = []
+        total_amount = Decimal('0')
         for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
+            item = OrderItem(**item_data)
+            total_amount += item.quantity * item.price
+            items.append(item)
+        
+        # One INSERT for the order and one for all of its items (callers such as
+        # the placement saga already run this in a transaction, so no savepoint)
+        with transaction.atomic(savepoint=False):
+            order = Order.objects.create(total_amount=total_amount, **validated_data)
+            for item in items:
+                item.order = order
+            OrderItem.objects.bulk_create(items)
+            record(added=[order], items={order.pk: items})
             
         return order
+
+
+class DailySalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailySales
+        fields = ['day', 'orders', 'revenue']
+
+
+class ProductSalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductSales
+        fields = ['product_id', 'product_name', 'quantity', 'revenue']
+
+
+class UserSalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserSales
+        fields = ['user_id', 'orders', 'revenue']
@@ -1,57 +1,222 @@
+import functools
+
 import requests
-from django.conf import settings
+
+from .cache import get_cache
+from .http_client import get_pool, retry_policy
+from .resilience import NO_RETRY
+
+
+def _fetch_one(upstream, path, key, retry=NO_RETRY):
+    """Fetch a single entity: ``{key: data}``, ``{}`` on 404, ``None`` on failure"""
+    try:
+        response = get_pool(upstream).get(path, retry=retry)
+        if response.status_code == 200:
+            return {key: response.json()}
+        if response.status_code == 404:
+            return {}
+        return None
+    except requests.RequestException:
+        return None
+
+
+def _fetch_many(upstream, path, ids, key_of, retry=NO_RETRY):
+    """Fetch several entities from a batch endpoint: ``{id: data}`` or ``None`` on failure"""
+    try:
+        response = get_pool(upstream).get(
+            path,
+            params={"ids": ",".join(str(entity_id) for entity_id in sorted(ids))},
+            retry=retry,
+        )
+        if response.status_code == 200:
+            return {key_of(entity): entity for entity in response.json()}
+        return None
+    except requests.RequestException:
+        return None
+
+
+def _fetch_users(user_ids, method):
+    retry = retry_policy(method)
+    if len(user_ids) == 1:
+        return _fetch_one('user', f"/api/user/{user_ids[0]}/", user_ids[0], retry)
+    return _fetch_many('user', "/api/users/batch/", user_ids, lambda profile: profile['user']['id'], retry)
+
+
+def _fetch_products(product_ids, method):
+    retry = retry_policy(method)
+    if len(product_ids) == 1:
+        return _fetch_one('product', f"/api/product/{product_ids[0]}/", product_ids[0], retry)
+    return _fetch_many('product', "/api/products/batch/", product_ids, lambda product: product['id'], retry)
+
+
+def _stock_items(items):
+    return [{"product_id": item['product_id'], "quantity": item['quantity']} for item in items]
 
 
 class ExternalServiceClient:
-    """Client to communicate with other microservices"""
+    """Client to communicate with other microservices.
+
+    User and product lookups are served from the in-process entity caches
+    (see ``orders/cache.py``) and only go upstream on a miss.
+
+    Each method retries transient failures according to its entry in
+    ``settings.RETRY_POLICIES``. Stock changes are only retried when repeating
+    them is safe, i.e. when they carry a reservation ID or an idempotency key.
+    """
     
     @staticmethod
     def get_user_info(user_id):
         """Get user information from User Service"""
+        return get_cache('user').get(user_id, functools.partial(_fetch_users, method='get_user_info'))
+    
+    @staticmethod
+    def get_product_info(product_id):
+        """Get product information from Product Service"""
+        return get_cache('product').get(product_id, functools.partial(_fetch_products, method='get_product_info'))
+    
+    @staticmethod
+    def get_users_info(user_ids):
+        """Get information for several users from User Service in one call.
+
+        Returns a dict mapping user ID to user info; unknown IDs are omitted.
+        """
+        return get_cache('user').get_many(set(user_ids), functools.partial(_fetch_users, method='get_users_info'))
+    
+    @staticmethod
+    def get_products_info(product_ids):
+        """Get information for several products from Product Service in one call.
+
+        Returns a dict mapping product ID to product info; unknown IDs are omitted.
+        """
+        return get_cache('product').get_many(set(product_ids), functools.partial(_fetch_products, method='get_products_info'))
+    
+    @staticmethod
+    def reserve_stock(items, reservation_id=None, ttl=None, idempotency_key=None):
+        """Take stock for all order items in Product Service, all-or-nothing.
+
+        ``items`` is a list of dicts with ``product_id`` and ``quantity``. With
+        a ``reservation_id`` the stock is only held (for ``ttl`` seconds) until
+        :meth:`confirm_reservation`; retrying with the same ID is safe, as is
+        retrying with the same ``idempotency_key``.
+        Returns the response body (``success`` plus the reserved ``items`` with
+        current names and prices, or an ``error``), or None if the service
+        could not be reached.
+        """
+        payload = {"items": _stock_items(items)}
+        if reservation_id is not None:
+            payload["reservation_id"] = reservation_id
+        if ttl is not None:
+            payload["ttl"] = ttl
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        safe_to_repeat = reservation_id is not None or idempotency_key
         try:
-            response = requests.get(f"{settings.USER_SERVICE_URL}/api/user/{user_id}/")
-            if response.status_code == 200:
+            response = get_pool('product').post(
+                "/api/reserve-stock/",
+                json=payload,
+                headers=headers,
+                retry=retry_policy('reserve_stock') if safe_to_repeat else NO_RETRY,
+            )
+            if response.status_code in (200, 400, 409):
                 return response.json()
             return None
         except requests.RequestException:
             return None
     
     @staticmethod
-    def get_product_info(product_id):
-        """Get product information from Product Service"""
+    def confirm_reservation(reservation_id):
+        """Make a stock hold permanent in Product Service"""
+        try:
+            response = get_pool('product').post(
+                "/api/confirm-reservation/",
+                json={"reservation_id": reservation_id},
+                retry=retry_policy('confirm_reservation'),
+            )
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+    
+    @staticmethod
+    def release_stock(items=None, reservation_id=None, idempotency_key=None):
+        """Put stock back in Product Service, either for ``items`` or for a whole reservation.
+
+        Releasing a reservation is naturally idempotent (and releasing one
+        that was never made succeeds, as there is nothing to give back);
+        releasing ``items`` is only safe to repeat when an ``idempotency_key``
+        is given.
+        """
+        if reservation_id is not None:
+            payload = {"reservation_id": reservation_id}
+        else:
+            payload = {"items": _stock_items(items)}
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        safe_to_repeat = reservation_id is not None or idempotency_key
+        try:
+            response = get_pool('product').post(
+                "/api/release-stock/",
+                json=payload,
+                headers=headers,
+                retry=retry_policy('release_stock') if safe_to_repeat else NO_RETRY,
+            )
+            if reservation_id is not None and response.status_code == 404:
+                return True
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+    
+    @staticmethod
+    def reserve_stock_batch(reservations, ttl=None):
+        """Hold stock for several orders in one call to Product Service.
+
+        ``reservations`` maps reservation ID to that order's items. Each hold
+        is all-or-nothing on its own, and retrying is safe. Returns a dict
+        mapping reservation ID to its result (``success`` plus the held
+        ``items``, or an ``error``), or None if the service could not be reached.
+        """
+        payload = {"reservations": [
+            {"reservation_id": reservation_id, "items": _stock_items(items)}
+            for reservation_id, items in reservations.items()
+        ]}
+        if ttl is not None:
+            payload["ttl"] = ttl
         try:
-            response = requests.get(f"{settings.PRODUCT_SERVICE_URL}/api/product/{product_id}/")
+            response = get_pool('product').post(
+                "/api/reserve-stock/batch/",
+                json=payload,
+                retry=retry_policy('reserve_stock_batch'),
+            )
             if response.status_code == 200:
-                return response.json()
+                return {result['reservation_id']: result for result in response.json()['results']}
             return None
         except requests.RequestException:
             return None
     
     @staticmethod
-    def check_product_stock(product_id, quantity):
-        """Check if product has sufficient stock"""
+    def confirm_reservations(reservation_ids):
+        """Make several stock holds permanent in one call; returns the set of confirmed IDs"""
         try:
-            response = requests.post(
-                f"{settings.PRODUCT_SERVICE_URL}/api/check-stock/",
-                json={"product_id": product_id, "quantity": quantity}
+            response = get_pool('product').post(
+                "/api/confirm-reservation/batch/",
+                json={"reservation_ids": list(reservation_ids)},
+                retry=retry_policy('confirm_reservations'),
             )
             if response.status_code == 200:
-                return response.json()
-            return None
+                return {result['reservation_id'] for result in response.json()['results'] if result['success']}
+            return set()
         except requests.RequestException:
-            return None
+            return set()
     
     @staticmethod
-    def update_product_stock(product_id, quantity, operation='decrease'):
-        """Update product stock in Product Service"""
+    def release_reservations(reservation_ids):
+        """Give back the stock of several reservations in one call.
+
+        As with :meth:`release_stock`, reservations that were never made count
+        as released. Returns True if the call succeeded.
+        """
         try:
-            response = requests.post(
-                f"{settings.PRODUCT_SERVICE_URL}/api/update-stock/",
-                json={
-                    "product_id": product_id, 
-                    "quantity": quantity, 
-                    "operation": operation
-                }
+            response = get_pool('product').post(
+                "/api/release-stock/batch/",
+                json={"reservation_ids": list(reservation_ids)},
+                retry=retry_policy('release_reservations'),
             )
             return response.status_code == 200
         except requests.RequestException:
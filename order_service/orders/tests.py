@@ -1,3 +1,1154 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import io
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework.utils.urls import replace_query_param
+
+from .models import (
+    DailySales, EventCursor, IdempotencyRecord, Order, OrderItem, ProductSales, ProductSnapshot, StatusCount,
+    TotalSales, UserSales, UserSnapshot,
+)
+from .async_services import AsyncExternalServiceClient
+from .cache import CacheResult, TTLCache, reset_caches
+from .http_client import UpstreamPool, get_pool, reset_pools
+from .resilience import CircuitBreaker, RetryBudget, RetryPolicy, UpstreamUnavailable
+from .read_model import apply_events
+from .rollups import change_status
+from .serializers import OrderCreateSerializer
+from .services import ExternalServiceClient
+from .worker import process_order
+
+
+def http_response(status_code, data=None):
+    """A ``requests`` response as another service would send it"""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(data).encode()
+    response.raw = io.BytesIO(response._content)
+    return response
+
+
+class QueryCountTestCase(TestCase):
+    """Asserts that list endpoints run a constant number of queries per page"""
+
+    def setUp(self):
+        self.client = APIClient()
+        for user_id in range(1, 6):
+            order = Order.objects.create(
+                user_id=user_id, total_amount=Decimal('30.00'), shipping_address='Somewhere'
+            )
+            for product_id in range(1, 4):
+                OrderItem.objects.create(
+                    order=order, product_id=product_id, quantity=1, price=Decimal('10.00')
+                )
+
+        # Enrichment talks to the other services; keep these tests local
+        for method in ('get_users_info', 'get_products_info'):
+            patcher = mock.patch.object(ExternalServiceClient, method, return_value=CacheResult())
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_order_list(self):
+        # One query for the page of orders, one to prefetch all their items and
+        # one per read model table
+        with self.assertNumQueries(4):
+            response = self.client.get('/orders/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(len(response.data['results'][0]['items']), 3)
+
+    def test_order_list_filtered_by_user(self):
+        with self.assertNumQueries(4):
+            response = self.client.get('/orders/', {'user_id': 1})
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_order_detail(self):
+        order = Order.objects.first()
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/orders/{order.id}/')
+        self.assertEqual(response.status_code, 200)
+
+
+class KeysetPaginationTestCase(TestCase):
+    """GET /orders/ pages follow a cursor on (created_at, id), newest first"""
+
+    def setUp(self):
+        self.client = APIClient()
+        for _ in range(5):
+            self.create_order()
+        # Orders placed in the same instant are ordered by ID
+        Order.objects.update(created_at=datetime(2025, 1, 2, tzinfo=timezone.utc))
+        Order.objects.filter(pk=Order.objects.order_by('id')[0].pk).update(
+            created_at=datetime(2025, 1, 1, tzinfo=timezone.utc))
+
+        for method in ('get_users_info', 'get_products_info'):
+            patcher = mock.patch.object(ExternalServiceClient, method, return_value=CacheResult())
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def create_order(self):
+        return Order.objects.create(user_id=1, total_amount=Decimal('10.00'), shipping_address='Somewhere')
+
+    def test_pages_follow_the_cursor(self):
+        expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        response = self.client.get('/orders/', {'page_size': 2})
+        # A new order goes on the first page and does not shift the pages after it
+        self.create_order()
+
+        ids = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids += [order_data['id'] for order_data in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(ids, expected)
+
+    def test_page_size_is_bounded(self):
+        self.assertEqual(len(self.client.get('/orders/', {'page_size': 0}).data['results']), 1)
+        self.assertEqual(len(self.client.get('/orders/', {'page_size': 'many'}).data['results']), 5)
+
+    def test_invalid_cursor(self):
+        for position in (b'not json', b'[1]', b'["yesterday", 1]'):
+            cursor = base64.urlsafe_b64encode(position).decode('ascii')
+            self.assertEqual(self.client.get('/orders/', {'cursor': cursor}).status_code, 404)
+        self.assertEqual(self.client.get('/orders/', {'cursor': '%%%'}).status_code, 404)
+
+
+class ReadModelTestCase(TestCase):
+    """Orders are enriched from the local read model fed by upstream events"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.order = Order.objects.create(user_id=7, total_amount=Decimal('20.00'), shipping_address='Somewhere')
+        for product_id in (1, 2):
+            OrderItem.objects.create(order=self.order, product_id=product_id, quantity=1, price=Decimal('10.00'))
+
+        apply_events('user', [
+            {'id': 1, 'event_type': 'user.created', 'aggregate_id': 7,
+             'payload': {'user': {'id': 7, 'username': 'alice'}, 'phone': '', 'address': ''}},
+            {'id': 2, 'event_type': 'user.profile_updated', 'aggregate_id': 7,
+             'payload': {'user': {'id': 7, 'username': 'alice'}, 'phone': '123', 'address': ''}},
+        ])
+        apply_events('product', [
+            {'id': 1, 'event_type': 'product.created', 'aggregate_id': 1,
+             'payload': {'id': 1, 'name': 'Lamp', 'price': '10.00', 'is_active': True}},
+            {'id': 2, 'event_type': 'product.created', 'aggregate_id': 2,
+             'payload': {'id': 2, 'name': 'Desk', 'price': '10.00', 'is_active': True}},
+            {'id': 3, 'event_type': 'product.renamed', 'aggregate_id': 1,
+             'payload': {'id': 1, 'name': 'Desk lamp', 'price': '10.00', 'is_active': True}},
+            {'id': 4, 'event_type': 'product.archived', 'aggregate_id': 2, 'payload': {}},  # unknown type
+        ])
+
+    def test_events_applied_once(self):
+        self.assertEqual(EventCursor.objects.get(source='product').last_event_id, 4)
+        self.assertEqual(ProductSnapshot.objects.get(product_id=1).name, 'Desk lamp')
+        self.assertEqual(UserSnapshot.objects.get(user_id=7).profile['phone'], '123')
+
+        # Replaying an already applied event changes nothing
+        applied = apply_events('product', [
+            {'id': 1, 'event_type': 'product.created', 'aggregate_id': 1,
+             'payload': {'id': 1, 'name': 'Lamp', 'price': '10.00', 'is_active': True}},
+        ])
+        self.assertEqual(applied, 0)
+        self.assertEqual(ProductSnapshot.objects.get(product_id=1).name, 'Desk lamp')
+
+    def test_enrichment_without_network_calls(self):
+        with mock.patch.object(ExternalServiceClient, 'get_users_info') as get_users, \
+                mock.patch.object(ExternalServiceClient, 'get_products_info') as get_products:
+            response = self.client.get(f'/orders/{self.order.id}/')
+        get_users.assert_not_called()
+        get_products.assert_not_called()
+        self.assertEqual(response.data['user_info']['phone'], '123')
+        self.assertEqual([item['product_name'] for item in response.data['items']], ['Desk lamp', 'Desk'])
+        self.assertNotIn('X-Enrichment-Degraded', response)
+
+    def test_unavailable_products_are_not_fetched(self):
+        apply_events('product', [
+            {'id': 5, 'event_type': 'product.availability_changed', 'aggregate_id': 2,
+             'payload': {'id': 2, 'name': 'Desk', 'price': '10.00', 'is_active': False}},
+        ])
+        with mock.patch.object(ExternalServiceClient, 'get_products_info') as get_products:
+            response = self.client.get(f'/orders/{self.order.id}/')
+        get_products.assert_not_called()
+        self.assertEqual([item.get('product_name') for item in response.data['items']], ['Desk lamp', ''])
+
+
+class StoredProductNameTestCase(TestCase):
+    """Items keep the product name they were ordered under"""
+
+    def test_stored_names_are_not_looked_up(self):
+        order = Order.objects.create(user_id=1, total_amount=Decimal('20.00'), shipping_address='Somewhere')
+        OrderItem.objects.create(order=order, product_id=1, product_name='Lamp', category_name='Home',
+                                 quantity=1, price=Decimal('10.00'))
+        OrderItem.objects.create(order=order, product_id=2, quantity=1, price=Decimal('10.00'))
+        apply_events('product', [
+            {'id': 1, 'event_type': 'product.created', 'aggregate_id': 1,
+             'payload': {'id': 1, 'name': 'Desk lamp', 'price': '10.00', 'is_active': True}},
+        ])
+
+        with mock.patch.object(ExternalServiceClient, 'get_users_info', return_value=CacheResult()), \
+                mock.patch.object(ExternalServiceClient, 'get_products_info', return_value=CacheResult()) as get_products:
+            response = APIClient().get(f'/orders/{order.id}/')
+        get_products.assert_called_once_with({2})
+        self.assertEqual(response.data['items'][0]['product_name'], 'Lamp')
+        self.assertEqual(response.data['items'][0]['category_name'], 'Home')
+
+
+@override_settings(ENRICHMENT_READ_MODEL=False)
+class EnrichmentTestCase(TestCase):
+    """A page of orders is enriched with one lookup per upstream service"""
+
+    def setUp(self):
+        self.client = APIClient()
+        for user_id, product_ids in ((1, (3, 4)), (2, (4, 5)), (1, (5,))):
+            order = Order.objects.create(user_id=user_id, total_amount=Decimal('10.00'), shipping_address='Somewhere')
+            for product_id in product_ids:
+                OrderItem.objects.create(order=order, product_id=product_id, quantity=1, price=Decimal('10.00'))
+        self.users = CacheResult()
+        self.users.update({user_id: {'user': {'id': user_id, 'username': name}}
+                           for user_id, name in ((1, 'alice'), (2, 'bob'))})
+        self.products = CacheResult()
+        self.products.update({product_id: {'id': product_id, 'name': name}
+                              for product_id, name in ((3, 'Lamp'), (4, 'Desk'), (5, 'Chair'))})
+
+    def test_one_lookup_per_service_for_a_page(self):
+        with mock.patch.object(ExternalServiceClient, 'get_users_info', return_value=self.users) as get_users, \
+                mock.patch.object(ExternalServiceClient, 'get_products_info', return_value=self.products) as get_products:
+            response = self.client.get('/orders/')
+        get_users.assert_called_once_with({1, 2})
+        get_products.assert_called_once_with({3, 4, 5})
+        orders_data = sorted(response.data['results'], key=lambda order_data: order_data['id'])
+        self.assertEqual([order_data['user_info']['user']['username'] for order_data in orders_data],
+                         ['alice', 'bob', 'alice'])
+        self.assertEqual([[item['product_name'] for item in order_data['items']] for order_data in orders_data],
+                         [['Lamp', 'Desk'], ['Desk', 'Chair'], ['Chair']])
+        self.assertNotIn('X-Enrichment-Degraded', response)
+
+    @override_settings(ENRICHMENT_DEADLINE=0.2)
+    def test_lookups_run_together_under_a_deadline(self):
+        both_started = threading.Barrier(2, timeout=1)
+        product_service_answers = threading.Event()
+        self.addCleanup(product_service_answers.set)
+
+        def get_users_info(user_ids):
+            both_started.wait()
+            return self.users
+
+        def get_products_info(product_ids):
+            both_started.wait()
+            product_service_answers.wait(5)
+            return self.products
+
+        with mock.patch.object(ExternalServiceClient, 'get_users_info', side_effect=get_users_info), \
+                mock.patch.object(ExternalServiceClient, 'get_products_info', side_effect=get_products_info):
+            started = time.monotonic()
+            response = self.client.get('/orders/')
+            elapsed = time.monotonic() - started
+        self.assertLess(elapsed, 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Enrichment-Degraded'], 'products')
+        self.assertTrue(all(order_data['user_info'] for order_data in response.data['results']))
+        self.assertFalse(any(item.get('product_name')
+                             for order_data in response.data['results'] for item in order_data['items']))
+
+
+class OrderPlacementSagaTestCase(TestCase):
+    """POST /orders/ holds stock, stores the order and confirms the hold, compensating on failure"""
+
+    def setUp(self):
+        self.client = APIClient()
+        for method, value in (
+            ('get_user_info', {'user': {'id': 1, 'username': 'alice'}}),
+            ('reserve_stock', {'success': True, 'items': [
+                {'product_id': 3, 'product_name': 'Lamp', 'category_name': 'Home', 'price': '12.00', 'quantity': 2},
+            ]}),
+            ('confirm_reservation', True),
+            ('release_stock', True),
+        ):
+            patcher = mock.patch.object(ExternalServiceClient, method, return_value=value)
+            setattr(self, method, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def create_order(self, shipping_address='Somewhere', **extra):
+        return self.client.post('/orders/', {
+            'user_id': 1, 'shipping_address': shipping_address,
+            'items': [{'product_id': 3, 'quantity': 2, 'price': '10.00'}],
+        }, format='json', **extra)
+
+    def test_placed(self):
+        response = self.create_order()
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual((order.status, order.total_amount), ('confirmed', Decimal('24.00')))
+        self.assertEqual(self.reserve_stock.call_args.kwargs['reservation_id'], order.reservation_id)
+        self.confirm_reservation.assert_called_once_with(order.reservation_id)
+        self.release_stock.assert_not_called()
+
+    def test_out_of_stock(self):
+        self.reserve_stock.return_value = {'success': False, 'error': 'Insufficient stock for product 3'}
+        response = self.create_order()
+        self.assertEqual((response.status_code, response.data['error']), (400, 'Insufficient stock for product 3'))
+        self.assertFalse(Order.objects.exists())
+        self.release_stock.assert_not_called()
+
+        self.reserve_stock.return_value = None
+        self.assertEqual(self.create_order().status_code, 503)
+
+    def test_idempotency_key(self):
+        first, replay = [self.create_order(HTTP_IDEMPOTENCY_KEY='order-1') for _ in range(2)]
+        self.assertEqual((replay.status_code, replay.data), (201, first.data))
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.reserve_stock.assert_called_once()
+        # The key is the reservation ID, so even a retry after the stored response expired finds the order
+        self.assertEqual(Order.objects.get().reservation_id, 'order-1')
+        IdempotencyRecord.objects.update(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        self.assertEqual(self.create_order(HTTP_IDEMPOTENCY_KEY='order-1').data['id'], first.data['id'])
+
+        response = self.create_order('Elsewhere', HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_hold_released_when_order_cannot_be_stored(self):
+        with mock.patch.object(OrderCreateSerializer, 'save', side_effect=DatabaseError('disk full')):
+            response = self.create_order()
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Order.objects.exists())
+        reservation_id = self.reserve_stock.call_args.kwargs['reservation_id']
+        self.release_stock.assert_called_once_with(reservation_id=reservation_id)
+
+    def test_cancelled_when_hold_cannot_be_confirmed(self):
+        self.confirm_reservation.return_value = False
+        response = self.create_order()
+        self.assertEqual(response.status_code, 503)
+        order = Order.objects.get()
+        self.assertEqual(order.status, 'cancelled')
+        self.assertEqual(order.failure_reason, 'Could not confirm stock reservation, order was cancelled')
+        self.release_stock.assert_called_once_with(reservation_id=order.reservation_id)
+
+
+class AsyncOrderCreationTestCase(TestCase):
+    """POST /orders/ with Prefer: respond-async stores the order and leaves the rest to the worker"""
+
+    def setUp(self):
+        self.client = APIClient()
+        users = CacheResult()
+        users[1] = {'user': {'id': 1, 'username': 'alice'}}
+        for method, value in (
+            ('get_users_info', users),
+            ('reserve_stock', {'success': True, 'items': [
+                {'product_id': 3, 'product_name': 'Lamp', 'category_name': 'Home', 'price': '12.00', 'quantity': 2},
+            ]}),
+            ('confirm_reservation', True),
+            ('release_stock', True),
+        ):
+            patcher = mock.patch.object(ExternalServiceClient, method, return_value=value)
+            setattr(self, method, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def create_order(self):
+        with mock.patch('orders.worker.enqueue') as enqueue:
+            response = self.client.post('/orders/', {
+                'user_id': 1, 'shipping_address': 'Somewhere',
+                'items': [{'product_id': 3, 'quantity': 2, 'price': '10.00'}],
+            }, format='json', HTTP_PREFER='respond-async')
+        enqueue.assert_called_once_with(response.data['id'])
+        return response
+
+    def test_accepted_then_confirmed(self):
+        response = self.create_order()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Location'], response.data['status_url'])
+        self.reserve_stock.assert_not_called()
+        self.assertEqual(self.client.get(response.data['status_url']).data['status'], 'pending')
+
+        process_order(response.data['id'])
+
+        order = Order.objects.get(id=response.data['id'])
+        self.assertEqual(order.status, 'confirmed')
+        self.assertEqual(order.total_amount, Decimal('24.00'))
+        self.assertEqual(order.items.get().product_name, 'Lamp')
+        self.confirm_reservation.assert_called_once_with(order.reservation_id)
+
+    def test_replay_keeps_headers(self):
+        payload = {'user_id': 1, 'shipping_address': 'Somewhere',
+                   'items': [{'product_id': 3, 'quantity': 2, 'price': '10.00'}]}
+        with mock.patch('orders.worker.enqueue') as enqueue:
+            first, replay = [
+                self.client.post('/orders/', payload, format='json', HTTP_PREFER='respond-async',
+                                 HTTP_IDEMPOTENCY_KEY='accept-once')
+                for _ in range(2)
+            ]
+        enqueue.assert_called_once()
+        self.assertEqual((replay.status_code, replay.data), (202, first.data))
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay['Location'], first['Location'])
+        self.assertEqual(replay['Preference-Applied'], 'respond-async')
+
+    def test_cancelled_while_confirming(self):
+        order_id = self.create_order().data['id']
+
+        def confirm_reservation(reservation_id):
+            # Cancelled after the worker checked the order, before it marked it confirmed
+            self.assertEqual(self.client.post(f'/orders/{order_id}/cancel/').status_code, 200)
+            return True
+
+        self.confirm_reservation.side_effect = confirm_reservation
+        process_order(order_id)
+
+        order = Order.objects.get(id=order_id)
+        self.assertEqual(order.status, 'cancelled')
+        # The cancellation's release may have come before the hold; the worker releases again
+        self.assertEqual(self.release_stock.call_args_list[-1], mock.call(reservation_id=order.reservation_id))
+        self.assertEqual(self.release_stock.call_count, 2)
+
+    def test_cancel_releases_again_after_confirmation(self):
+        order_id = self.create_order().data['id']
+        process = []
+
+        def release_stock(*args, **kwargs):
+            if not process:
+                # The worker confirms the order between the release and the status change
+                process.append(process_order(order_id))
+            return True
+
+        self.release_stock.side_effect = release_stock
+        response = self.client.post(f'/orders/{order_id}/cancel/')
+
+        self.assertEqual(response.data['status'], 'cancelled')
+        self.confirm_reservation.assert_called_once()
+        self.assertEqual(self.release_stock.call_count, 2)
+
+    def test_cancelled_when_out_of_stock(self):
+        self.reserve_stock.return_value = {'success': False, 'error': 'Insufficient stock for product 3'}
+        order_id = self.create_order().data['id']
+
+        process_order(order_id)
+
+        status_data = self.client.get(f'/orders/{order_id}/status/').data
+        self.assertEqual(status_data['status'], 'cancelled')
+        self.assertEqual(status_data['failure_reason'], 'Insufficient stock for product 3')
+
+    def test_retried_while_product_service_unavailable(self):
+        self.reserve_stock.return_value = None
+        order_id = self.create_order().data['id']
+
+        self.assertFalse(process_order(order_id, final_attempt=False))
+        self.assertEqual(Order.objects.get(id=order_id).status, 'pending')
+        self.assertTrue(process_order(order_id, final_attempt=True))
+        self.assertEqual(Order.objects.get(id=order_id).status, 'cancelled')
+
+
+class OrderCreateSerializerTestCase(TestCase):
+    def test_items_inserted_at_once(self):
+        serializer = OrderCreateSerializer(data={
+            'user_id': 1, 'shipping_address': 'Somewhere',
+            'items': [{'product_id': product_id, 'quantity': 2, 'price': '2.50'} for product_id in range(1, 51)],
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        StatusCount.objects.create(status='pending', orders=0)
+        # One INSERT for the order, one for its items and one UPDATE of the status count
+        with self.assertNumQueries(3):
+            order = serializer.save()
+        self.assertEqual(order.total_amount, Decimal('250.00'))
+        self.assertEqual(order.items.count(), 50)
+
+
+@override_settings(ORDER_EXPORT_BATCH_SIZE=4)
+class OrderExportTestCase(TestCase):
+    """GET /orders/export/ streams every order, enriched a batch at a time"""
+
+    def setUp(self):
+        for day in range(1, 11):
+            order = Order.objects.create(user_id=1, total_amount=Decimal('20.00'), shipping_address='Somewhere')
+            OrderItem.objects.create(order=order, product_id=3, product_name='Lamp', category_name='Home',
+                                     quantity=2, price=Decimal('10.00'))
+            Order.objects.filter(pk=order.pk).update(created_at=datetime(2025, 1, day, 12, tzinfo=timezone.utc))
+        users = CacheResult()
+        users[1] = {'user': {'id': 1, 'username': 'alice'}}
+        patcher = mock.patch.object(ExternalServiceClient, 'get_users_info', return_value=users)
+        self.get_users_info = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_ndjson(self):
+        response = self.client.get('/orders/export/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        orders = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([order['id'] for order in orders], sorted(order['id'] for order in orders))
+        self.assertEqual(len(orders), 10)
+        self.assertEqual(orders[0]['user_info']['user']['username'], 'alice')
+        self.assertEqual(orders[0]['items'][0]['product_name'], 'Lamp')
+        # One lookup per batch of 4 orders
+        self.assertEqual(self.get_users_info.call_count, 3)
+
+    def test_csv_between_dates(self):
+        response = self.client.get('/orders/export/', {'format': 'csv', 'since': '2025-01-03',
+                                                       'until': '2025-01-05T12:00:00Z'})
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['created_at'][:10] for row in rows], ['2025-01-03', '2025-01-04'])
+        self.assertEqual((rows[0]['username'], rows[0]['product_name'], rows[0]['price']), ('alice', 'Lamp', '10.00'))
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/orders/export/', {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/orders/export/', {'since': 'yesterday'}).status_code, 400)
+
+
+@override_settings(ORDER_CHANGES_SETTLE=0, ORDER_CHANGES_POLL_INTERVAL=0.01)
+class OrderChangesTestCase(TestCase):
+    """GET /orders/changes/ returns each created or updated order once, after the cursor"""
+
+    def setUp(self):
+        patcher = mock.patch.object(ExternalServiceClient, 'get_users_info', return_value=CacheResult())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_order(self):
+        return Order.objects.create(user_id=1, total_amount=Decimal('20.00'), shipping_address='Somewhere')
+
+    def poll(self, url='/orders/changes/', **params):
+        for name, value in params.items():  # Added to the cursor of a next link
+            url = replace_query_param(url, name, value)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_follows_creates_and_updates(self):
+        orders = [self.create_order() for _ in range(3)]
+        page = self.poll(page_size=2)
+        self.assertEqual([order['id'] for order in page['results']], [orders[0].id, orders[1].id])
+        self.assertTrue(page['has_more'])
+        page = self.poll(page['next'])
+        self.assertEqual([order['id'] for order in page['results']], [orders[2].id])
+        self.assertFalse(page['has_more'])
+
+        # Nothing new: the same cursor again
+        empty = self.poll(page['next'])
+        self.assertEqual((empty['results'], empty['next']), ([], page['next']))
+
+        change_status(Order.objects.filter(pk=orders[0].pk), 'shipped')
+        new_order = self.create_order()
+        page = self.poll(page['next'])
+        self.assertEqual([(order['id'], order['status']) for order in page['results']],
+                         [(orders[0].id, 'shipped'), (new_order.id, 'pending')])
+
+    def test_waits_for_changes(self):
+        page = self.poll()
+        created = []
+        with mock.patch('orders.changes.time.sleep', side_effect=lambda seconds: created.append(self.create_order())):
+            page = self.poll(page['next'], wait=5)
+        self.assertEqual([order['id'] for order in page['results']], [created[0].id])
+
+        # Nothing arrives: empty once the wait is over
+        page = self.poll(page['next'], wait=0.05)
+        self.assertEqual(page['results'], [])
+
+    @override_settings(ORDER_CHANGES_SETTLE=60)
+    def test_recent_changes_settle_first(self):
+        order = self.create_order()
+        self.assertEqual(self.poll()['results'], [])
+        Order.objects.filter(pk=order.pk).update(updated_at=order.updated_at - timedelta(minutes=2))
+        self.assertEqual([result['id'] for result in self.poll()['results']], [order.id])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/orders/changes/', {'wait': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get('/orders/changes/', {'wait': '-1'}).status_code, 400)
+        self.assertEqual(self.client.get('/orders/changes/', {'cursor': 'nonsense'}).status_code, 404)
+
+
+class RollupsTestCase(TestCase):
+    """The analytics rollups follow every order write and match a rebuild from scratch"""
+
+    def setUp(self):
+        self.client = APIClient()
+        for method in ('get_users_info', 'get_products_info'):
+            patcher = mock.patch.object(ExternalServiceClient, method, return_value=CacheResult())
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(ExternalServiceClient, 'release_stock', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_order(self, user_id, *items):
+        serializer = OrderCreateSerializer(data={'user_id': user_id, 'shipping_address': 'Somewhere', 'items': [
+            {'product_id': product_id, 'quantity': quantity, 'price': price} for product_id, quantity, price in items
+        ]})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def rollups(self):
+        # Rows counting nothing are left behind by changes, but not created by a rebuild
+        return [sorted(model.objects.exclude(**{field: 0}).values_list())
+                for model, field in ((StatusCount, 'orders'), (TotalSales, 'orders'), (DailySales, 'orders'),
+                                     (ProductSales, 'quantity'), (UserSales, 'orders'))]
+
+    def test_follow_orders_and_match_rebuild(self):
+        self.assertEqual(self.client.get('/api/analytics/summary/').data['revenue'], '0.00')
+        first = self.create_order(1, (3, 2, '10.00'), (4, 1, '5.00'))
+        second = self.create_order(1, (3, 1, '10.00'))
+        third = self.create_order(2, (4, 4, '5.00'))
+        pending = self.create_order(2, (5, 1, '1.00'))
+        self.assertEqual(change_status(Order.objects.filter(pk__in=[first.pk, second.pk, third.pk]), 'confirmed'), 3)
+
+        self.assertEqual(self.client.post(f'/orders/{second.pk}/cancel/').status_code, 200)
+        self.client.patch(f'/orders/{third.pk}/', {'status': 'shipped'}, format='json')
+        self.client.delete(f'/orders/{pending.pk}/')
+
+        summary = self.client.get('/api/analytics/summary/').data
+        self.assertEqual(summary['orders_by_status'], {'confirmed': 1, 'cancelled': 1, 'shipped': 1})
+        self.assertEqual((summary['sold_orders'], summary['revenue']), (2, '45.00'))
+        self.assertEqual(TotalSales.objects.get().orders, 2)
+        products = self.client.get('/api/analytics/top-products/', {'limit': 1}).data
+        self.assertEqual([(product['product_id'], product['quantity']) for product in products], [(4, 5)])
+        self.assertEqual(self.client.get('/api/analytics/users/1/').data['revenue'], '25.00')
+        self.assertEqual(self.client.get('/api/analytics/users/9/').data['orders'], 0)
+        days = self.client.get('/api/analytics/revenue/').data
+        self.assertEqual([(day['orders'], day['revenue']) for day in days], [(2, '45.00')])
+
+        incremental = self.rollups()
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_backfilled_names_reach_the_rollups(self):
+        order = self.create_order(1, (3, 2, '10.00'))
+        order.items.update(product_name='')
+        change_status(Order.objects.filter(pk=order.pk), 'confirmed')
+        self.assertEqual(ProductSales.objects.get(product_id=3).product_name, '')
+
+        products = CacheResult()
+        products[3] = {'id': 3, 'name': 'Lamp', 'category': {'name': 'Home'}}
+        with mock.patch.object(ExternalServiceClient, 'get_products_info', return_value=products):
+            call_command('backfill_product_names', stdout=StringIO())
+        self.assertEqual(order.items.get().category_name, 'Home')
+        self.assertEqual(ProductSales.objects.get(product_id=3).product_name, 'Lamp')
+
+
+class BulkOrderCreationTestCase(TestCase):
+    """POST /orders/bulk/ places every order of a batch with one upstream call per step"""
+
+    def setUp(self):
+        self.client = APIClient()
+        users = CacheResult()
+        users[1] = {'user': {'id': 1, 'username': 'alice'}}
+
+        def reserve_stock_batch(reservations, ttl=None):
+            # Product 4 is out of stock
+            return {
+                reservation_id: {'success': False, 'error': 'Insufficient stock for product 4'}
+                if any(item['product_id'] == 4 for item in items) else
+                {'success': True, 'items': [
+                    {'product_id': item['product_id'], 'product_name': f"Product {item['product_id']}",
+                     'category_name': 'Home', 'price': '12.00', 'quantity': item['quantity']}
+                    for item in items
+                ]}
+                for reservation_id, items in reservations.items()
+            }
+
+        for method, value in (
+            ('get_users_info', mock.Mock(return_value=users)),
+            ('reserve_stock_batch', mock.Mock(side_effect=reserve_stock_batch)),
+            ('confirm_reservations', mock.Mock(side_effect=set)),
+            ('release_reservations', mock.Mock(return_value=True)),
+        ):
+            patcher = mock.patch.object(ExternalServiceClient, method, new=value)
+            setattr(self, method, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def order(self, user_id=1, product_id=3, **extra):
+        return {'user_id': user_id, 'shipping_address': 'Somewhere',
+                'items': [{'product_id': product_id, 'quantity': 2, 'price': '10.00'}], **extra}
+
+    def place(self, *orders):
+        return self.client.post('/orders/bulk/', {'orders': list(orders)}, format='json')
+
+    def test_results_per_order(self):
+        response = self.place(self.order(), self.order(user_id=2), self.order(product_id=4),
+                              {'user_id': 1}, self.order(product_id=5))
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], [201, 400, 400, 400, 201])
+        self.assertEqual(results[1]['error'], 'User not found')
+        self.assertEqual(results[2]['error'], 'Insufficient stock for product 4')
+        self.assertIn('items', results[3]['errors'])
+        self.assertEqual(results[4]['order']['user_info']['user']['username'], 'alice')
+
+        self.get_users_info.assert_called_once()
+        self.reserve_stock_batch.assert_called_once()
+        self.confirm_reservations.assert_called_once()
+        self.assertEqual(len(self.reserve_stock_batch.call_args.args[0]), 3)
+        order = Order.objects.get(id=results[0]['order']['id'])
+        self.assertEqual(order.status, 'confirmed')
+        self.assertEqual(order.total_amount, Decimal('24.00'))
+        self.assertEqual(order.items.get().product_name, 'Product 3')
+
+    def test_queries_do_not_grow_with_batch_size(self):
+        self.place(self.order())  # Creates the rollup rows
+        counts = []
+        for size in (2, 20):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.place(*(self.order() for _ in range(size)))
+            self.assertEqual({result['status'] for result in response.data['results']}, {201})
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_retry_returns_placed_orders(self):
+        first = self.place(self.order(idempotency_key='import-1'), self.order(idempotency_key='import-2'))
+        second = self.place(self.order(idempotency_key='import-1'), self.order(idempotency_key='import-2'))
+        self.assertEqual([result['status'] for result in second.data['results']], [200, 200])
+        self.assertEqual([result['order']['id'] for result in second.data['results']],
+                         [result['order']['id'] for result in first.data['results']])
+        self.reserve_stock_batch.assert_called_once()
+        self.assertEqual(Order.objects.count(), 2)
+
+        repeated = self.place(self.order(idempotency_key='import-3'), self.order(idempotency_key='import-3'))
+        self.assertEqual([result['status'] for result in repeated.data['results']], [201, 400])
+
+    def test_unconfirmed_orders_are_cancelled(self):
+        self.confirm_reservations.side_effect = lambda reservation_ids: set(reservation_ids[:1])
+        results = self.place(self.order(), self.order()).data['results']
+        self.assertEqual([result['status'] for result in results], [201, 503])
+        cancelled = Order.objects.get(status='cancelled')
+        self.release_reservations.assert_called_once_with([cancelled.reservation_id])
+
+    def test_product_service_unavailable(self):
+        self.reserve_stock_batch.side_effect = None
+        self.reserve_stock_batch.return_value = None
+        results = self.place(self.order(), self.order()).data['results']
+        self.assertEqual([result['status'] for result in results], [503, 503])
+        self.assertFalse(Order.objects.exists())
+
+
+class UpstreamPoolTestCase(TestCase):
+    """Calls to another service reuse one pooled session per service and are counted"""
+
+    def setUp(self):
+        reset_pools()
+        self.addCleanup(reset_pools)
+
+    def test_requests_share_the_session(self):
+        pool = UpstreamPool('user', 'http://users.test/', max_connections=2, connect_timeout=0.5, read_timeout=3.0)
+        with mock.patch.object(pool.session, 'request', return_value=http_response(200, {})) as request:
+            pool.get('/api/user/1/')
+            pool.post('/api/verify/', json={})
+        self.assertEqual(request.call_args_list, [
+            mock.call('GET', 'http://users.test/api/user/1/', timeout=(0.5, 3.0)),
+            mock.call('POST', 'http://users.test/api/verify/', json={}, timeout=(0.5, 3.0)),
+        ])
+        stats = pool.stats()
+        self.assertEqual((stats['requests'], stats['active_connections'], stats['max_connections']), (2, 0, 2))
+
+    def test_one_pool_per_upstream(self):
+        self.assertIs(get_pool('product'), get_pool('product'))
+        self.assertIsNot(get_pool('product'), get_pool('user'))
+
+    def test_metrics(self):
+        with mock.patch.object(get_pool('product').session, 'request', return_value=http_response(200, {})):
+            get_pool('product').get('/api/product/1/')
+        response = APIClient().get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['pools']), {'product'})
+        self.assertEqual(response.data['pools']['product']['requests'], 1)
+        self.assertEqual(response.data['pools']['product']['circuit_breaker']['state'], 'closed')
+        self.assertIn('window_retries', response.data['retry_budget'])
+
+
+class CircuitBreakerTestCase(TestCase):
+    """Upstream calls are rejected locally while their service keeps failing or is saturated"""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('orders.resilience.time')
+        patcher.start().monotonic.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('test', window_size=4, minimum_calls=4, failure_rate=0.5,
+                                      slow_call_duration=1.0, slow_call_rate=0.75, open_duration=10.0)
+
+    def test_opens_when_calls_fail(self):
+        for success in (True, False, True):
+            self.breaker.before_call()
+            self.breaker.record(success, 0.1)
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.record(False, 0.1)
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertFalse(self.breaker.allows_requests())
+        with self.assertRaises(UpstreamUnavailable):
+            self.breaker.before_call()
+        self.assertEqual((self.breaker.stats()['times_opened'], self.breaker.stats()['rejected_calls']), (1, 1))
+
+    def test_opens_when_calls_are_slow(self):
+        for duration in (0.1, 1.0, 2.0, 3.0):
+            self.breaker.record(True, duration)
+        self.assertEqual(self.breaker.state, 'open')
+
+    def test_trial_call_after_cool_down(self):
+        for _ in range(4):
+            self.breaker.record(False, 0.1)
+        self.now += 10
+        self.assertEqual(self.breaker.state, 'half_open')
+        self.breaker.before_call()
+        with self.assertRaises(UpstreamUnavailable):
+            self.breaker.before_call()
+        # A failed trial opens it again, a successful one closes it
+        self.breaker.record(False, 0.1)
+        self.assertEqual(self.breaker.state, 'open')
+        self.now += 10
+        self.breaker.before_call()
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertEqual(self.breaker.stats()['window_calls'], 0)
+
+    def test_open_breaker_skips_the_upstream(self):
+        pool = UpstreamPool('user', 'http://users.test', breaker=self.breaker)
+        with mock.patch.object(pool.session, 'request', return_value=http_response(503)) as request:
+            for _ in range(4):
+                self.assertEqual(pool.get('/api/user/1/').status_code, 503)
+            with self.assertRaises(UpstreamUnavailable):
+                pool.get('/api/user/1/')
+        self.assertEqual(request.call_count, 4)
+
+    @override_settings(ENRICHMENT_READ_MODEL=False)
+    def test_orders_are_served_degraded_while_open(self):
+        for reset in (reset_pools, reset_caches):
+            reset()
+            self.addCleanup(reset)
+        order = Order.objects.create(user_id=1, total_amount=Decimal('10.00'), shipping_address='Somewhere')
+        breaker = get_pool('user').breaker
+        for _ in range(breaker.minimum_calls):
+            breaker.record(False, 0.1)
+
+        with mock.patch.object(get_pool('user').session, 'request') as request:
+            response = APIClient().get(f'/orders/{order.id}/')
+        request.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Enrichment-Degraded'], 'users')
+        self.assertIsNone(response.data['user_info'])
+
+    def test_bulkhead_rejects_calls_beyond_the_pool(self):
+        pool = UpstreamPool('user', 'http://users.test', max_connections=1, max_wait=0.01)
+        in_call = threading.Event()
+        answer = threading.Event()
+        self.addCleanup(answer.set)
+
+        def slow_request(*args, **kwargs):
+            in_call.set()
+            answer.wait(2)
+            return http_response(200, {})
+
+        with mock.patch.object(pool.session, 'request', side_effect=slow_request):
+            first = threading.Thread(target=pool.get, args=('/api/user/1/',))
+            first.start()
+            in_call.wait(2)
+            with self.assertRaises(UpstreamUnavailable):
+                pool.get('/api/user/2/')
+            answer.set()
+            first.join(2)
+            self.assertEqual(pool.get('/api/user/2/').status_code, 200)
+        self.assertEqual(pool.stats()['bulkhead_rejections'], 1)
+
+
+class RetryTestCase(TestCase):
+    """Transient upstream failures are retried with backoff, within the retry budget"""
+
+    def setUp(self):
+        reset_pools()
+        self.addCleanup(reset_pools)
+        patcher = mock.patch('orders.http_client.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_backoff_grows_up_to_max_delay(self):
+        policy = RetryPolicy(max_attempts=5, base_delay=0.1, max_delay=0.3)
+        with mock.patch('orders.resilience.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([policy.delay(attempt) for attempt in range(1, 5)], [0.1, 0.2, 0.3, 0.3])
+        for attempt in range(1, 5):
+            self.assertLessEqual(policy.delay(attempt), 0.3)
+
+    def test_budget_caps_retries(self):
+        now = [1000.0]
+        with mock.patch('orders.resilience.time') as clock:
+            clock.monotonic.side_effect = lambda: now[0]
+            budget = RetryBudget(ratio=0.5, min_per_second=0, window=10)
+            for _ in range(4):
+                budget.record_request()
+            self.assertEqual([budget.try_acquire_retry() for _ in range(3)], [True, True, False])
+            # Retries and requests older than the window no longer count
+            now[0] += 10
+            self.assertFalse(budget.try_acquire_retry())
+            budget.record_request()
+            budget.record_request()
+            self.assertTrue(budget.try_acquire_retry())
+            self.assertEqual(budget.stats()['retries_denied'], 2)
+
+    def test_transient_failures_are_retried(self):
+        pool = UpstreamPool('user', 'http://users.test')
+        responses = [http_response(503), requests.ConnectionError(), http_response(200, {})]
+        with mock.patch.object(pool.session, 'request', side_effect=responses) as request:
+            response = pool.get('/api/user/1/', retry=RetryPolicy(max_attempts=3))
+        self.assertEqual((response.status_code, request.call_count), (200, 3))
+        self.assertEqual((self.sleep.call_count, pool.stats()['retries']), (2, 2))
+
+        for status_code, attempts in ((500, 1), (503, 3)):
+            with mock.patch.object(pool.session, 'request', return_value=http_response(status_code)) as request:
+                self.assertEqual(pool.get('/api/user/1/', retry=RetryPolicy(max_attempts=3)).status_code, status_code)
+            self.assertEqual(request.call_count, attempts)
+
+    def test_stock_changes_are_only_retried_when_safe(self):
+        session = get_pool('product').session
+        items = [{'product_id': 3, 'quantity': 1}]
+        with mock.patch.object(session, 'request', return_value=http_response(503)) as request:
+            self.assertIsNone(ExternalServiceClient.reserve_stock(items))
+        self.assertEqual(request.call_count, 1)
+
+        with mock.patch.object(session, 'request', return_value=http_response(503)) as request:
+            self.assertIsNone(ExternalServiceClient.reserve_stock(items, reservation_id='order-1'))
+        self.assertEqual(request.call_count, 3)
+
+        with mock.patch.object(session, 'request', return_value=http_response(503)) as request:
+            self.assertFalse(ExternalServiceClient.release_stock(items, idempotency_key='order-1-release'))
+        self.assertEqual(request.call_count, 3)
+
+
+class TTLCacheTestCase(TestCase):
+    """User and product lookups are cached with a TTL, bounded in size and loaded once"""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('orders.cache.time')
+        patcher.start().monotonic.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+        self.loads = []
+
+    def loader(self, keys):
+        self.loads.append(sorted(keys))
+        return {key: key * 10 for key in keys if key > 0}
+
+    def test_entries_expire_after_ttl(self):
+        cache = TTLCache('test', ttl=60.0)
+        self.assertEqual(cache.get(1, self.loader), 10)
+        self.now += 59
+        self.assertEqual(cache.get(1, self.loader), 10)
+        self.now += 1
+        self.assertEqual(cache.get(1, self.loader), 10)
+        self.assertEqual(self.loads, [[1], [1]])
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (1, 2))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TTLCache('test', max_entries=2)
+        cache.get_many([1, 2], self.loader)
+        cache.get(1, self.loader)
+        cache.get(3, self.loader)
+        self.assertEqual(cache.get_many([1, 2, 3], self.loader), {1: 10, 2: 20, 3: 30})
+        self.assertEqual(self.loads, [[1, 2], [3], [2]])
+        self.assertEqual(cache.stats()['evictions'], 2)
+
+    def test_not_found_is_cached_briefly(self):
+        cache = TTLCache('test', ttl=60.0, negative_ttl=5.0)
+        result = cache.get_many([-1, 1], self.loader)
+        self.assertEqual(result, {1: 10})
+        self.assertTrue(result.complete)
+        self.assertIsNone(cache.get(-1, self.loader))
+        self.now += 5
+        self.assertIsNone(cache.get(-1, self.loader))
+        self.assertEqual(self.loads, [[-1, 1], [-1]])
+
+    def test_expired_entries_are_served_while_the_upstream_fails(self):
+        cache = TTLCache('test', ttl=60.0)
+        cache.get(1, self.loader)
+        self.now += 60
+        result = cache.get_many([1, 2], lambda keys: None)
+        self.assertEqual(result, {1: 10})
+        self.assertEqual((result.stale, result.failed), ({1}, {2}))
+        self.assertEqual(cache.stats()['load_failures'], 1)
+
+    def test_concurrent_misses_share_one_load(self):
+        cache = TTLCache('test', wait_timeout=2.0)
+        loading = threading.Event()
+        finish = threading.Event()
+
+        def slow_loader(keys):
+            loading.set()
+            finish.wait(2)
+            return self.loader(keys)
+
+        def loader_then_finish(keys):
+            # Runs after this thread found key 1 being loaded and started waiting for it
+            loaded = self.loader(keys)
+            finish.set()
+            return loaded
+
+        first = threading.Thread(target=cache.get, args=(1, slow_loader))
+        first.start()
+        loading.wait(2)
+        second = []
+        waiter = threading.Thread(target=lambda: second.append(cache.get_many([1, 2], loader_then_finish)))
+        waiter.start()
+        first.join(2)
+        waiter.join(2)
+        self.assertEqual(second, [{1: 10, 2: 20}])
+        self.assertEqual(self.loads, [[2], [1]])
+        self.assertEqual(cache.stats()['coalesced'], 1)
+
+    def test_client_lookups_are_cached(self):
+        reset_caches()
+        self.addCleanup(reset_caches)
+        reset_pools()
+        self.addCleanup(reset_pools)
+        users = http_response(200, [{'user': {'id': 1, 'username': 'alice'}}])
+        with mock.patch.object(get_pool('user').session, 'request', return_value=users) as request:
+            first = ExternalServiceClient.get_users_info([1, 2])
+            second = ExternalServiceClient.get_users_info([2, 1])
+        request.assert_called_once()
+        self.assertEqual(request.call_args.kwargs['params'], {'ids': '1,2'})
+        self.assertEqual(first, {1: {'user': {'id': 1, 'username': 'alice'}}})
+        self.assertEqual(second, first)
+
+    async def test_concurrent_async_misses_share_one_load(self):
+        cache = TTLCache('test', wait_timeout=2.0)
+        loads = []
+
+        async def loader(keys):
+            loads.append(keys)
+            # Like httpx resolving a host name, the loader needs the default executor
+            await asyncio.get_running_loop().run_in_executor(None, lambda: None)
+            return {key: key * 10 for key in keys}
+
+        results = await asyncio.gather(*(cache.aget_many([1], loader) for _ in range(64)))
+        self.assertEqual(loads, [[1]])
+        self.assertTrue(all(result == {1: 10} and result.complete for result in results))
+
+
+@override_settings(ROOT_URLCONF='orders.async_urls')
+class AsyncViewsTestCase(TestCase):
+    """The async views answer like the sync ones"""
+
+    def setUp(self):
+        users = CacheResult()
+        users[1] = {'user': {'id': 1, 'username': 'alice'}}
+        for method, value in (
+            ('get_user_info', users[1]),
+            ('get_users_info', users),
+            ('get_products_info', CacheResult()),
+            ('reserve_stock', {'success': True, 'items': [
+                {'product_id': 3, 'product_name': 'Lamp', 'category_name': 'Home', 'price': '12.00', 'quantity': 2},
+            ]}),
+            ('confirm_reservation', True),
+            ('release_stock', True),
+        ):
+            patcher = mock.patch.object(AsyncExternalServiceClient, method, new=mock.AsyncMock(return_value=value))
+            setattr(self, method, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    async def test_create_list_and_cancel(self):
+        response = await self.async_client.post('/orders/', {
+            'user_id': 1, 'shipping_address': 'Somewhere',
+            'items': [{'product_id': 3, 'quantity': 2, 'price': '10.00'}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        order = response.json()
+        self.assertEqual(order['status'], 'confirmed')
+        self.assertEqual(order['total_amount'], '24.00')
+        self.assertEqual(order['user_info']['user']['username'], 'alice')
+        self.assertEqual(order['items'][0]['product_name'], 'Lamp')
+
+        response = await self.async_client.get('/orders/')
+        self.assertEqual([result['id'] for result in response.json()['results']], [order['id']])
+        self.assertEqual((await self.async_client.get(f'/orders/{order["id"]}/')).json()['user_info'],
+                         order['user_info'])
+
+        response = await self.async_client.post(f'/orders/{order["id"]}/cancel/')
+        self.assertEqual(response.json()['status'], 'cancelled')
+        self.release_stock.assert_awaited_once()
+
+    async def test_idempotency_key(self):
+        payload = {'user_id': 1, 'shipping_address': 'Somewhere',
+                   'items': [{'product_id': 3, 'quantity': 2, 'price': '10.00'}]}
+        first, replay = [
+            await self.async_client.post('/orders/', payload, content_type='application/json',
+                                         headers={'Idempotency-Key': 'place-once'})
+            for _ in range(2)
+        ]
+        self.assertEqual((first.status_code, replay.status_code), (201, 201))
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.reserve_stock.assert_awaited_once()
+
+        # Same key, different order
+        response = await self.async_client.post('/orders/', {**payload, 'shipping_address': 'Elsewhere'},
+                                                content_type='application/json',
+                                                headers={'Idempotency-Key': 'place-once'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(await Order.objects.acount(), 1)
+
+    async def test_idempotency_key_in_progress(self):
+        payload = {'user_id': 1, 'shipping_address': 'Somewhere',
+                   'items': [{'product_id': 3, 'quantity': 2, 'price': '10.00'}]}
+        repeats = []
+
+        async def reserve_stock(*args, **kwargs):
+            # The client retries while the first request still waits on Product Service
+            repeats.append(await self.async_client.post('/orders/', payload, content_type='application/json',
+                                                         headers={'Idempotency-Key': 'slow'}))
+            return {'success': True, 'items': [
+                {'product_id': 3, 'product_name': 'Lamp', 'category_name': 'Home', 'price': '12.00', 'quantity': 2},
+            ]}
+
+        self.reserve_stock.side_effect = reserve_stock
+        response = await self.async_client.post('/orders/', payload, content_type='application/json',
+                                                headers={'Idempotency-Key': 'slow'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(repeats[0].status_code, 409)
+
+    async def test_parse_error(self):
+        response = await self.async_client.post('/orders/', '{"user_id":', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+    async def test_out_of_stock(self):
+        self.reserve_stock.return_value = {'success': False, 'error': 'Insufficient stock'}
+        response = await self.async_client.post('/orders/', {
+            'user_id': 1, 'shipping_address': 'Somewhere',
+            'items': [{'product_id': 3, 'quantity': 2, 'price': '10.00'}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(await Order.objects.aexists())
+
+    async def test_export_streams(self):
+        order = await Order.objects.acreate(user_id=1, total_amount=Decimal('20.00'), shipping_address='Somewhere')
+        with mock.patch.object(ExternalServiceClient, 'get_users_info', return_value=CacheResult()):
+            response = await self.async_client.get('/orders/export/')
+            lines = [line async for line in response.streaming_content]
+        self.assertEqual([json.loads(line)['id'] for line in b''.join(lines).splitlines()], [order.id])
+
+    @override_settings(ORDER_CHANGES_SETTLE=0, ORDER_CHANGES_POLL_INTERVAL=0.01)
+    async def test_changes_wait_without_blocking(self):
+        async def create_order():
+            await asyncio.sleep(0.05)
+            return await Order.objects.acreate(user_id=1, total_amount=Decimal('20.00'), shipping_address='Somewhere')
+
+        created = asyncio.ensure_future(create_order())
+        response = await self.async_client.get('/orders/changes/', {'wait': 5})
+        order = await created
+        self.assertEqual([result['id'] for result in response.json()['results']], [order.id])
+        self.assertIn('cursor=', response.json()['next'])
+
+
+class ExplainQueriesTestCase(TestCase):
+    def test_no_endpoint_query_scans_a_whole_table(self):
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        self.assertIn('0 of ', out.getvalue().splitlines()[-1], out.getvalue())
@@ -3,6 +3,16 @@ from . import views
 
 urlpatterns = [
     path('orders/', views.OrderListCreateView.as_view(), name='order-list-create'),
+    path('orders/bulk/', views.bulk_create_orders, name='bulk-create-orders'),
+    path('orders/export/', views.export_orders, name='export-orders'),
+    path('orders/changes/', views.order_changes, name='order-changes'),
     path('orders/<int:pk>/', views.OrderDetailView.as_view(), name='order-detail'),
     path('orders/<int:order_id>/cancel/', views.cancel_order, name='cancel-order'),
+    path('orders/<int:order_id>/status/', views.order_status, name='order-status'),
+    path('api/metrics/', views.service_metrics, name='service-metrics'),
+    path('api/analytics/summary/', views.analytics_summary, name='analytics-summary'),
+    path('api/analytics/revenue/', views.analytics_revenue, name='analytics-revenue'),
+    path('api/analytics/top-products/', views.analytics_top_products, name='analytics-top-products'),
+    path('api/analytics/top-users/', views.analytics_top_users, name='analytics-top-users'),
+    path('api/analytics/users/<int:user_id>/', views.analytics_user, name='analytics-user'),
 ]
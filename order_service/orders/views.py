@@ -1,14 +1,43 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
+from django.conf import settings
 from django.db import transaction
-from .models import Order, OrderItem
-from .serializers import OrderSerializer, OrderCreateSerializer
+from django.utils.dateparse import parse_date
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+from .models import DailySales, Order, OrderItem, ProductSales, StatusCount, TotalSales, UserSales
+from .serializers import (
+    OrderSerializer, OrderCreateSerializer, DailySalesSerializer, ProductSalesSerializer, UserSalesSerializer,
+)
 from .services import ExternalServiceClient
+from .enrichment import enrich_orders, mark_degraded
+from .cache import cache_stats
+from .http_client import pool_stats, retry_budget_stats, upstream_available
+from .async_services import async_pool_stats
+from .pagination import ChangeFeedPagination, KeysetPagination
+from .idempotency import idempotent
+from .saga import OrderPlacementError, new_reservation_id, place_order
+from .bulk import place_orders
+from .export import export_stream
+from .changes import parse_wait, wait_for_changes
+from .rollups import change_status, delete_orders, record
+from .worker import store_pending_order
+
+
+def prefers_async(request):
+    """Whether the client sent ``Prefer: respond-async`` (RFC 7240)"""
+    preferences = request.headers.get('Prefer', '')
+    return any(
+        preference.split(';')[0].strip().lower() == 'respond-async'
+        for preference in preferences.split(',')
+    )
 
 
 class OrderListCreateView(generics.ListCreateAPIView):
     queryset = Order.objects.all()
+    pagination_class = KeysetPagination
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -16,7 +45,7 @@ class OrderListCreateView(generics.ListCreateAPIView):
         return OrderSerializer
     
     def get_queryset(self):
-        queryset = Order.objects.all()
+        queryset = Order.objects.prefetch_related('items')
         user_id = self.request.query_params.get('user_id')
         if user_id:
             queryset = queryset.filter(user_id=user_id)
@@ -24,132 +53,288 @@ class OrderListCreateView(generics.ListCreateAPIView):
     
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
         
-        # Enrich orders with user and product information
-        for order_data in serializer.data:
-            # Get user info
-            user_info = ExternalServiceClient.get_user_info(order_data['user_id'])
-            order_data['user_info'] = user_info
-            
-            # Get product info for each item
-            for item in order_data.get('items', []):
-                product_info = ExternalServiceClient.get_product_info(item['product_id'])
-                if product_info:
-                    item['product_name'] = product_info.get('name', 'Unknown Product')
+        # Enrich the page of orders with user and product information
+        orders_data = serializer.data
+        degraded = enrich_orders(orders_data)
         
-        return Response(serializer.data)
+        return mark_degraded(self.get_paginated_response(orders_data), degraded)
     
+    @idempotent('orders-create')
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
+        # The Idempotency-Key header also becomes the order's stock reservation ID, so a
+        # retry that arrives after the stored response expired still finds its order
+        reservation_id = request.headers.get('Idempotency-Key') or new_reservation_id()
+        if len(reservation_id) > 64:
+            return Response({'error': 'Idempotency-Key must be at most 64 characters'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        existing = Order.objects.prefetch_related('items').filter(reservation_id=reservation_id).first()
+        if existing is not None:
+            order_data = OrderSerializer(existing).data
+            return mark_degraded(Response(order_data), enrich_orders([order_data]))
+        
+        if prefers_async(request):
+            return self.create_async(request, serializer, reservation_id)
+        
         # Validate user exists
         user_info = ExternalServiceClient.get_user_info(serializer.validated_data['user_id'])
         if not user_info:
+            if not upstream_available('user'):
+                return Response({'error': 'User service unavailable'},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
             return Response({'error': 'User not found'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Validate products and stock
-        items_data = serializer.validated_data['items']
-        validated_items = []
+        # Hold stock, commit the order, confirm the hold (compensating on failure)
+        try:
+            order, _ = place_order(serializer, reservation_id)
+        except OrderPlacementError as e:
+            return Response({'error': str(e)}, status=e.status_code)
         
-        for item_data in items_data:
-            product_id = item_data['product_id']
-            quantity = item_data['quantity']
-            
-            # Check if product exists and has sufficient stock
-            stock_info = ExternalServiceClient.check_product_stock(product_id, quantity)
-            if not stock_info or not stock_info.get('available'):
-                return Response({
-                    'error': f'Product {product_id} is not available or insufficient stock'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Update price from current product price
-            item_data['price'] = stock_info['price']
-            validated_items.append(item_data)
+        # Return created order enriched with user info (product names are stored on the items)
+        order_data = OrderSerializer(order).data
+        degraded = enrich_orders([order_data], users={order.user_id: user_info})
         
-        # Create order with transaction
-        try:
-            with transaction.atomic():
-                # Create the order
-                order = serializer.save()
-                
-                # Update stock for all products
-                for item_data in validated_items:
-                    success = ExternalServiceClient.update_product_stock(
-                        item_data['product_id'], 
-                        item_data['quantity'], 
-                        'decrease'
-                    )
-                    if not success:
-                        raise Exception(f"Failed to update stock for product {item_data['product_id']}")
-                
-                # Return created order with enriched data
-                response_serializer = OrderSerializer(order)
-                order_data = response_serializer.data
-                
-                # Enrich with user info
-                order_data['user_info'] = user_info
-                
-                # Enrich items with product names
-                for i, item in enumerate(order_data['items']):
-                    product_info = ExternalServiceClient.get_product_info(item['product_id'])
-                    if product_info:
-                        item['product_name'] = product_info.get('name', 'Unknown Product')
-                
-                return Response(order_data, status=status.HTTP_201_CREATED)
-                
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return mark_degraded(Response(order_data, status=status.HTTP_201_CREATED), degraded)
+    
+    def create_async(self, request, serializer, reservation_id):
+        """Store the order as pending and leave the checks and stock to the worker (see worker.py)"""
+        order = store_pending_order(serializer, reservation_id)
+        status_url = request.build_absolute_uri(reverse('order-status', args=[order.id]))
+        return Response(
+            {'id': order.id, 'status': order.status, 'status_url': status_url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': status_url, 'Preference-Applied': 'respond-async'},
+        )
 
 
 class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Order.objects.all()
+    queryset = Order.objects.prefetch_related('items')
     serializer_class = OrderSerializer
     
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            previous = Order.objects.select_for_update().get(pk=serializer.instance.pk)
+            order = serializer.save()
+            record(removed=[previous], added=[order])
+    
+    def perform_destroy(self, instance):
+        delete_orders(Order.objects.filter(pk=instance.pk))
+    
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance)
         order_data = serializer.data
         
-        # Enrich with user info
-        user_info = ExternalServiceClient.get_user_info(order_data['user_id'])
-        order_data['user_info'] = user_info
-        
-        # Enrich items with product names
-        for item in order_data.get('items', []):
-            product_info = ExternalServiceClient.get_product_info(item['product_id'])
-            if product_info:
-                item['product_name'] = product_info.get('name', 'Unknown Product')
+        # Enrich with user info and product names
+        degraded = enrich_orders([order_data])
         
-        return Response(order_data)
+        return mark_degraded(Response(order_data), degraded)
+
+
+@api_view(['POST'])
+def bulk_create_orders(request):
+    """Place a batch of orders in one request - for B2B clients and imports (see bulk.py)
+
+    Takes ``{"orders": [...]}``, each order as for POST /orders/ plus an
+    optional ``idempotency_key``. ``results`` has one entry per order, in
+    request order, with the ``status`` it would have had from POST /orders/
+    and the created ``order`` or the ``error``.
+    """
+    raw_orders = request.data.get('orders')
+    if not isinstance(raw_orders, list) or not raw_orders:
+        return Response({'error': 'orders must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(raw_orders) > settings.BULK_ORDER_MAX_BATCH:
+        return Response({'error': f'At most {settings.BULK_ORDER_MAX_BATCH} orders can be placed at once'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    results, degraded = place_orders(raw_orders)
+    return mark_degraded(Response({'results': results}), degraded)
+
+
+@require_GET
+def export_orders(request):
+    """Stream every order as NDJSON or CSV, for analytics jobs (see export.py)
+
+    Query params: ``?format=ndjson|csv&since=2025-01-01&until=2025-02-01``
+    (``created_at`` in ``[since, until)``). A plain Django view, as DRF would
+    treat ``?format=`` as a renderer choice.
+    """
+    try:
+        chunks, content_type = export_stream(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return StreamingHttpResponse(chunks, content_type=content_type)
+
+
+@api_view(['GET'])
+def order_changes(request):
+    """Orders created or updated since a cursor, oldest change first (see changes.py)
+
+    Query params: ``?cursor=...&page_size=100&wait=30``. Start without a
+    cursor, then follow each response's ``next`` link; with ``wait`` an empty
+    page is only returned after waiting that many seconds for changes.
+    """
+    try:
+        wait = parse_wait(request.query_params.get('wait'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    paginator = ChangeFeedPagination()
+    orders_data = wait_for_changes(paginator, request, wait)
+    degraded = enrich_orders(orders_data)
+    return mark_degraded(paginator.get_paginated_response(orders_data), degraded)
+
+
+@api_view(['GET'])
+def order_status(request, order_id):
+    """Placement status of an order - poll this after an asynchronous POST /orders/"""
+    try:
+        order = Order.objects.only('id', 'status', 'failure_reason', 'updated_at').get(id=order_id)
+    except Order.DoesNotExist:
+        return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    headers = {'Retry-After': '1'} if order.status == 'pending' else None
+    return Response({
+        'id': order.id,
+        'status': order.status,
+        'failure_reason': order.failure_reason,
+        'updated_at': order.updated_at,
+        'order_url': request.build_absolute_uri(reverse('order-detail', args=[order.id])),
+    }, headers=headers)
+
+
+# Times a cancellation releases the stock again when the order moved on meanwhile
+CANCEL_ATTEMPTS = 3
+
+
+def release_order_stock(order):
+    """Give back the stock of all the order's items in one call; False if Product Service failed"""
+    if order.reservation_id:
+        return ExternalServiceClient.release_stock(reservation_id=order.reservation_id)
+    items = [{'product_id': item.product_id, 'quantity': item.quantity} for item in order.items.all()]
+    return not items or ExternalServiceClient.release_stock(items, idempotency_key=f'order-{order.id}-cancel')
 
 
 @api_view(['POST'])
 def cancel_order(request, order_id):
     """Cancel an order and restore stock"""
     try:
-        order = Order.objects.get(id=order_id)
+        order = Order.objects.prefetch_related('items').get(id=order_id)
         
         if order.status in ['delivered', 'cancelled']:
             return Response({
                 'error': 'Cannot cancel order with status: ' + order.status
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Restore stock for all items
-        for item in order.items.all():
-            ExternalServiceClient.update_product_stock(
-                item.product_id, 
-                item.quantity, 
-                'increase'
-            )
-        
-        # Update order status
-        order.status = 'cancelled'
-        order.save()
+        for _ in range(CANCEL_ATTEMPTS):
+            if not release_order_stock(order):
+                return Response({'error': 'Could not restore stock, order was not cancelled'},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            
+            # Only if its status is still the one read before the release: placement
+            # may have confirmed a pending order's hold meanwhile, so release again
+            if change_status(Order.objects.filter(pk=order.pk, status=order.status), 'cancelled'):
+                break
+            order.refresh_from_db()
+            if order.status == 'cancelled':
+                break
+            if order.status == 'delivered':
+                return Response({'error': 'Cannot cancel order with status: delivered'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response({'error': 'Order changed while it was being cancelled, try again'},
+                            status=status.HTTP_409_CONFLICT)
+        order.refresh_from_db()
         
         serializer = OrderSerializer(order)
         return Response(serializer.data)
         
     except Order.DoesNotExist:
         return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['GET'])
+def service_metrics(request):
+    """Inter-service client metrics (connection pools, circuit breakers, retries and lookup caches)"""
+    return Response({
+        'pools': pool_stats(),
+        'async_pools': async_pool_stats(),
+        'retry_budget': retry_budget_stats(),
+        'caches': cache_stats(),
+    })
+
+
+MAX_ANALYTICS_LIMIT = 100
+
+
+def parse_limit(raw_limit, default=10):
+    try:
+        limit = int(raw_limit) if raw_limit is not None else default
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if not 0 < limit <= MAX_ANALYTICS_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_ANALYTICS_LIMIT}')
+    return limit
+
+
+@api_view(['GET'])
+def analytics_summary(request):
+    """Orders per status, and sold orders and revenue overall - read from the rollups (see rollups.py)"""
+    totals = TotalSales.objects.filter(pk=1).first() or TotalSales()
+    revenue = DailySalesSerializer().fields['revenue'].to_representation(totals.revenue)
+    return Response({
+        'orders_by_status': dict(StatusCount.objects.filter(orders__gt=0).values_list('status', 'orders')),
+        'sold_orders': totals.orders,
+        'revenue': revenue,
+    })
+
+
+@api_view(['GET'])
+def analytics_revenue(request):
+    """Sold orders and revenue per day the orders were placed: ``?since=2025-01-01&until=2025-02-01``"""
+    days = DailySales.objects.filter(orders__gt=0).order_by('day')
+    for name, lookup in (('since', 'day__gte'), ('until', 'day__lt')):
+        if request.query_params.get(name):
+            try:
+                day = parse_date(request.query_params[name])
+            except ValueError:
+                day = None
+            if day is None:
+                return Response({'error': f'{name} must be a date (YYYY-MM-DD)'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            days = days.filter(**{lookup: day})
+    return Response(DailySalesSerializer(days, many=True).data)
+
+
+@api_view(['GET'])
+def analytics_top_products(request):
+    """Best selling products by units sold: ``?limit=10``"""
+    try:
+        limit = parse_limit(request.query_params.get('limit'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    products = ProductSales.objects.filter(quantity__gt=0).order_by('-quantity', 'product_id')[:limit]
+    return Response(ProductSalesSerializer(products, many=True).data)
+
+
+@api_view(['GET'])
+def analytics_top_users(request):
+    """Users with the most revenue: ``?limit=10``"""
+    try:
+        limit = parse_limit(request.query_params.get('limit'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    users = UserSales.objects.filter(orders__gt=0).order_by('-revenue', 'user_id')[:limit]
+    return Response(UserSalesSerializer(users, many=True).data)
+
+
+@api_view(['GET'])
+def analytics_user(request, user_id):
+    """Sold orders and revenue of one user"""
+    user_sales = UserSales.objects.filter(user_id=user_id).first() or UserSales(user_id=user_id)
+    return Response(UserSalesSerializer(user_sales).data)
@@ -0,0 +1,112 @@
+"""
+Background placement of orders created with ``Prefer: respond-async``.
+
+The request only stores the order as ``pending`` and answers 202; the order
+ID is then queued on an in-process thread pool, which checks the user and
+runs the rest of the saga (see ``saga.complete_pending_order``). The order
+ends up ``confirmed``, or ``cancelled`` with a ``failure_reason``.
+
+Transient failures (an upstream service unavailable) are retried with
+exponential backoff up to ``ORDER_PLACEMENT_MAX_ATTEMPTS`` times before the
+order is cancelled. Orders that were queued in a process that has since
+stopped are picked up by ``manage.py process_pending_orders``.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+
+from .http_client import upstream_available
+from .models import Order
+from .saga import OrderPlacementError, complete_pending_order, mark_cancelled
+from .services import ExternalServiceClient
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.ORDER_PLACEMENT_WORKERS,
+                    thread_name_prefix='order-placement',
+                )
+    return _executor
+
+
+def enqueue(order_id, attempt=1):
+    """Queue placement of a pending order once the current transaction commits"""
+    transaction.on_commit(lambda: _get_executor().submit(_run, order_id, attempt))
+
+
+def store_pending_order(serializer, reservation_id):
+    """Save a validated ``OrderCreateSerializer`` as a pending order and queue its placement"""
+    try:
+        with transaction.atomic():
+            order = serializer.save(reservation_id=reservation_id)
+            enqueue(order.id)
+    except IntegrityError:
+        # A concurrent request with the same Idempotency-Key stored it first
+        order = Order.objects.get(reservation_id=reservation_id)
+    return order
+
+
+def _retry_later(order_id, attempt):
+    delay = settings.ORDER_PLACEMENT_RETRY_DELAY * 2 ** (attempt - 1)
+    timer = threading.Timer(delay, lambda: _get_executor().submit(_run, order_id, attempt + 1))
+    timer.daemon = True
+    timer.start()
+
+
+def _run(order_id, attempt):
+    close_old_connections()
+    try:
+        if not process_order(order_id, final_attempt=attempt >= settings.ORDER_PLACEMENT_MAX_ATTEMPTS):
+            _retry_later(order_id, attempt)
+    except Exception:
+        logger.exception('Placing order %s failed', order_id)
+    finally:
+        close_old_connections()
+
+
+def process_order(order_id, final_attempt=True):
+    """Place a pending order. Returns False if it should be retried later.
+
+    Unless ``final_attempt`` is False, transient failures cancel the order
+    instead of asking for a retry.
+    """
+    order = Order.objects.filter(pk=order_id, status='pending').first()
+    if order is None:
+        return True
+
+    def transient_failure(reason):
+        if final_attempt:
+            mark_cancelled(order, reason)
+            return True
+        return False
+
+    users = ExternalServiceClient.get_users_info([order.user_id])
+    if not users.get(order.user_id):
+        if order.user_id in users.failed or not upstream_available('user'):
+            return transient_failure('User service unavailable')
+        mark_cancelled(order, 'User not found')
+        return True
+
+    try:
+        complete_pending_order(order)
+    except OrderPlacementError as e:
+        if e.status_code == 409:
+            return True  # Cancelled while we were working on it
+        if e.status_code == 503 and order.status == 'pending':
+            return transient_failure(str(e))
+        mark_cancelled(order, str(e))
+    return True
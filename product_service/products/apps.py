@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+from .db import configure_sqlite
 
 
 class ProductsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "products"
+
+    def ready(self):
+        connection_created.connect(configure_sqlite, dispatch_uid='products.configure_sqlite')
+        from . import events, response_cache, search  # connect their signal handlers
+        post_migrate.connect(search.create_search_index, sender=self)
@@ -0,0 +1,126 @@
+"""
+Product change events for other services (transactional outbox).
+
+Signal handlers record the product changes other services keep copies of in
+the ``OutboxEvent`` table, inside the transaction that makes the change
+(``Product.save`` is atomic, as are deletes), so an event exists if and only if
+the change committed. Consumers read the events in order from
+``GET /api/events/?after=<last event ID seen>&consumer=<name>``; events are
+served once settled (see ``settled_events``), and ``purge_outbox_events``
+only deletes events every named consumer has read.
+
+Every payload is the full current state of the product, so consumers can
+upsert from any single event. Changes made with ``QuerySet.update()`` (such as
+stock updates) bypass the signals and publish nothing.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Min
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import OutboxConsumer, OutboxEvent, Product
+
+
+PRODUCT_CREATED = 'product.created'
+PRODUCT_RENAMED = 'product.renamed'
+PRODUCT_PRICE_CHANGED = 'product.price_changed'
+PRODUCT_AVAILABILITY_CHANGED = 'product.availability_changed'  # is_active flipped
+PRODUCT_DELETED = 'product.deleted'
+
+TRACKED_FIELDS = ('name', 'price', 'is_active')
+
+
+def product_payload(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': str(product.price),
+        'is_active': product.is_active,
+    }
+
+
+def publish(event_type, aggregate_id, payload):
+    return OutboxEvent.objects.create(event_type=event_type, aggregate_id=aggregate_id, payload=payload)
+
+
+def _remember_published_state(product):
+    # Read __dict__ directly: touching a deferred field would cost a query per instance
+    product._published_state = {field: product.__dict__.get(field) for field in TRACKED_FIELDS}
+
+
+def _changed(product, field, update_fields):
+    if update_fields is not None and field not in update_fields:
+        return False
+    if field not in product.__dict__:
+        return False
+    before = product._published_state.get(field)
+    after = product.__dict__[field]
+    if field == 'price' and before is not None and after is not None:
+        return Decimal(str(before)) != Decimal(str(after))
+    return before != after
+
+
+@receiver(post_init, sender=Product)
+def track_product(sender, instance, **kwargs):
+    _remember_published_state(instance)
+
+
+@receiver(post_save, sender=Product)
+def publish_product_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        publish(PRODUCT_CREATED, instance.id, product_payload(instance))
+    else:
+        if _changed(instance, 'name', update_fields):
+            publish(PRODUCT_RENAMED, instance.id, product_payload(instance))
+        if _changed(instance, 'price', update_fields):
+            publish(PRODUCT_PRICE_CHANGED, instance.id, product_payload(instance))
+        if _changed(instance, 'is_active', update_fields):
+            publish(PRODUCT_AVAILABILITY_CHANGED, instance.id, product_payload(instance))
+    _remember_published_state(instance)
+
+
+@receiver(post_delete, sender=Product)
+def publish_product_deleted(sender, instance, **kwargs):
+    publish(PRODUCT_DELETED, instance.id, {'id': instance.id})
+
+
+def settled_events(after, limit):
+    """Up to ``limit`` events after event ID ``after``, stopping at the first one not yet settled.
+
+    IDs are allocated before the transaction that writes the event commits,
+    so an event can become visible after one with a higher ID was read. Events
+    are only served ``OUTBOX_SETTLE`` seconds after they were written, when
+    any transaction started before them has committed or given up.
+    """
+    settled = timezone.now() - timedelta(seconds=settings.OUTBOX_SETTLE)
+    events = list(OutboxEvent.objects.filter(id__gt=after).order_by('id')[:limit])
+    for index, event in enumerate(events):
+        if event.created_at > settled:
+            return events[:index]
+    return events
+
+
+def acknowledge(consumer, after):
+    """Record that ``consumer`` has applied every event up to ``after``"""
+    if not OutboxConsumer.objects.filter(name=consumer, last_event_id__lt=after).update(last_event_id=after):
+        OutboxConsumer.objects.get_or_create(name=consumer, defaults={'last_event_id': after})
+
+
+def purge_old_events(older_than):
+    """Delete events created before ``older_than`` that every consumer has read.
+
+    Consumers are those that name themselves when reading the feed; with none
+    known, nothing is deleted. Returns how many events were deleted.
+    """
+    read = OutboxConsumer.objects.aggregate(read=Min('last_event_id'))['read']
+    if read is None:
+        return 0
+    deleted, _ = OutboxEvent.objects.filter(created_at__lt=older_than, id__lte=read).delete()
+    return deleted
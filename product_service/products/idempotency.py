@@ -0,0 +1,104 @@
+"""
+Idempotency-Key support for mutating endpoints.
+
+The first request with a given key runs normally and its response is stored
+for ``settings.IDEMPOTENCY_KEY_TTL`` seconds. Repeats of that request get the
+stored response back without running the view again; a repeat that arrives
+while the first is still running gets 409, and reusing a key for a different
+request body gets 422. Server errors (5xx) are not stored, so they can be
+retried. The headers of ``STORED_HEADERS`` are stored and replayed with the
+body; the others (Date, Content-Length, ...) are regenerated.
+"""
+
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+# Response headers that are part of the answer, not of the transport
+STORED_HEADERS = ('Location', 'Preference-Applied', 'Retry-After', 'X-Enrichment-Degraded')
+
+
+def _request_hash(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode('utf-8')).hexdigest()
+
+
+def _replay(record, request_hash):
+    if record.request_hash != request_hash:
+        return Response({'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    if record.status_code is None:
+        return Response({'error': f'A request with this {IDEMPOTENCY_HEADER} is still in progress'},
+                        status=status.HTTP_409_CONFLICT)
+    return Response(record.response_body, status=record.status_code,
+                    headers={**(record.response_headers or {}), REPLAYED_HEADER: 'true'})
+
+
+def idempotent(scope):
+    """Decorate a view (function or method) so ``Idempotency-Key`` requests run at most once"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            request = next(arg for arg in args if isinstance(arg, Request))
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > 64:
+                return Response({'error': f'{IDEMPOTENCY_HEADER} must be at most 64 characters'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            request_hash = _request_hash(request)
+            now = timezone.now()
+            IdempotencyRecord.objects.filter(scope=scope, key=key, expires_at__lte=now).delete()
+            try:
+                with transaction.atomic():
+                    record = IdempotencyRecord.objects.create(
+                        scope=scope,
+                        key=key,
+                        request_hash=request_hash,
+                        expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                    )
+            except IntegrityError:
+                record = IdempotencyRecord.objects.filter(scope=scope, key=key).first()
+                if record is None:
+                    return Response({'error': f'A request with this {IDEMPOTENCY_HEADER} is still in progress'},
+                                    status=status.HTTP_409_CONFLICT)
+                return _replay(record, request_hash)
+
+            try:
+                response = view(*args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+
+            if response.status_code >= 500 or not isinstance(response, Response):
+                record.delete()
+                return response
+
+            record.status_code = response.status_code
+            record.response_body = json.loads(JSONRenderer().render(response.data) or b'null')
+            record.response_headers = {name: response[name] for name in STORED_HEADERS if name in response}
+            record.save(update_fields=['status_code', 'response_body', 'response_headers'])
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_expired_records(now=None):
+    """Delete stored responses whose key has expired; returns how many were deleted"""
+    deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
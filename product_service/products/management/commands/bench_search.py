@@ -0,0 +1,79 @@
+import random
+import statistics
+import string
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from products.models import Category, Product
+from products.pagination import KeysetPagination
+from products.search import rebuild_search_index, search_products
+
+
+def legacy_search(queryset, text):
+    """The previous substring filter, kept for comparison"""
+    return queryset.filter(Q(name__icontains=text) | Q(description__icontains=text)).order_by('-created_at', '-id')
+
+
+def indexed_search(queryset, text):
+    return search_products(queryset, text).order_by('-search_rank', '-id')
+
+
+class Command(BaseCommand):
+    help = ('Time a page of ?search= results over a large generated catalog, comparing the '
+            'legacy icontains filter with the full-text index. Everything it creates is '
+            'rolled back at the end.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200_000)
+        parser.add_argument('--queries', type=int, default=50,
+                            help='Search texts to time: a third each whole words, word prefixes '
+                                 'and words no product contains')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(5000)]
+        third = options['queries'] // 3
+        texts = [rng.choice(vocabulary) for _ in range(third)]
+        texts += [rng.choice(vocabulary)[:3] for _ in range(third)]
+        texts += [rng.choice(vocabulary) + 'zz' for _ in range(options['queries'] - 2 * third)]
+
+        with transaction.atomic():
+            self.create_catalog(rng, vocabulary, options['products'])
+            products = Product.objects.filter(is_active=True).select_related('category')
+            page_size = KeysetPagination.page_size
+            for label, search in (('legacy', legacy_search), ('indexed', indexed_search)):
+                timings = []
+                for text in texts:
+                    started = time.perf_counter()
+                    list(search(products, text)[:page_size + 1])
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.report(label, timings)
+            transaction.set_rollback(True)
+
+    def create_catalog(self, rng, vocabulary, count):
+        started = time.perf_counter()
+        category = Category.objects.create(name=f'bench-search-{time.time_ns()}')
+        batch = []
+        for index in range(count):
+            batch.append(Product(
+                name=' '.join(rng.choices(vocabulary, k=3)).title(),
+                description=' '.join(rng.choices(vocabulary, k=12)),
+                price=Decimal('1.00'), category=category,
+            ))
+            if len(batch) == 5000 or index == count - 1:
+                Product.objects.bulk_create(batch)
+                batch = []
+        # bulk_create bypasses the signals that index products one at a time
+        rebuild_search_index()
+        self.stdout.write(f'Created and indexed {count} products in {time.perf_counter() - started:.1f}s')
+
+    def report(self, label, timings):
+        timings.sort()
+        p95 = timings[min(int(len(timings) * 0.95), len(timings) - 1)]
+        self.stdout.write(f'{label:>7}: {len(timings)} searches | ms per page: '
+                          f'median {statistics.median(timings):.1f}, p95 {p95:.1f}, max {timings[-1]:.1f}')
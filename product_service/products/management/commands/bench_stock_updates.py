@@ -0,0 +1,104 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+from products.models import Category, Product
+from products.stock import decrease_stock
+
+
+def legacy_decrease_stock(product_id, quantity):
+    """The previous read-compare-write implementation, kept for comparison"""
+    stock_quantity = Product.objects.values_list('stock_quantity', flat=True).get(id=product_id)
+    if stock_quantity >= quantity:
+        # Write back the value computed from the read, as save() did, but only the
+        # columns the atomic path writes and without post_save handlers, so the
+        # comparison times the read-compare-write race and nothing else
+        Product.objects.filter(id=product_id).update(
+            stock_quantity=stock_quantity - quantity, updated_at=timezone.now(),
+        )
+        return True
+    return False
+
+
+class Command(BaseCommand):
+    help = ('Run many concurrent stock decrements against one hot product, comparing the '
+            'legacy read-compare-write path with the atomic conditional UPDATE')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--decrements', type=int, default=100,
+                            help='Decrements attempted by each thread')
+        parser.add_argument('--stock', type=int, default=None,
+                            help='Initial stock (default: half of all attempted decrements, '
+                                 'so the product sells out and overselling is visible)')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        decrements = options['decrements']
+        attempts = threads * decrements
+        initial_stock = options['stock'] if options['stock'] is not None else attempts // 2
+
+        category = Category.objects.create(name=f'bench-stock-{time.time_ns()}')
+        try:
+            for label, decrement in (('legacy', legacy_decrease_stock), ('atomic', decrease_stock)):
+                product = Product.objects.create(
+                    name='Benchmark product', description='', price=Decimal('1.00'),
+                    category=category, stock_quantity=initial_stock,
+                )
+                result = self.run(decrement, product.id, threads, decrements)
+                product.refresh_from_db()
+                self.report(label, result, initial_stock, product.stock_quantity)
+        finally:
+            category.delete()
+
+    def run(self, decrement, product_id, threads, decrements):
+        lock = threading.Lock()
+        result = {'succeeded': 0, 'rejected': 0, 'errors': 0}
+        barrier = threading.Barrier(threads)
+
+        def worker():
+            succeeded = rejected = errors = 0
+            barrier.wait()
+            try:
+                for _ in range(decrements):
+                    try:
+                        if decrement(product_id, 1):
+                            succeeded += 1
+                        else:
+                            rejected += 1
+                    except DatabaseError:
+                        errors += 1
+            finally:
+                connection.close()
+            with lock:
+                result['succeeded'] += succeeded
+                result['rejected'] += rejected
+                result['errors'] += errors
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        result['elapsed'] = time.perf_counter() - started
+        return result
+
+    def report(self, label, result, initial_stock, final_stock):
+        attempts = result['succeeded'] + result['rejected'] + result['errors']
+        expected_stock = initial_stock - result['succeeded']
+        oversold = max(result['succeeded'] - initial_stock, 0)
+        lost_updates = final_stock - expected_stock
+        correct = lost_updates == 0 and oversold == 0
+        style = self.style.SUCCESS if correct else self.style.ERROR
+        self.stdout.write(style(
+            f"{label:>6}: {attempts} attempts in {result['elapsed']:.2f}s "
+            f"({attempts / result['elapsed']:.0f} ops/s) | "
+            f"sold {result['succeeded']}, rejected {result['rejected']}, errors {result['errors']} | "
+            f"stock {initial_stock} -> {final_stock} (expected {expected_stock}), "
+            f"lost updates {lost_updates}, oversold {oversold}"
+        ))
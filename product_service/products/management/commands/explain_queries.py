@@ -0,0 +1,58 @@
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from products.models import OutboxEvent, Product
+from products.pagination import KeysetPagination
+from products.search import search_products
+
+# Plan lines that mean every row of a table is read (SQLite, PostgreSQL)
+FULL_SCAN = re.compile(r'\b(SCAN (?!.*\b(USING|VIRTUAL TABLE)\b)\S+|Seq Scan on \S+)')
+
+
+def page(queryset, after=None, ordering=KeysetPagination.ordering):
+    """The query KeysetPagination runs for a page of ``queryset``"""
+    paginator = KeysetPagination()
+    paginator.ordering = ordering
+    queryset = queryset.order_by(*paginator.ordering)
+    if after is not None:
+        queryset = queryset.filter(paginator.after_position(after))
+    return queryset[:paginator.page_size + 1]
+
+
+def endpoint_queries():
+    products = Product.objects.filter(is_active=True).select_related('category')
+    last_row = [timezone.now().isoformat(), 1]
+    return [
+        ('GET /products/', page(products)),
+        ('GET /products/?cursor=', page(products, after=last_row)),
+        ('GET /products/?category=', page(products.filter(category__name__icontains='phone'))),
+        ('GET /products/?search=', page(search_products(products, 'phone'), ordering=('-search_rank', '-id'))),
+        ('GET /api/product/{id}/', products.filter(id=1)),
+        ('GET /api/products/batch/', products.filter(id__in=[1, 2, 3])),
+        ('GET /api/events/', OutboxEvent.objects.filter(id__gt=1).order_by('id')[:500]),
+    ]
+
+
+class Command(BaseCommand):
+    help = ("Print the query plan of each endpoint's queries and flag full table scans. "
+            "Run it against a database of realistic size: on nearly empty tables the "
+            "planner may prefer a scan even where an index exists.")
+
+    def handle(self, *args, **options):
+        queries = endpoint_queries()
+        flagged = 0
+        for name, queryset in queries:
+            plan = queryset.explain()
+            scans = [match.group(1) for match in map(FULL_SCAN.search, plan.splitlines()) if match]
+            if scans:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(f'{name}: full scan ({", ".join(scans)})'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+            for line in plan.splitlines():
+                self.stdout.write(f'    {line}')
+        self.stdout.write(f'{flagged} of {len(queries)} queries scan a whole table '
+                          f'({connection.vendor})')
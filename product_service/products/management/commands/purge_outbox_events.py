@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from products.events import purge_old_events
+from products.models import OutboxConsumer
+
+
+class Command(BaseCommand):
+    help = 'Delete change events old enough that every consumer has read them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7,
+                            help='Keep events from the last DAYS days')
+
+    def handle(self, *args, **options):
+        deleted = purge_old_events(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(f'Deleted {deleted} outbox event(s)')
+        if not OutboxConsumer.objects.exists():
+            self.stderr.write('No consumer has read the feed with ?consumer=<name> yet, so no event '
+                              'is known to be read')
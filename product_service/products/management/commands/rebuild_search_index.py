@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from products.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = ('Re-index every product for ?search=, e.g. after changing names or descriptions '
+            'with bulk updates, which bypass the signals that keep the index current')
+
+    def handle(self, *args, **options):
+        indexed = rebuild_search_index()
+        self.stdout.write(f'Indexed {indexed} product(s)')
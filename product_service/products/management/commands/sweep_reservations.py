@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from products.stock import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Give back the stock of reservations that expired without being confirmed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=30.0,
+                            help='Seconds between sweeps')
+        parser.add_argument('--once', action='store_true',
+                            help='Run a single sweep and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            expired = release_expired_holds()
+            if expired:
+                self.stdout.write(f'Released {expired} expired reservation(s)')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 
 
 class Category(models.Model):
@@ -27,6 +27,110 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Change events are written to the outbox by a post_save handler (see
+        # events.py); they must commit or roll back together with the product
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         db_table = 'product'
         ordering = ['-created_at']
+        indexes = [
+            # Active product list pages, newest first (see KeysetPagination). Partial rather
+            # than led by is_active, which SQLite can't match against `WHERE "is_active"`
+            models.Index(fields=['created_at', 'id'], condition=models.Q(is_active=True),
+                         name='product_active_created_idx'),
+        ]
+
+
+class StockReservation(models.Model):
+    """Stock held for an order until the order service confirms or releases it"""
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('confirmed', 'Confirmed'),
+        ('released', 'Released'),
+        ('expired', 'Expired'),
+    ]
+
+    reservation_id = models.CharField(max_length=64, unique=True)  # Chosen by the caller, e.g. per order
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Reservation {self.reservation_id} ({self.status})"
+
+    class Meta:
+        db_table = 'stock_reservation'
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_expiry_idx'),
+        ]
+
+
+class StockReservationItem(models.Model):
+    reservation = models.ForeignKey(StockReservation, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservation_items')
+    quantity = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"Reservation {self.reservation_id} - Product {self.product_id}"
+
+    class Meta:
+        db_table = 'stock_reservation_item'
+
+
+class IdempotencyRecord(models.Model):
+    """Stored response for a request that carried an Idempotency-Key header"""
+    scope = models.CharField(max_length=100)  # Endpoint the key was used on
+    key = models.CharField(max_length=64)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)  # None while the request is in progress
+    response_body = models.JSONField(null=True)
+    response_headers = models.JSONField(default=dict)  # Those of STORED_HEADERS (see idempotency.py)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
+
+    class Meta:
+        db_table = 'idempotency_record'
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_key_per_scope'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expiry_idx'),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """Change event for other services, written in the same transaction as the change"""
+    event_type = models.CharField(max_length=50)  # e.g. 'product.renamed'
+    aggregate_id = models.PositiveIntegerField()  # ID of the product the event is about
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.event_type} {self.aggregate_id}"
+
+    class Meta:
+        db_table = 'outbox_event'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['created_at'], name='outbox_event_created_idx'),
+        ]
+
+
+class OutboxConsumer(models.Model):
+    """Position of a named consumer in the change event feed, as of its last read"""
+    name = models.CharField(max_length=100, unique=True)
+    last_event_id = models.BigIntegerField(default=0)  # It has applied every event up to this one
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.last_event_id}"
+
+    class Meta:
+        db_table = 'outbox_consumer'
@@ -0,0 +1,171 @@
+"""
+Cache of rendered responses for read-heavy endpoints that rarely change.
+
+A view wrapped with ``cache_response`` answers a GET from the cache, with no
+queries and no serialization, when the same URL and query string was
+rendered since the data it shows last changed. Responses carry a strong
+``ETag`` (a hash of the body), ``Last-Modified`` from the ``updated_at`` of
+what they show and ``Cache-Control: no-cache``, so clients revalidate with
+``If-None-Match``/``If-Modified-Since`` and get ``304 Not Modified`` while
+nothing changed.
+
+Invalidation is by generation: each scope (``'products'``, ``'product:<id>'``,
+...) has a counter in the cache that is part of the key of every response
+that depends on it. ``invalidate`` bumps the counters, so those entries are
+never read again and expire after ``RESPONSE_CACHE_TTL`` seconds. It bumps
+them again when the transaction commits, so a response rendered from the old
+data in the meantime is not served either. With several server processes
+use a shared ``CACHE_BACKEND`` (e.g. Redis); with the default in-process
+cache each process only sees its own invalidations.
+
+Stock changes with every order placed, so a stock-only change invalidates
+just the product's own scope: cached ``/products/`` pages and search results
+keep the stock level they were rendered with until they expire or another
+change to the catalog invalidates them. Exact stock is on the product detail
+and ``/api/check-stock/``.
+"""
+
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+
+from .models import Category, Product
+
+
+KEY_PREFIX = 'response'
+
+
+def _generation_key(scope):
+    return f'{KEY_PREFIX}:generation:{scope}'
+
+
+def _bump(scopes):
+    for scope in scopes:
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:  # Never read, or evicted: any new value orphans the old entries
+            cache.set(key, time.time_ns(), None)
+
+
+def _generations(scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def invalidate(*scopes):
+    """Stop serving cached responses that depend on any of ``scopes``"""
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def _last_modified(data):
+    """Latest ``updated_at`` in a serialized object or page of objects, as a timestamp"""
+    if isinstance(data, dict):
+        data = data.get('results', [data])
+    if not isinstance(data, list):
+        return None
+    updated = [parse_datetime(item['updated_at']) for item in data
+               if isinstance(item, dict) and item.get('updated_at')]
+    return int(max(updated).timestamp()) if updated else None
+
+
+def _add_validators(response, entry):
+    response['ETag'] = entry['etag']
+    if entry['last_modified'] is not None:
+        response['Last-Modified'] = http_date(entry['last_modified'])
+    patch_cache_control(response, no_cache=True)
+
+
+def cache_response(*scopes):
+    """Cache successful GET responses of a view until one of ``scopes`` is invalidated.
+
+    A scope is a string, or a callable that takes the view's URL kwargs and
+    returns one (e.g. ``lambda pk: f'product:{pk}'``).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or settings.RESPONSE_CACHE_TTL <= 0:
+                return view(request, *args, **kwargs)
+
+            names = [scope(**kwargs) if callable(scope) else scope for scope in scopes]
+            key_source = repr((request.get_full_path(), names, _generations(names)))
+            key = f'{KEY_PREFIX}:{hashlib.sha256(key_source.encode()).hexdigest()}'
+
+            entry = cache.get(key)
+            if entry is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                if hasattr(response, 'render'):
+                    response.render()
+                entry = {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                    'etag': f'"{hashlib.sha256(response.content).hexdigest()[:32]}"',
+                    'last_modified': _last_modified(getattr(response, 'data', None)),
+                }
+                cache.set(key, entry, settings.RESPONSE_CACHE_TTL)
+                response['X-Cache'] = 'MISS'
+            else:
+                response = HttpResponse(entry['content'], content_type=entry['content_type'])
+                response['X-Cache'] = 'HIT'
+
+            _add_validators(response, entry)
+            return get_conditional_response(request, etag=entry['etag'],
+                                            last_modified=entry['last_modified'], response=response)
+        return wrapper
+    return decorator
+
+
+def saved_only(update_fields, fields):
+    """Whether a save limited to ``update_fields`` wrote nothing but ``fields``"""
+    return update_fields is not None and set(update_fields) <= set(fields)
+
+
+# Written by stock changes, which leave the cached lists alone (see module docstring)
+STOCK_FIELDS = ('stock_quantity', 'updated_at')
+
+
+def product_scope(pk):
+    return f'product:{pk}'
+
+
+def invalidate_stock(product_id):
+    """Stop serving the cached detail of a product whose stock changed"""
+    invalidate(product_scope(product_id))
+
+
+@receiver(post_save, sender=Product)
+def invalidate_saved_product(sender, instance, update_fields=None, **kwargs):
+    if saved_only(update_fields, STOCK_FIELDS):
+        invalidate_stock(instance.pk)
+    else:
+        invalidate('products', product_scope(instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_deleted_product(sender, instance, **kwargs):
+    invalidate('products', product_scope(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    # Products show their category's name
+    invalidate('categories', 'products')
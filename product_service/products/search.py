@@ -0,0 +1,120 @@
+"""
+Full-text product search for ``GET /products/?search=``.
+
+Every word of the search text must match a word, or the start of a word, in
+the product's name or description, and results are ranked by relevance. On
+SQLite the text is indexed in an FTS5 table, ``product_search``, whose rowid
+is the product ID; on PostgreSQL in a GIN index over ``to_tsvector`` of the
+same columns. Both are created after ``migrate``; the FTS5 table is kept
+current by the signal handlers below (PostgreSQL maintains its index itself).
+Other databases fall back to the ``icontains`` filters used before.
+
+``QuerySet.update()`` and ``bulk_create()`` bypass the signals; run
+``manage.py rebuild_search_index`` after changing names or descriptions that way.
+"""
+
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Product
+
+
+SEARCH_TABLE = 'product_search'
+MAX_SEARCH_TERMS = 10
+
+# Indexed and queried with the same expression, so PostgreSQL can use the index
+PG_DOCUMENT = "to_tsvector('simple', coalesce({table}name, '') || ' ' || coalesce({table}description, ''))"
+
+
+def search_terms(text):
+    return re.findall(r'\w+', text.lower())[:MAX_SEARCH_TERMS]
+
+
+def search_products(queryset, text):
+    """Filter ``queryset`` to the products matching ``text``.
+
+    Each product is annotated with ``search_rank``, higher for better matches.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return queryset.extra(
+            tables=[SEARCH_TABLE],
+            where=[f'"{SEARCH_TABLE}".rowid = "product"."id"', f'"{SEARCH_TABLE}" MATCH %s'],
+            params=[match],
+        ).annotate(
+            # FTS5's rank is bm25, lower for better matches
+            search_rank=RawSQL(f'-"{SEARCH_TABLE}".rank', (), output_field=FloatField()),
+        )
+
+    if vendor == 'postgresql':
+        document = PG_DOCUMENT.format(table='"product".')
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return queryset.extra(
+            where=[f"{document} @@ to_tsquery('simple', %s)"],
+            params=[tsquery],
+        ).annotate(
+            search_rank=RawSQL(f"ts_rank({document}, to_tsquery('simple', %s))", (tsquery,),
+                               output_field=FloatField()),
+        )
+
+    return queryset.filter(Q(name__icontains=text) | Q(description__icontains=text)).annotate(
+        search_rank=Value(0.0, output_field=FloatField()),
+    )
+
+
+def rebuild_search_index(using='default'):
+    """Re-index every product; returns how many were indexed"""
+    if connections[using].vendor != 'sqlite':
+        return Product.objects.using(using).count()
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(f'INSERT INTO {SEARCH_TABLE} (rowid, name, description) '
+                       f'SELECT id, name, description FROM product')
+        return cursor.rowcount
+
+
+def create_search_index(sender, using, **kwargs):
+    """Create the search index after ``migrate`` (and fill it, if it is new)"""
+    vendor = connections[using].vendor
+    if vendor == 'sqlite':
+        if SEARCH_TABLE in connections[using].introspection.table_names():
+            return
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                f"name, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+        rebuild_search_index(using)
+    elif vendor == 'postgresql':
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS product_search_idx ON product '
+                           f'USING GIN (({PG_DOCUMENT.format(table="")}))')
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, update_fields=None, using='default', **kwargs):
+    if raw or connections[using].vendor != 'sqlite':
+        return
+    if update_fields is not None and not {'name', 'description'} & set(update_fields):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+                       [instance.id, instance.name, instance.description])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using='default', **kwargs):
+    if connections[using].vendor != 'sqlite':
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [instance.id])
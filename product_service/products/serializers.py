@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Product, Category
+from .models import Product, Category, OutboxEvent
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -24,4 +24,10 @@ class ProductListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'price', 'category_name', 
-                 'stock_quantity', 'is_active']
+                 'stock_quantity', 'is_active', 'updated_at']
+
+
+class OutboxEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OutboxEvent
+        fields = ['id', 'event_type', 'aggregate_id', 'payload', 'created_at']
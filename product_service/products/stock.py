@@ -0,0 +1,267 @@
+"""
+Race-free stock mutations.
+
+Every change is a single conditional ``UPDATE`` evaluated by the database, so
+concurrent orders for the same product can neither lose updates nor oversell.
+"""
+
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Product, StockReservation, StockReservationItem
+from .response_cache import invalidate_stock
+
+
+class StockError(Exception):
+    """A stock change could not be applied to ``product_id``"""
+
+    def __init__(self, product_id, message):
+        super().__init__(message)
+        self.product_id = product_id
+
+
+class ReservationError(Exception):
+    """A reservation does not exist or is no longer in a usable state"""
+
+
+def decrease_stock(product_id, quantity, active_only=False):
+    """Take ``quantity`` units if enough are in stock; returns True on success"""
+    products = Product.objects.filter(id=product_id, stock_quantity__gte=quantity)
+    if active_only:
+        products = products.filter(is_active=True)
+    updated = products.update(
+        stock_quantity=F('stock_quantity') - quantity,
+        updated_at=timezone.now(),
+    )
+    if updated:
+        invalidate_stock(product_id)
+    return updated == 1
+
+
+def increase_stock(product_id, quantity):
+    """Put ``quantity`` units back in stock; returns False if the product does not exist"""
+    updated = Product.objects.filter(id=product_id).update(
+        stock_quantity=F('stock_quantity') + quantity,
+        updated_at=timezone.now(),
+    )
+    if updated:
+        invalidate_stock(product_id)
+    return updated == 1
+
+
+def current_stock(product_id):
+    return Product.objects.values_list('stock_quantity', flat=True).get(id=product_id)
+
+
+def parse_stock_items(raw_items):
+    """Validate a ``[{"product_id": 1, "quantity": 2}, ...]`` payload.
+
+    Returns ``{product_id: quantity}`` with quantities of repeated products summed.
+    """
+    if not isinstance(raw_items, list) or not raw_items:
+        raise ValueError('items must be a non-empty list')
+
+    items = {}
+    for raw_item in raw_items:
+        if not isinstance(raw_item, dict):
+            raise ValueError('each item must be an object with product_id and quantity')
+        product_id = raw_item.get('product_id')
+        quantity = raw_item.get('quantity')
+        if not isinstance(product_id, int) or isinstance(product_id, bool):
+            raise ValueError('product_id must be an integer')
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            raise ValueError('quantity must be a positive integer')
+        items[product_id] = items.get(product_id, 0) + quantity
+    return items
+
+
+def _reserved_items(items):
+    products = Product.objects.filter(id__in=items).values(
+        'id', 'name', 'price', 'stock_quantity', 'category__name'
+    )
+    return [
+        {
+            'product_id': product['id'],
+            'product_name': product['name'],
+            'category_name': product['category__name'],
+            'price': str(product['price']),
+            'quantity': items[product['id']],
+            'stock_quantity': product['stock_quantity'],
+        }
+        for product in products
+    ]
+
+
+def reserve_items(items):
+    """Take stock for every ``{product_id: quantity}`` item, or for none of them.
+
+    Returns the reserved items with the current product name, category and price.
+    Raises StockError (and rolls back) if any item is unknown or short.
+    """
+    with transaction.atomic():
+        # Lock rows in a consistent order so concurrent reservations cannot deadlock
+        for product_id in sorted(items):
+            if decrease_stock(product_id, items[product_id], active_only=True):
+                continue
+            available = (Product.objects.filter(id=product_id, is_active=True)
+                         .values_list('stock_quantity', flat=True).first())
+            if available is None:
+                raise StockError(product_id, f'Product {product_id} not found')
+            raise StockError(product_id, f'Insufficient stock for product {product_id}: '
+                                         f'only {available} items available')
+        return _reserved_items(items)
+
+
+def release_items(items):
+    """Return stock for every ``{product_id: quantity}`` item, or for none of them"""
+    with transaction.atomic():
+        for product_id in sorted(items):
+            if not increase_stock(product_id, items[product_id]):
+                raise StockError(product_id, f'Product {product_id} not found')
+        return _reserved_items(items)
+
+
+def _reservation_result(reservation, items):
+    return {
+        'reservation_id': reservation.reservation_id,
+        'status': reservation.status,
+        'expires_at': reservation.expires_at,
+        'items': items,
+    }
+
+
+def hold_items(reservation_id, items, ttl):
+    """Reserve ``items`` under ``reservation_id`` until confirmed or ``ttl`` seconds pass.
+
+    Idempotent: holding an ID that already exists returns the existing hold
+    instead of taking the stock twice. Raises StockError if any item is short
+    and ReservationError if the ID was already released or expired.
+    """
+    existing = StockReservation.objects.filter(reservation_id=reservation_id).first()
+    if existing is None:
+        try:
+            with transaction.atomic():
+                reserved = reserve_items(items)
+                reservation = StockReservation.objects.create(
+                    reservation_id=reservation_id,
+                    expires_at=timezone.now() + timedelta(seconds=ttl),
+                )
+                StockReservationItem.objects.bulk_create([
+                    StockReservationItem(reservation=reservation, product_id=product_id, quantity=quantity)
+                    for product_id, quantity in items.items()
+                ])
+                return _reservation_result(reservation, reserved)
+        except IntegrityError:
+            # A concurrent request created the same reservation; ours was rolled back
+            existing = StockReservation.objects.get(reservation_id=reservation_id)
+
+    if existing.status not in ('held', 'confirmed'):
+        raise ReservationError(f'Reservation {reservation_id} is {existing.status}')
+    held = dict(existing.items.values_list('product_id', 'quantity'))
+    return _reservation_result(existing, _reserved_items(held))
+
+
+def hold_many(holds, ttl):
+    """Hold stock for several reservations in one transaction.
+
+    ``holds`` maps reservation ID to ``{product_id: quantity}``. Each hold is
+    all-or-nothing on its own, in a savepoint, so one that cannot be made
+    leaves the others in place. Returns a dict mapping reservation ID to the
+    hold (as from :func:`hold_items`) or to the StockError/ReservationError
+    that prevented it.
+    """
+    results = {}
+    with transaction.atomic():
+        for reservation_id, items in holds.items():
+            try:
+                results[reservation_id] = hold_items(reservation_id, items, ttl)
+            except (StockError, ReservationError) as e:
+                results[reservation_id] = e
+    return results
+
+
+def _expire_lapsed(reservations):
+    """Expire the holds among ``reservations`` whose TTL has passed but were not swept yet"""
+    for reservation in reservations.filter(status='held', expires_at__lte=timezone.now()):
+        _end_reservation(reservation, ('held',), 'expired')
+
+
+def confirm_hold(reservation_id):
+    """Make a hold permanent; confirming twice is a no-op, confirming an expired hold fails"""
+    now = timezone.now()
+    confirmed = StockReservation.objects.filter(
+        reservation_id=reservation_id, status='held', expires_at__gt=now,
+    ).update(status='confirmed', updated_at=now)
+    if confirmed:
+        return
+    _expire_lapsed(StockReservation.objects.filter(reservation_id=reservation_id))
+    reservation = StockReservation.objects.filter(reservation_id=reservation_id).first()
+    if reservation is None:
+        raise ReservationError(f'Reservation {reservation_id} not found')
+    if reservation.status != 'confirmed':
+        raise ReservationError(f'Reservation {reservation_id} is {reservation.status}')
+
+
+def confirm_holds(reservation_ids):
+    """Confirm several holds with one ``UPDATE``; returns ``{reservation_id: error}`` for those that failed"""
+    now = timezone.now()
+    StockReservation.objects.filter(reservation_id__in=reservation_ids, status='held', expires_at__gt=now).update(
+        status='confirmed', updated_at=now,
+    )
+    _expire_lapsed(StockReservation.objects.filter(reservation_id__in=reservation_ids))
+    statuses = dict(StockReservation.objects.filter(reservation_id__in=reservation_ids)
+                    .values_list('reservation_id', 'status'))
+    errors = {}
+    for reservation_id in reservation_ids:
+        reservation_status = statuses.get(reservation_id)
+        if reservation_status is None:
+            errors[reservation_id] = f'Reservation {reservation_id} not found'
+        elif reservation_status != 'confirmed':
+            errors[reservation_id] = f'Reservation {reservation_id} is {reservation_status}'
+    return errors
+
+
+def _end_reservation(reservation, from_statuses, new_status):
+    """Move ``reservation`` to ``new_status`` and give its stock back, exactly once"""
+    with transaction.atomic():
+        ended = StockReservation.objects.filter(pk=reservation.pk, status__in=from_statuses).update(
+            status=new_status, updated_at=timezone.now(),
+        )
+        if ended:
+            for product_id, quantity in reservation.items.values_list('product_id', 'quantity'):
+                increase_stock(product_id, quantity)
+        return bool(ended)
+
+
+def release_hold(reservation_id):
+    """Give back the stock of a held or confirmed reservation (saga compensation).
+
+    Releasing an already released or expired reservation is a no-op.
+    """
+    reservation = StockReservation.objects.filter(reservation_id=reservation_id).first()
+    if reservation is None:
+        raise ReservationError(f'Reservation {reservation_id} not found')
+    _end_reservation(reservation, ('held', 'confirmed'), 'released')
+
+
+def release_holds(reservation_ids):
+    """Release several reservations in one transaction; returns the IDs that were not found"""
+    with transaction.atomic():
+        reservations = {reservation.reservation_id: reservation for reservation in
+                        StockReservation.objects.filter(reservation_id__in=reservation_ids)}
+        for reservation in reservations.values():
+            _end_reservation(reservation, ('held', 'confirmed'), 'released')
+    return [reservation_id for reservation_id in reservation_ids if reservation_id not in reservations]
+
+
+def release_expired_holds(now=None):
+    """Return the stock of holds that were never confirmed; returns how many expired"""
+    now = now or timezone.now()
+    expired = 0
+    for reservation in StockReservation.objects.filter(status='held', expires_at__lte=now):
+        if _end_reservation(reservation, ('held',), 'expired'):
+            expired += 1
+    return expired
@@ -1,3 +1,598 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import Category, IdempotencyRecord, OutboxEvent, Product, StockReservation
+from .stock import decrease_stock
+
+
+class QueryCountTestCase(TestCase):
+    """Asserts that list endpoints run a constant number of queries per page"""
+
+    def setUp(self):
+        self.client = APIClient()
+        for category_index in range(3):
+            category = Category.objects.create(name=f'Category {category_index}')
+            for product_index in range(3):
+                Product.objects.create(
+                    name=f'Product {category_index}-{product_index}',
+                    description='A product',
+                    price=Decimal('9.99'),
+                    category=category,
+                    stock_quantity=10,
+                )
+        self.product_ids = list(Product.objects.values_list('id', flat=True))
+
+    def test_product_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 9)
+
+    def test_product_list_filtered_by_category(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/products/', {'category': 'Category 1'})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_product_detail(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/products/{self.product_ids[0]}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_by_id(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/product/{self.product_ids[0]}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_products_batch(self):
+        ids = ','.join(str(product_id) for product_id in self.product_ids)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/batch/', {'ids': ids})
+        self.assertEqual(len(response.data), 9)
+
+
+class KeysetPaginationTestCase(TestCase):
+    """GET /products/ pages follow a cursor on (created_at, id), newest first"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Home')
+        for index in range(5):
+            self.create_product(f'Product {index}')
+        # Products added in the same instant are ordered by ID
+        Product.objects.update(created_at=timezone.now() - timedelta(days=1))
+
+    def create_product(self, name):
+        return Product.objects.create(name=name, description='', price=Decimal('1.00'), category=self.category)
+
+    def test_pages_follow_the_cursor(self):
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        response = self.client.get('/products/', {'page_size': 2})
+        self.create_product('Newcomer')
+
+        ids = []
+        while True:
+            ids += [product['id'] for product in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/products/', {'cursor': 'WzFd'}).status_code, 404)
+
+
+class BatchLookupTestCase(TestCase):
+    """GET /api/products/batch/ returns several active products in one call"""
+
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name='Home')
+        self.lamp = Product.objects.create(name='Lamp', description='', price=Decimal('10.00'), category=category)
+        self.desk = Product.objects.create(name='Desk', description='', price=Decimal('90.00'), category=category,
+                                           is_active=False)
+
+    def test_unknown_and_inactive_ids_are_omitted(self):
+        response = self.client.get('/api/products/batch/', {'ids': f'{self.lamp.id},{self.desk.id},999999'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['name'] for product in response.data], ['Lamp'])
+        self.assertEqual(response.data[0]['category']['name'], 'Home')
+
+    def test_invalid_ids(self):
+        for ids in ('1,two', ','.join(str(product_id) for product_id in range(1, 1002))):
+            response = self.client.get('/api/products/batch/', {'ids': ids})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.data)
+
+
+class OutboxEventTestCase(TestCase):
+    """Product changes other services copy are published to the outbox"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Books')
+
+    def event_types(self):
+        return list(OutboxEvent.objects.values_list('event_type', flat=True))
+
+    def test_created_renamed_and_price_changed(self):
+        response = self.client.post('/products/', {
+            'name': 'Novel', 'description': 'A book', 'price': '12.50',
+            'category_id': self.category.id, 'stock_quantity': 5,
+        }, format='json')
+        product_id = response.data['id']
+
+        self.client.patch(f'/products/{product_id}/', {'name': 'Novel (2nd ed.)'}, format='json')
+        self.client.patch(f'/products/{product_id}/', {'price': '12.5'}, format='json')  # same price
+        self.client.patch(f'/products/{product_id}/', {'price': '15.00'}, format='json')
+        self.client.patch(f'/products/{product_id}/', {'stock_quantity': 3}, format='json')
+
+        self.assertEqual(self.event_types(), ['product.created', 'product.renamed', 'product.price_changed'])
+        last = OutboxEvent.objects.last()
+        self.assertEqual(last.aggregate_id, product_id)
+        self.assertEqual(last.payload, {'id': product_id, 'name': 'Novel (2nd ed.)', 'price': '15.00',
+                                        'is_active': True})
+
+    def create_events(self, count):
+        for index in range(count):
+            Product.objects.create(name=f'Product {index}', description='', price=Decimal('1.00'),
+                                   category=self.category)
+        return list(OutboxEvent.objects.values_list('id', flat=True))
+
+    @override_settings(OUTBOX_SETTLE=0)
+    def test_event_feed(self):
+        first_id = self.create_events(3)[0]
+
+        response = self.client.get('/api/events/', {'after': first_id, 'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event['id'] for event in response.data['events']], [first_id + 1, first_id + 2])
+        self.assertEqual(self.client.get('/api/events/', {'after': 'x'}).status_code, 400)
+
+    @override_settings(OUTBOX_SETTLE=60)
+    def test_feed_stops_at_unsettled_event(self):
+        event_ids = self.create_events(3)
+        # The second event is recent: its transaction might still hide an earlier one
+        OutboxEvent.objects.exclude(id=event_ids[1]).update(created_at=timezone.now() - timedelta(minutes=5))
+
+        response = self.client.get('/api/events/')
+        self.assertEqual([event['id'] for event in response.data['events']], event_ids[:1])
+
+    @override_settings(OUTBOX_SETTLE=0)
+    def test_purge_keeps_unread_events(self):
+        event_ids = self.create_events(3)
+        OutboxEvent.objects.update(created_at=timezone.now() - timedelta(days=30))
+
+        err = StringIO()
+        call_command('purge_outbox_events', stdout=StringIO(), stderr=err)
+        self.assertEqual(OutboxEvent.objects.count(), 3)
+        self.assertIn('No consumer has read the feed', err.getvalue())
+
+        self.client.get('/api/events/', {'after': event_ids[1], 'consumer': 'order-service'})
+        self.client.get('/api/events/', {'after': event_ids[0], 'consumer': 'reporting'})
+        err = StringIO()
+        call_command('purge_outbox_events', stdout=StringIO(), stderr=err)
+        self.assertEqual(list(OutboxEvent.objects.values_list('id', flat=True)), event_ids[1:])
+        self.assertEqual(err.getvalue(), '')
+
+
+class ProductSearchTestCase(TestCase):
+    """?search= matches words and word prefixes, best matches first"""
+
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name='Electronics')
+        for name, description in (
+            ('iPhone 15', 'Apple phone'),
+            ('Phone case', 'Fits most phones'),
+            ('Desk lamp', 'LED lamp'),
+            ('Telephone', 'Phone phone phone'),
+        ):
+            Product.objects.create(name=name, description=description, price=Decimal('1.00'), category=category)
+
+    def search(self, text, **params):
+        names = []
+        response = self.client.get('/products/', {'search': text, **params})
+        while True:
+            names += [product['name'] for product in response.data['results']]
+            if not response.data['next']:
+                return names
+            response = self.client.get(response.data['next'])
+
+    def test_prefix_match_ranked(self):
+        self.assertEqual(self.search('PHON')[0], 'Telephone')
+        self.assertCountEqual(self.search('phon'), ['Telephone', 'Phone case', 'iPhone 15'])
+        self.assertEqual(self.search('phone case'), ['Phone case'])
+        self.assertEqual(self.search('%'), [])
+
+    def test_pages_follow_rank(self):
+        self.assertEqual(self.search('phon', page_size=1), self.search('phon'))
+
+    def test_index_follows_changes(self):
+        lamp = Product.objects.get(name='Desk lamp')
+        lamp.name = 'Desk light'
+        lamp.save()
+        self.assertEqual(self.search('light'), ['Desk light'])
+        lamp.delete()
+        self.assertEqual(self.search('lamp'), [])
+
+
+class ResponseCacheTestCase(TestCase):
+    """Catalog reads are served from the cache until the data changes, and revalidate with 304"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Lighting')
+        self.product = Product.objects.create(name='Lamp', description='', price=Decimal('5.00'),
+                                              category=self.category, stock_quantity=3)
+
+    def test_hit_and_not_modified(self):
+        first = self.client.get('/products/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertTrue(first.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            second = self.client.get('/products/')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+
+        response = self.client.get('/products/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/products/', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_invalidated_by_changes(self):
+        url = f'/products/{self.product.id}/'
+        etag = self.client.get(url)['ETag']
+
+        self.client.patch(url, {'name': 'Desk lamp'}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Desk lamp')
+
+        # Stock changes refresh the detail, but leave the cached list alone
+        list_etag = self.client.get('/products/')['ETag']
+        decrease_stock(self.product.id, 1)
+        self.assertEqual(self.client.get(url).data['stock_quantity'], 2)
+        self.assertEqual(self.client.get('/products/', HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+        self.product.refresh_from_db()
+        self.product.stock_quantity = 1
+        self.product.save(update_fields=['stock_quantity', 'updated_at'])
+        self.assertEqual(self.client.get('/products/', HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+        self.product.save()
+        self.assertEqual(self.client.get('/products/').data['results'][0]['stock_quantity'], 1)
+
+        self.category.name = 'Lights'
+        self.category.save()
+        self.assertEqual(self.client.get(url).data['category']['name'], 'Lights')
+
+
+class StockUpdateTestCase(TestCase):
+    """POST /api/update-stock/ changes stock with one conditional UPDATE"""
+
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name='Tools')
+        self.hammer = Product.objects.create(name='Hammer', description='', price=Decimal('7.00'),
+                                             category=category, stock_quantity=5)
+
+    def update(self, quantity, operation='decrease', product_id=None):
+        return self.client.post('/api/update-stock/', {
+            'product_id': product_id or self.hammer.id, 'quantity': quantity, 'operation': operation,
+        }, format='json')
+
+    def test_decrease_and_increase(self):
+        # The UPDATE, then reading the new stock
+        with self.assertNumQueries(2):
+            response = self.update(3)
+        self.assertEqual(response.data, {'success': True, 'new_stock': 2})
+        self.assertEqual(self.update(4, 'increase').data['new_stock'], 6)
+
+    def test_never_oversells(self):
+        self.assertTrue(decrease_stock(self.hammer.id, 3))
+        # A second order that read the same stock level before the first one took it
+        self.assertFalse(decrease_stock(self.hammer.id, 3))
+        response = self.update(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Insufficient stock')
+        self.hammer.refresh_from_db()
+        self.assertEqual(self.hammer.stock_quantity, 2)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.update(0).status_code, 400)
+        self.assertEqual(self.update(True).status_code, 400)
+        self.assertEqual(self.update(1, 'reset').status_code, 400)
+        self.assertEqual(self.update(1, product_id=999999).status_code, 404)
+
+
+class OrderStockTestCase(TestCase):
+    """Stock for a whole order is taken and put back in one call, all-or-nothing"""
+
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name='Tools')
+        self.hammer = Product.objects.create(name='Hammer', description='', price=Decimal('7.00'),
+                                             category=category, stock_quantity=5)
+        self.saw = Product.objects.create(name='Saw', description='', price=Decimal('12.00'),
+                                          category=category, stock_quantity=1)
+
+    def stock(self):
+        return list(Product.objects.order_by('id').values_list('stock_quantity', flat=True))
+
+    def test_reserve_and_release(self):
+        response = self.client.post('/api/reserve-stock/', {'items': [
+            {'product_id': self.hammer.id, 'quantity': 1},
+            {'product_id': self.saw.id, 'quantity': 1},
+            {'product_id': self.hammer.id, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        items = {item['product_id']: item for item in response.data['items']}
+        self.assertEqual(items[self.hammer.id]['quantity'], 3)
+        self.assertEqual((items[self.saw.id]['product_name'], items[self.saw.id]['price']), ('Saw', '12.00'))
+        self.assertEqual(items[self.saw.id]['category_name'], 'Tools')
+        self.assertEqual(self.stock(), [2, 0])
+
+        response = self.client.post('/api/release-stock/', {'items': [
+            {'product_id': self.hammer.id, 'quantity': 3}, {'product_id': self.saw.id, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(), [5, 1])
+
+    def test_short_item_reserves_nothing(self):
+        response = self.client.post('/api/reserve-stock/', {'items': [
+            {'product_id': self.hammer.id, 'quantity': 2}, {'product_id': self.saw.id, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['product_id'], self.saw.id)
+        self.assertEqual(self.stock(), [5, 1])
+
+        self.saw.is_active = False
+        self.saw.save()
+        response = self.client.post('/api/reserve-stock/', {'items': [
+            {'product_id': self.hammer.id, 'quantity': 1}, {'product_id': self.saw.id, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.data['error'], f'Product {self.saw.id} not found')
+        self.assertEqual(self.stock(), [5, 1])
+
+    def test_release_of_unknown_product_releases_nothing(self):
+        response = self.client.post('/api/release-stock/', {'items': [
+            {'product_id': self.hammer.id, 'quantity': 1}, {'product_id': 999999, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.stock(), [5, 1])
+
+    def test_invalid_items(self):
+        for items in (None, [], [{'product_id': self.hammer.id}], [{'product_id': '1', 'quantity': 1}]):
+            for url in ('/api/reserve-stock/', '/api/release-stock/'):
+                self.assertEqual(self.client.post(url, {'items': items}, format='json').status_code, 400)
+
+
+class StockHoldTestCase(TestCase):
+    """Stock held under a reservation ID is confirmed, released or expires exactly once"""
+
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name='Tools')
+        self.hammer = Product.objects.create(name='Hammer', description='', price=Decimal('7.00'),
+                                             category=category, stock_quantity=5)
+
+    def hold(self, reservation_id, quantity=2, ttl=60):
+        return self.client.post('/api/reserve-stock/', {
+            'reservation_id': reservation_id, 'ttl': ttl,
+            'items': [{'product_id': self.hammer.id, 'quantity': quantity}],
+        }, format='json')
+
+    def post(self, url, reservation_id):
+        return self.client.post(url, {'reservation_id': reservation_id}, format='json')
+
+    def stock(self):
+        self.hammer.refresh_from_db()
+        return self.hammer.stock_quantity
+
+    def test_hold_is_taken_once(self):
+        response = self.hold('order-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['status'], response.data['items'][0]['quantity']), ('held', 2))
+        # Retrying returns the existing hold, even with different items
+        self.assertEqual(self.hold('order-1', quantity=4).data['items'][0]['quantity'], 2)
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(self.hold('order-2', quantity=4).status_code, 400)
+        self.assertFalse(StockReservation.objects.filter(reservation_id='order-2').exists())
+
+    def test_confirm_then_release(self):
+        self.hold('order-1')
+        for _ in range(2):
+            response = self.post('/api/confirm-reservation/', 'order-1')
+            self.assertEqual((response.status_code, response.data['status']), (200, 'confirmed'))
+        self.assertEqual(self.stock(), 3)
+
+        for _ in range(2):
+            self.assertEqual(self.post('/api/release-stock/', 'order-1').status_code, 200)
+        self.assertEqual(self.stock(), 5)
+        self.assertEqual(self.post('/api/confirm-reservation/', 'order-1').status_code, 409)
+        self.assertEqual(self.hold('order-1').status_code, 409)
+        self.assertEqual(self.post('/api/release-stock/', 'missing').status_code, 404)
+        self.assertEqual(self.post('/api/confirm-reservation/', 'missing').status_code, 409)
+
+    def test_sweep_gives_back_expired_holds(self):
+        self.hold('order-1')
+        self.hold('order-2')
+        self.post('/api/confirm-reservation/', 'order-2')
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        out = StringIO()
+        call_command('sweep_reservations', '--once', stdout=out)
+        self.assertIn('Released 1 expired reservation(s)', out.getvalue())
+        self.assertEqual(dict(StockReservation.objects.values_list('reservation_id', 'status')),
+                         {'order-1': 'expired', 'order-2': 'confirmed'})
+        self.assertEqual(self.stock(), 3)
+
+        call_command('sweep_reservations', '--once', stdout=out)
+        self.assertEqual(self.stock(), 3)
+
+    def test_expired_hold_is_not_confirmed(self):
+        self.hold('order-1')
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.post('/api/confirm-reservation/', 'order-1').status_code, 409)
+        self.assertEqual(StockReservation.objects.get().status, 'expired')
+        self.assertEqual(self.stock(), 5)
+
+    def test_invalid_reservation_id(self):
+        self.assertEqual(self.hold('x' * 65).status_code, 400)
+        self.assertEqual(self.post('/api/confirm-reservation/', 7).status_code, 400)
+        self.assertEqual(self.client.post('/api/confirm-reservation/', {}, format='json').status_code, 400)
+
+
+class IdempotencyKeyTestCase(TestCase):
+    """Requests repeated with the same Idempotency-Key run once and get the stored response"""
+
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name='Tools')
+        self.hammer = Product.objects.create(name='Hammer', description='', price=Decimal('7.00'),
+                                             category=category, stock_quantity=5)
+
+    def take(self, key, quantity=2, url='/api/update-stock/'):
+        return self.client.post(url, {'product_id': self.hammer.id, 'quantity': quantity},
+                                format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def stock(self):
+        self.hammer.refresh_from_db()
+        return self.hammer.stock_quantity
+
+    def test_replay(self):
+        first, replay = self.take('take-2'), self.take('take-2')
+        self.assertEqual((replay.status_code, replay.data), (first.status_code, first.data))
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.stock(), 3)
+        # Keys are scoped per endpoint
+        self.assertNotIn('Idempotent-Replayed', self.client.post('/api/release-stock/', {
+            'items': [{'product_id': self.hammer.id, 'quantity': 2}]}, format='json', HTTP_IDEMPOTENCY_KEY='take-2'))
+
+    def test_key_reused_for_another_request(self):
+        self.take('take-2')
+        response = self.take('take-2', quantity=3)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.stock(), 3)
+
+    def test_request_in_progress(self):
+        self.take('take-2')
+        IdempotencyRecord.objects.update(status_code=None, response_body=None)
+        self.assertEqual(self.take('take-2').status_code, 409)
+        self.assertEqual(self.stock(), 3)
+
+    def test_expired_key(self):
+        self.take('take-2')
+        IdempotencyRecord.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertNotIn('Idempotent-Replayed', self.take('take-2'))
+        self.assertEqual(self.stock(), 1)
+
+        IdempotencyRecord.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Deleted 1 expired idempotency record(s)')
+
+    def test_errors_are_not_stored(self):
+        self.assertEqual(self.take('x' * 65).status_code, 400)
+        with mock.patch('products.views.decrease_stock', side_effect=DatabaseError('disk full')):
+            with self.assertRaises(DatabaseError):
+                self.take('take-2')
+        self.assertFalse(IdempotencyRecord.objects.exists())
+        self.assertEqual(self.take('take-2').status_code, 200)
+
+
+class BatchReservationTestCase(TestCase):
+    """Stock for several orders is held, confirmed and released in one call each"""
+
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name='Tools')
+        self.hammer = Product.objects.create(name='Hammer', description='', price=Decimal('7.00'),
+                                             category=category, stock_quantity=5)
+        self.saw = Product.objects.create(name='Saw', description='', price=Decimal('12.00'),
+                                          category=category, stock_quantity=1)
+
+    def reserve(self, *reservations):
+        return self.client.post('/api/reserve-stock/batch/', {'reservations': [
+            {'reservation_id': reservation_id, 'items': items} for reservation_id, items in reservations
+        ]}, format='json')
+
+    def test_each_reservation_is_all_or_nothing(self):
+        response = self.reserve(
+            ('a', [{'product_id': self.hammer.id, 'quantity': 2}]),
+            ('b', [{'product_id': self.hammer.id, 'quantity': 1}, {'product_id': self.saw.id, 'quantity': 2}]),
+            ('c', [{'product_id': self.saw.id, 'quantity': 1}]),
+            ('d', [{'product_id': self.hammer.id, 'quantity': 0}]),
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([result['reservation_id'] for result in results], ['a', 'b', 'c', 'd'])
+        self.assertEqual([result['success'] for result in results], [True, False, True, False])
+        self.assertEqual(results[1]['product_id'], self.saw.id)
+        self.assertEqual(results[0]['items'][0]['price'], '7.00')
+        self.hammer.refresh_from_db()
+        self.saw.refresh_from_db()
+        self.assertEqual((self.hammer.stock_quantity, self.saw.stock_quantity), (3, 0))
+
+        # Repeating the batch takes nothing twice
+        self.assertTrue(self.reserve(('a', [{'product_id': self.hammer.id, 'quantity': 2}]))
+                        .data['results'][0]['success'])
+        self.hammer.refresh_from_db()
+        self.assertEqual(self.hammer.stock_quantity, 3)
+
+    def test_confirm_and_release(self):
+        self.reserve(('a', [{'product_id': self.hammer.id, 'quantity': 2}]),
+                     ('b', [{'product_id': self.hammer.id, 'quantity': 1}]))
+
+        response = self.client.post('/api/confirm-reservation/batch/',
+                                    {'reservation_ids': ['a', 'missing']}, format='json')
+        self.assertEqual([result['success'] for result in response.data['results']], [True, False])
+
+        response = self.client.post('/api/release-stock/batch/',
+                                    {'reservation_ids': ['a', 'b', 'missing']}, format='json')
+        self.assertEqual([result['success'] for result in response.data['results']], [True, True, False])
+        self.assertEqual(set(StockReservation.objects.values_list('status', flat=True)), {'released'})
+        self.hammer.refresh_from_db()
+        self.assertEqual(self.hammer.stock_quantity, 5)
+
+    def test_expired_hold_is_not_confirmed(self):
+        self.reserve(('a', [{'product_id': self.hammer.id, 'quantity': 2}]),
+                     ('b', [{'product_id': self.hammer.id, 'quantity': 1}]))
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self.client.post('/api/confirm-reservation/', {'reservation_id': 'a'}, format='json')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post('/api/confirm-reservation/batch/', {'reservation_ids': ['b']}, format='json')
+        self.assertFalse(response.data['results'][0]['success'])
+        self.assertEqual(set(StockReservation.objects.values_list('status', flat=True)), {'expired'})
+        self.hammer.refresh_from_db()
+        self.assertEqual(self.hammer.stock_quantity, 5)
+
+    def test_invalid_batch(self):
+        self.assertEqual(self.reserve().status_code, 400)
+        self.assertEqual(self.reserve(('a', []), ('a', [])).status_code, 400)
+
+
+class SQLitePragmaTestCase(TestCase):
+    def test_pragmas_applied_to_connection(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+class ExplainQueriesTestCase(TestCase):
+    def test_no_endpoint_query_scans_a_whole_table(self):
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        self.assertIn('0 of ', out.getvalue().splitlines()[-1], out.getvalue())
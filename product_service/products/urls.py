@@ -1,12 +1,24 @@
 from django.urls import path
 from . import views
+from .response_cache import cache_response, product_scope
 
 urlpatterns = [
-    path('categories/', views.CategoryListCreateView.as_view(), name='category-list-create'),
+    path('categories/', cache_response('categories')(views.CategoryListCreateView.as_view()),
+         name='category-list-create'),
     path('categories/<int:pk>/', views.CategoryDetailView.as_view(), name='category-detail'),
-    path('products/', views.ProductListCreateView.as_view(), name='product-list-create'),
-    path('products/<int:pk>/', views.ProductDetailView.as_view(), name='product-detail'),
+    path('products/', cache_response('products')(views.ProductListCreateView.as_view()),
+         name='product-list-create'),
+    path('products/<int:pk>/', cache_response('categories', product_scope)(views.ProductDetailView.as_view()),
+         name='product-detail'),
     path('api/product/<int:product_id>/', views.product_by_id, name='product-by-id'),
+    path('api/products/batch/', views.products_by_ids, name='products-by-ids'),
     path('api/check-stock/', views.check_stock, name='check-stock'),
     path('api/update-stock/', views.update_stock, name='update-stock'),
+    path('api/reserve-stock/', views.reserve_stock, name='reserve-stock'),
+    path('api/reserve-stock/batch/', views.reserve_stock_batch, name='reserve-stock-batch'),
+    path('api/release-stock/', views.release_stock, name='release-stock'),
+    path('api/release-stock/batch/', views.release_stock_batch, name='release-stock-batch'),
+    path('api/confirm-reservation/', views.confirm_reservation, name='confirm-reservation'),
+    path('api/confirm-reservation/batch/', views.confirm_reservation_batch, name='confirm-reservation-batch'),
+    path('api/events/', views.event_feed, name='event-feed'),
 ]
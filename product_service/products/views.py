@@ -1,9 +1,33 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
-from django.db.models import Q
+from django.conf import settings
 from .models import Product, Category
-from .serializers import ProductSerializer, ProductListSerializer, CategorySerializer
+from .serializers import ProductSerializer, ProductListSerializer, CategorySerializer, OutboxEventSerializer
+from .pagination import KeysetPagination
+from .search import search_products
+from .idempotency import idempotent
+from .events import acknowledge, settled_events
+from .stock import (
+    StockError, ReservationError, decrease_stock, increase_stock, current_stock, parse_stock_items,
+    reserve_items, release_items, hold_items, confirm_hold, release_hold, hold_many, confirm_holds, release_holds,
+)
+
+
+MAX_BATCH_IDS = 1000
+MAX_EVENTS_PER_PAGE = 500
+MAX_BATCH_RESERVATIONS = 500
+
+
+def parse_ids(raw_ids):
+    """Parse a comma separated ``?ids=`` value into a list of unique integer IDs"""
+    try:
+        ids = {int(value) for value in raw_ids.split(',') if value.strip()}
+    except ValueError:
+        raise ValueError('ids must be a comma separated list of integers')
+    if len(ids) > MAX_BATCH_IDS:
+        raise ValueError(f'At most {MAX_BATCH_IDS} ids can be requested at once')
+    return sorted(ids)
 
 
 class CategoryListCreateView(generics.ListCreateAPIView):
@@ -18,6 +42,7 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
 
 class ProductListCreateView(generics.ListCreateAPIView):
     queryset = Product.objects.filter(is_active=True)
+    pagination_class = KeysetPagination
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -25,7 +50,7 @@ class ProductListCreateView(generics.ListCreateAPIView):
         return ProductListSerializer
 
     def get_queryset(self):
-        queryset = Product.objects.filter(is_active=True)
+        queryset = Product.objects.filter(is_active=True).select_related('category')
         category = self.request.query_params.get('category')
         search = self.request.query_params.get('search')
         
@@ -33,15 +58,15 @@ class ProductListCreateView(generics.ListCreateAPIView):
             queryset = queryset.filter(category__name__icontains=category)
         
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) | Q(description__icontains=search)
-            )
+            # Best matches first (see search.py)
+            queryset = search_products(queryset, search)
+            self.keyset_ordering = ('-search_rank', '-id')
         
         return queryset
 
 
 class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Product.objects.all()
+    queryset = Product.objects.select_related('category')
     serializer_class = ProductSerializer
 
 
@@ -49,13 +74,26 @@ class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
 def product_by_id(request, product_id):
     """API endpoint to get product by ID - used by other services"""
     try:
-        product = Product.objects.get(id=product_id, is_active=True)
+        product = Product.objects.select_related('category').get(id=product_id, is_active=True)
         serializer = ProductSerializer(product)
         return Response(serializer.data)
     except Product.DoesNotExist:
         return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['GET'])
+def products_by_ids(request):
+    """API endpoint to get several products in one query - used by other services"""
+    try:
+        product_ids = parse_ids(request.query_params.get('ids', ''))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    products = Product.objects.filter(id__in=product_ids, is_active=True).select_related('category')
+    serializer = ProductSerializer(products, many=True)
+    return Response(serializer.data)
+
+
 @api_view(['POST'])
 def check_stock(request):
     """API endpoint to check product stock - used by other services"""
@@ -81,28 +119,231 @@ def check_stock(request):
 
 
 @api_view(['POST'])
+@idempotent('update-stock')
 def update_stock(request):
     """API endpoint to update product stock - used by other services"""
     product_id = request.data.get('product_id')
     quantity = request.data.get('quantity')
     operation = request.data.get('operation', 'decrease')  # 'increase' or 'decrease'
     
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+        return Response({'error': 'quantity must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if operation == 'decrease':
+        success = decrease_stock(product_id, quantity)
+    elif operation == 'increase':
+        success = increase_stock(product_id, quantity)
+    else:
+        return Response({'error': 'Invalid operation'}, status=status.HTTP_400_BAD_REQUEST)
+    
     try:
-        product = Product.objects.get(id=product_id)
-        
-        if operation == 'decrease':
-            if product.stock_quantity >= quantity:
-                product.stock_quantity -= quantity
-                product.save()
-                return Response({'success': True, 'new_stock': product.stock_quantity})
-            else:
-                return Response({'error': 'Insufficient stock'}, status=status.HTTP_400_BAD_REQUEST)
-        elif operation == 'increase':
-            product.stock_quantity += quantity
-            product.save()
-            return Response({'success': True, 'new_stock': product.stock_quantity})
-        else:
-            return Response({'error': 'Invalid operation'}, status=status.HTTP_400_BAD_REQUEST)
-            
+        new_stock = current_stock(product_id)
     except Product.DoesNotExist:
         return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if not success:
+        return Response({'error': 'Insufficient stock'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'success': True, 'new_stock': new_stock})
+
+
+def parse_reservation_id(raw_reservation_id):
+    if raw_reservation_id is None:
+        return None
+    if not isinstance(raw_reservation_id, str) or not 0 < len(raw_reservation_id) <= 64:
+        raise ValueError('reservation_id must be a string of at most 64 characters')
+    return raw_reservation_id
+
+
+def parse_reservation_ids(raw_reservation_ids):
+    """Validate a non-empty list of unique reservation IDs"""
+    if not isinstance(raw_reservation_ids, list) or not raw_reservation_ids:
+        raise ValueError('reservation_ids must be a non-empty list')
+    if len(raw_reservation_ids) > MAX_BATCH_RESERVATIONS:
+        raise ValueError(f'At most {MAX_BATCH_RESERVATIONS} reservations can be sent at once')
+    reservation_ids = [parse_reservation_id(raw_reservation_id) for raw_reservation_id in raw_reservation_ids]
+    if None in reservation_ids or len(set(reservation_ids)) != len(reservation_ids):
+        raise ValueError('reservation_ids must be unique strings')
+    return reservation_ids
+
+
+@api_view(['POST'])
+@idempotent('reserve-stock')
+def reserve_stock(request):
+    """API endpoint to take stock for a whole order at once - used by other services
+
+    All items are validated and decremented in one transaction: either every
+    item is reserved or none is. The response carries the current name and
+    price of each product.
+
+    With a ``reservation_id`` the stock is only held for ``ttl`` seconds and
+    must be confirmed with /api/confirm-reservation/; unconfirmed holds are
+    given back by the ``sweep_reservations`` command. Repeating a request with
+    the same ``reservation_id`` returns the existing hold.
+    """
+    try:
+        items = parse_stock_items(request.data.get('items'))
+        reservation_id = parse_reservation_id(request.data.get('reservation_id'))
+        ttl = int(request.data.get('ttl', settings.STOCK_RESERVATION_TTL))
+    except (ValueError, TypeError) as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    ttl = min(max(ttl, 1), settings.STOCK_RESERVATION_MAX_TTL)
+    
+    try:
+        if reservation_id is None:
+            return Response({'success': True, 'items': reserve_items(items)})
+        return Response({'success': True, **hold_items(reservation_id, items, ttl)})
+    except StockError as e:
+        return Response({
+            'success': False, 'error': str(e), 'product_id': e.product_id
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except ReservationError as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_409_CONFLICT)
+
+
+@api_view(['POST'])
+def reserve_stock_batch(request):
+    """API endpoint to hold stock for several orders in one call - used by other services
+
+    Takes ``{"reservations": [{"reservation_id": ..., "items": [...]}, ...], "ttl": ...}``.
+    Each reservation is held all-or-nothing on its own, exactly as by
+    /api/reserve-stock/ with a ``reservation_id``, and ``results`` has one
+    entry per reservation in request order. Repeating a request is safe: holds
+    that already exist are returned rather than taken again.
+    """
+    raw_reservations = request.data.get('reservations')
+    try:
+        if (not isinstance(raw_reservations, list) or not raw_reservations
+                or not all(isinstance(raw, dict) for raw in raw_reservations)):
+            raise ValueError('reservations must be a non-empty list of objects with reservation_id and items')
+        reservation_ids = parse_reservation_ids([raw.get('reservation_id') for raw in raw_reservations])
+        ttl = int(request.data.get('ttl', settings.STOCK_RESERVATION_TTL))
+    except (ValueError, TypeError) as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    ttl = min(max(ttl, 1), settings.STOCK_RESERVATION_MAX_TTL)
+    
+    results = {}
+    holds = {}
+    for reservation_id, raw in zip(reservation_ids, raw_reservations):
+        try:
+            holds[reservation_id] = parse_stock_items(raw.get('items'))
+        except ValueError as e:
+            results[reservation_id] = {'success': False, 'reservation_id': reservation_id, 'error': str(e)}
+    
+    for reservation_id, held in hold_many(holds, ttl).items():
+        if isinstance(held, StockError):
+            results[reservation_id] = {'success': False, 'reservation_id': reservation_id,
+                                       'error': str(held), 'product_id': held.product_id}
+        elif isinstance(held, ReservationError):
+            results[reservation_id] = {'success': False, 'reservation_id': reservation_id, 'error': str(held)}
+        else:
+            results[reservation_id] = {'success': True, **held}
+    return Response({'results': [results[reservation_id] for reservation_id in reservation_ids]})
+
+
+@api_view(['POST'])
+def confirm_reservation(request):
+    """API endpoint to make a stock hold permanent - used by other services"""
+    try:
+        reservation_id = parse_reservation_id(request.data.get('reservation_id'))
+    except ValueError as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if reservation_id is None:
+        return Response({'success': False, 'error': 'reservation_id is required'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        confirm_hold(reservation_id)
+    except ReservationError as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    return Response({'success': True, 'reservation_id': reservation_id, 'status': 'confirmed'})
+
+
+@api_view(['POST'])
+def confirm_reservation_batch(request):
+    """API endpoint to make several stock holds permanent in one call - used by other services"""
+    try:
+        reservation_ids = parse_reservation_ids(request.data.get('reservation_ids'))
+    except ValueError as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    errors = confirm_holds(reservation_ids)
+    return Response({'results': [
+        {'success': False, 'reservation_id': reservation_id, 'error': errors[reservation_id]}
+        if reservation_id in errors else
+        {'success': True, 'reservation_id': reservation_id, 'status': 'confirmed'}
+        for reservation_id in reservation_ids
+    ]})
+
+
+@api_view(['POST'])
+@idempotent('release-stock')
+def release_stock(request):
+    """API endpoint to put stock for a whole order back at once - used by other services
+
+    Accepts either the ``items`` to put back or the ``reservation_id`` of a
+    hold, which gives back exactly what that hold took (at most once).
+    """
+    try:
+        reservation_id = parse_reservation_id(request.data.get('reservation_id'))
+        items = None if reservation_id else parse_stock_items(request.data.get('items'))
+    except ValueError as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if reservation_id is not None:
+        try:
+            release_hold(reservation_id)
+        except ReservationError as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'success': True, 'reservation_id': reservation_id, 'status': 'released'})
+    
+    try:
+        released = release_items(items)
+    except StockError as e:
+        return Response({
+            'success': False, 'error': str(e), 'product_id': e.product_id
+        }, status=status.HTTP_404_NOT_FOUND)
+    return Response({'success': True, 'items': released})
+
+
+@api_view(['POST'])
+def release_stock_batch(request):
+    """API endpoint to give back the stock of several reservations in one call - used by other services
+
+    Releasing is idempotent, as with /api/release-stock/; reservations that
+    do not exist are reported as not found.
+    """
+    try:
+        reservation_ids = parse_reservation_ids(request.data.get('reservation_ids'))
+    except ValueError as e:
+        return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    not_found = set(release_holds(reservation_ids))
+    return Response({'results': [
+        {'success': False, 'reservation_id': reservation_id, 'error': f'Reservation {reservation_id} not found'}
+        if reservation_id in not_found else
+        {'success': True, 'reservation_id': reservation_id, 'status': 'released'}
+        for reservation_id in reservation_ids
+    ]})
+
+
+@api_view(['GET'])
+def event_feed(request):
+    """API endpoint to read product change events in order - used by other services
+
+    Query params: ``after`` (last event ID already seen, default 0),
+    ``limit`` (at most MAX_EVENTS_PER_PAGE) and ``consumer``, a name under
+    which ``after`` is remembered so events are kept until it has read them.
+    """
+    try:
+        after = int(request.query_params.get('after', 0))
+        limit = int(request.query_params.get('limit', MAX_EVENTS_PER_PAGE))
+    except ValueError:
+        return Response({'error': 'after and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, MAX_EVENTS_PER_PAGE))
+
+    consumer = request.query_params.get('consumer')
+    if consumer:
+        acknowledge(consumer[:100], after)
+
+    serializer = OutboxEventSerializer(settled_events(after, limit), many=True)
+    return Response({'events': serializer.data})
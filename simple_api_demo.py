@@ -45,8 +45,8 @@ This demo uses existing data to show inter-service communication.
     try:
         response = session.get(f"{USER_SERVICE}/users/")
         if response.status_code == 200:
-            users = response.json()
-            print_success(f"Found {len(users)} users in the system")
+            users = response.json()['results']
+            print_success(f"Found {len(users)} users on the first page")
             for user in users[:3]:  # Show first 3
                 print(f"   👤 {user['username']} (ID: {user['id']}) - {user['email']}")
         else:
@@ -61,8 +61,8 @@ This demo uses existing data to show inter-service communication.
     try:
         response = session.get(f"{PRODUCT_SERVICE}/products/")
         if response.status_code == 200:
-            products = response.json()
-            print_success(f"Found {len(products)} products in the catalog")
+            products = response.json()['results']
+            print_success(f"Found {len(products)} products on the first catalog page")
             for product in products[:5]:  # Show first 5
                 print(f"   📱 {product['name']} - ${product['price']} (Stock: {product['stock_quantity']})")
         else:
@@ -131,36 +131,42 @@ This demo uses existing data to show inter-service communication.
                 
                 response = session.get(f"{PRODUCT_SERVICE}/products/")
                 if response.status_code == 200:
-                    updated_products = response.json()
+                    updated_products = response.json()['results']
                     print_success("Inventory after order:")
                     
                     for product in updated_products[:5]:
                         print(f"   📦 {product['name']}: {product['stock_quantity']} units")
                         
-                # Step 5: Get all orders
-                print_step("5", "Viewing All Orders")
+                # Step 5: Order analytics
+                print_step("5", "Order Analytics")
                 
-                response = session.get(f"{ORDER_SERVICE}/orders/")
+                response = session.get(f"{ORDER_SERVICE}/api/analytics/summary/")
                 if response.status_code == 200:
-                    all_orders = response.json()
-                    print_success(f"Total orders in system: {len(all_orders)}")
+                    summary = response.json()
+                    orders_by_status = summary['orders_by_status']
+                    print_success(f"Total orders in system: {sum(orders_by_status.values())}")
                     
-                    active_orders = [o for o in all_orders if o['status'] != 'cancelled']
-                    cancelled_orders = [o for o in all_orders if o['status'] == 'cancelled']
+                    for order_status, count in sorted(orders_by_status.items()):
+                        print(f"   📊 {order_status.capitalize()} orders: {count}")
+                    print(f"   💰 Total revenue: ${summary['revenue']} from {summary['sold_orders']} sold orders")
                     
-                    print(f"   ✅ Active orders: {len(active_orders)}")
-                    print(f"   ❌ Cancelled orders: {len(cancelled_orders)}")
-                    
-                    total_revenue = sum(float(o['total_amount']) for o in active_orders)
-                    print(f"   💰 Total revenue: ${total_revenue:.2f}")
+                    response = session.get(f"{ORDER_SERVICE}/api/analytics/top-products/", params={"limit": 3})
+                    if response.status_code == 200:
+                        print_info("Best selling products:")
+                        for product in response.json():
+                            print(f"   🏆 {product['product_name'] or product['product_id']} - "
+                                  f"{product['quantity']} sold (${product['revenue']})")
                     
+                    response = session.get(f"{ORDER_SERVICE}/orders/", params={"page_size": 3})
                     print_info("Recent orders:")
-                    for order in all_orders[-3:]:  # Show last 3 orders
+                    for order in response.json()['results']:
                         user_info = order.get('user_info', {})
                         customer_name = "Unknown"
                         if user_info and 'user' in user_info:
                             customer_name = user_info['user'].get('username', 'Unknown')
                         print(f"   📋 Order #{order['id']} - {customer_name} - ${order['total_amount']} ({order['status']})")
+                else:
+                    print_error("Could not retrieve order analytics")
                 
             else:
                 print_error(f"Failed to create order: {response.text}")
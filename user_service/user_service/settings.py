@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -77,11 +78,51 @@ WSGI_APPLICATION = "user_service.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db_user_service.sqlite3",
+# SQLite by default. Set DB_ENGINE=postgresql (with DB_NAME, DB_USER, DB_PASSWORD,
+# DB_HOST, DB_PORT) to use a database server; put PgBouncer in front of it for
+# pooling across processes and set DB_DISABLE_SERVER_SIDE_CURSORS=true when it
+# runs in transaction pooling mode.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+
+# Longest a statement waits for a lock before failing, in ms: SQLite's busy_timeout and
+# PostgreSQL's lock_timeout (SQLITE_BUSY_TIMEOUT is the older name of this setting)
+DB_LOCK_TIMEOUT = int(os.environ.get('DB_LOCK_TIMEOUT', os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)))
+
+if DB_ENGINE == 'sqlite3':
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get('DB_NAME', BASE_DIR / "db_user_service.sqlite3"),
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": f"django.db.backends.{DB_ENGINE}",
+            "NAME": os.environ.get('DB_NAME', "user_service"),
+            "USER": os.environ.get('DB_USER', ''),
+            "PASSWORD": os.environ.get('DB_PASSWORD', ''),
+            "HOST": os.environ.get('DB_HOST', 'localhost'),
+            "PORT": os.environ.get('DB_PORT', ''),
+            "DISABLE_SERVER_SIDE_CURSORS": os.environ.get('DB_DISABLE_SERVER_SIDE_CURSORS', 'false').lower() == 'true',
+        }
     }
+    if DB_ENGINE == 'postgresql':
+        DATABASES["default"]["OPTIONS"] = {"options": f"-c lock_timeout={DB_LOCK_TIMEOUT}"}
+
+# Keep connections open between requests (per thread) for this many seconds and
+# check them before reuse, instead of connecting on every request
+DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# Applied to every new SQLite connection (see users/db.py): WAL lets readers run
+# while a write is in progress, busy_timeout (ms) makes a writer wait for the lock
+# instead of failing with "database is locked", and synchronous=NORMAL drops the
+# fsync per commit, which WAL keeps safe against corruption.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': DB_LOCK_TIMEOUT,
+    'synchronous': 'NORMAL',
 }
 
 
@@ -146,8 +187,25 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:8002",  # Order Service
 ]
 
+# Cache for rendered responses of /api/user/<id>/ (see response_cache.py).
+# The default is per process; point several server processes at a shared cache,
+# e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and
+# CACHE_LOCATION=redis://localhost:6379/2, so they see each other's invalidations.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'user_service'),
+    }
+}
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 300))  # 0 disables the cache
+
+# Change events are served at GET /api/events/ once they are this many seconds old.
+# Event IDs are allocated before the transaction commits, so a consumer could read
+# past an ID whose event is still in flight; by then any write has committed or
+# failed its lock wait (see DB_LOCK_TIMEOUT). Raise it for longer transactions.
+OUTBOX_SETTLE = float(os.environ.get('OUTBOX_SETTLE', DB_LOCK_TIMEOUT / 1000 + 1))
+
 # OpenTelemetry Database Configuration
-import os
 os.environ.setdefault('OTEL_RESOURCE_ATTRIBUTES', 
     'service.name=user_service,'
     'service.version=1.0.0,'
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+from .db import configure_sqlite, create_auth_user_indexes
 
 
 class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "users"
+
+    def ready(self):
+        connection_created.connect(configure_sqlite, dispatch_uid='users.configure_sqlite')
+        post_migrate.connect(create_auth_user_indexes, sender=self)
+        from . import events, response_cache  # connect their signal handlers
@@ -0,0 +1,25 @@
+"""
+Per-connection database settings, and indexes on tables this app does not own.
+"""
+
+from django.conf import settings
+from django.db import connections
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply ``settings.SQLITE_PRAGMAS`` to a newly opened SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def create_auth_user_indexes(sender, using, **kwargs):
+    """Index ``auth_user`` for the user list, which pages by (date_joined, id) newest first.
+
+    ``auth.User`` belongs to Django, so the index cannot be declared in its
+    Meta; it is created after ``migrate`` instead.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute('CREATE INDEX IF NOT EXISTS auth_user_joined_idx ON auth_user (date_joined, id)')
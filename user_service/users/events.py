@@ -0,0 +1,138 @@
+"""
+User change events for other services (transactional outbox).
+
+Signal handlers record changes to the user data other services keep copies
+of (the payload of ``/api/user/<id>/``) in the ``OutboxEvent`` table, in the
+same transaction as the change, so an event exists if and only if the change
+committed. ``UserProfile.save()`` and deletes are atomic by themselves. The
+``User`` model belongs to Django, so its ``save()`` is not: this service saves
+users inside ``transaction.atomic`` (as does the admin), and code that saves a
+``User`` directly must do the same, or in autocommit mode the user and its
+event are written separately. Consumers read the events in order from
+``GET /api/events/?after=<last event ID seen>&consumer=<name>``; events are
+served once settled (see ``settled_events``), and ``purge_outbox_events``
+only deletes events every named consumer has read.
+
+Every payload is the full current profile, so consumers can upsert from any
+single event. Changes made with ``QuerySet.update()`` bypass the signals and
+publish nothing.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Min
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import OutboxConsumer, OutboxEvent, UserProfile
+from .serializers import UserProfileSerializer
+
+
+USER_CREATED = 'user.created'
+USER_PROFILE_UPDATED = 'user.profile_updated'
+USER_DELETED = 'user.deleted'
+
+# Fields that appear in the published profile
+TRACKED_USER_FIELDS = ('username', 'email', 'first_name', 'last_name')
+TRACKED_PROFILE_FIELDS = ('phone', 'address')
+
+
+def profile_payload(profile):
+    return dict(UserProfileSerializer(profile).data)
+
+
+def publish(event_type, aggregate_id, payload):
+    return OutboxEvent.objects.create(event_type=event_type, aggregate_id=aggregate_id, payload=payload)
+
+
+def _remember_published_state(instance, fields):
+    # Read __dict__ directly: touching a deferred field would cost a query per instance
+    instance._published_state = {field: instance.__dict__.get(field) for field in fields}
+
+
+def _changed(instance, fields, update_fields):
+    for field in fields:
+        if update_fields is not None and field not in update_fields:
+            continue
+        if field in instance.__dict__ and instance.__dict__[field] != instance._published_state.get(field):
+            return True
+    return False
+
+
+@receiver(post_init, sender=User)
+def track_user(sender, instance, **kwargs):
+    _remember_published_state(instance, TRACKED_USER_FIELDS)
+
+
+@receiver(post_init, sender=UserProfile)
+def track_profile(sender, instance, **kwargs):
+    _remember_published_state(instance, TRACKED_PROFILE_FIELDS)
+
+
+@receiver(post_save, sender=UserProfile)
+def publish_profile_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        publish(USER_CREATED, instance.user_id, profile_payload(instance))
+    elif _changed(instance, TRACKED_PROFILE_FIELDS, update_fields):
+        publish(USER_PROFILE_UPDATED, instance.user_id, profile_payload(instance))
+    _remember_published_state(instance, TRACKED_PROFILE_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def publish_user_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Atomic with the user only if the caller saved it in a transaction (see above)
+    # A new user has no profile yet; its event is published when the profile is created
+    if raw or created:
+        return
+    if _changed(instance, TRACKED_USER_FIELDS, update_fields):
+        profile = UserProfile.objects.filter(user=instance).first()
+        if profile is not None:
+            profile.user = instance
+            profile.save(update_fields=['updated_at'])  # The profile shown changed
+            publish(USER_PROFILE_UPDATED, instance.id, profile_payload(profile))
+    _remember_published_state(instance, TRACKED_USER_FIELDS)
+
+
+@receiver(post_delete, sender=UserProfile)
+def publish_profile_deleted(sender, instance, **kwargs):
+    publish(USER_DELETED, instance.user_id, {'id': instance.user_id})
+
+
+def settled_events(after, limit):
+    """Up to ``limit`` events after event ID ``after``, stopping at the first one not yet settled.
+
+    IDs are allocated before the transaction that writes the event commits,
+    so an event can become visible after one with a higher ID was read. Events
+    are only served ``OUTBOX_SETTLE`` seconds after they were written, when
+    any transaction started before them has committed or given up.
+    """
+    settled = timezone.now() - timedelta(seconds=settings.OUTBOX_SETTLE)
+    events = list(OutboxEvent.objects.filter(id__gt=after).order_by('id')[:limit])
+    for index, event in enumerate(events):
+        if event.created_at > settled:
+            return events[:index]
+    return events
+
+
+def acknowledge(consumer, after):
+    """Record that ``consumer`` has applied every event up to ``after``"""
+    if not OutboxConsumer.objects.filter(name=consumer, last_event_id__lt=after).update(last_event_id=after):
+        OutboxConsumer.objects.get_or_create(name=consumer, defaults={'last_event_id': after})
+
+
+def purge_old_events(older_than):
+    """Delete events created before ``older_than`` that every consumer has read.
+
+    Consumers are those that name themselves when reading the feed; with none
+    known, nothing is deleted. Returns how many events were deleted.
+    """
+    read = OutboxConsumer.objects.aggregate(read=Min('last_event_id'))['read']
+    if read is None:
+        return 0
+    deleted, _ = OutboxEvent.objects.filter(created_at__lt=older_than, id__lte=read).delete()
+    return deleted
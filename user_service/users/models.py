@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
 
@@ -12,5 +12,42 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username} - Profile"
 
+    def save(self, *args, **kwargs):
+        # Change events are written to the outbox by a post_save handler (see
+        # events.py); they must commit or roll back together with the profile
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         db_table = 'user_profile'
+
+
+class OutboxEvent(models.Model):
+    """Change event for other services, written in the same transaction as the change"""
+    event_type = models.CharField(max_length=50)  # e.g. 'user.profile_updated'
+    aggregate_id = models.PositiveIntegerField()  # ID of the user the event is about
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.event_type} {self.aggregate_id}"
+
+    class Meta:
+        db_table = 'outbox_event'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['created_at'], name='outbox_event_created_idx'),
+        ]
+
+
+class OutboxConsumer(models.Model):
+    """Position of a named consumer in the change event feed, as of its last read"""
+    name = models.CharField(max_length=100, unique=True)
+    last_event_id = models.BigIntegerField(default=0)  # It has applied every event up to this one
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.last_event_id}"
+
+    class Meta:
+        db_table = 'outbox_consumer'
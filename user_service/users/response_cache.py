@@ -0,0 +1,162 @@
+"""
+Cache of rendered responses for read-heavy endpoints that rarely change.
+
+A view wrapped with ``cache_response`` answers a GET from the cache, with no
+queries and no serialization, when the same URL and query string was
+rendered since the data it shows last changed. Responses carry a strong
+``ETag`` (a hash of the body), ``Last-Modified`` from the ``updated_at`` of
+what they show and ``Cache-Control: no-cache``, so clients revalidate with
+``If-None-Match``/``If-Modified-Since`` and get ``304 Not Modified`` while
+nothing changed.
+
+Invalidation is by generation: each scope (``'user:<id>'``) has a counter in
+the cache that is part of the key of every response that depends on it.
+``invalidate`` bumps the counters, so those entries are never read again and
+expire after ``RESPONSE_CACHE_TTL`` seconds. It bumps them again when the
+transaction commits, so a response rendered from the old data in the
+meantime is not served either. With several server processes use a shared
+``CACHE_BACKEND`` (e.g. Redis); with the default in-process cache each
+process only sees its own invalidations.
+
+Saves that only write fields the cached responses do not show, such as
+``last_login`` on every login, invalidate nothing.
+"""
+
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+
+from .models import UserProfile
+
+
+KEY_PREFIX = 'response'
+
+
+def _generation_key(scope):
+    return f'{KEY_PREFIX}:generation:{scope}'
+
+
+def _bump(scopes):
+    for scope in scopes:
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:  # Never read, or evicted: any new value orphans the old entries
+            cache.set(key, time.time_ns(), None)
+
+
+def _generations(scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def invalidate(*scopes):
+    """Stop serving cached responses that depend on any of ``scopes``"""
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def _last_modified(data):
+    """Latest ``updated_at`` in a serialized object or page of objects, as a timestamp"""
+    if isinstance(data, dict):
+        data = data.get('results', [data])
+    if not isinstance(data, list):
+        return None
+    updated = [parse_datetime(item['updated_at']) for item in data
+               if isinstance(item, dict) and item.get('updated_at')]
+    return int(max(updated).timestamp()) if updated else None
+
+
+def _add_validators(response, entry):
+    response['ETag'] = entry['etag']
+    if entry['last_modified'] is not None:
+        response['Last-Modified'] = http_date(entry['last_modified'])
+    patch_cache_control(response, no_cache=True)
+
+
+def cache_response(*scopes):
+    """Cache successful GET responses of a view until one of ``scopes`` is invalidated.
+
+    A scope is a string, or a callable that takes the view's URL kwargs and
+    returns one (e.g. ``user_scope``).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or settings.RESPONSE_CACHE_TTL <= 0:
+                return view(request, *args, **kwargs)
+
+            names = [scope(**kwargs) if callable(scope) else scope for scope in scopes]
+            key_source = repr((request.get_full_path(), names, _generations(names)))
+            key = f'{KEY_PREFIX}:{hashlib.sha256(key_source.encode()).hexdigest()}'
+
+            entry = cache.get(key)
+            if entry is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                if hasattr(response, 'render'):
+                    response.render()
+                entry = {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                    'etag': f'"{hashlib.sha256(response.content).hexdigest()[:32]}"',
+                    'last_modified': _last_modified(getattr(response, 'data', None)),
+                }
+                cache.set(key, entry, settings.RESPONSE_CACHE_TTL)
+                response['X-Cache'] = 'MISS'
+            else:
+                response = HttpResponse(entry['content'], content_type=entry['content_type'])
+                response['X-Cache'] = 'HIT'
+
+            _add_validators(response, entry)
+            return get_conditional_response(request, etag=entry['etag'],
+                                            last_modified=entry['last_modified'], response=response)
+        return wrapper
+    return decorator
+
+
+def saved_only(update_fields, fields):
+    """Whether a save limited to ``update_fields`` wrote nothing but ``fields``"""
+    return update_fields is not None and set(update_fields) <= set(fields)
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+# Not shown by /api/user/<id>/, so saving only these (e.g. last_login on every
+# login) leaves the cached responses alone
+UNSHOWN_USER_FIELDS = ('last_login', 'password')
+
+
+@receiver(post_save, sender=User)
+def invalidate_saved_user(sender, instance, update_fields=None, **kwargs):
+    if not saved_only(update_fields, UNSHOWN_USER_FIELDS):
+        invalidate(user_scope(instance.pk))
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    invalidate(user_scope(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_profile(sender, instance, **kwargs):
+    invalidate(user_scope(instance.user_id))
@@ -1,6 +1,7 @@
 from rest_framework import serializers
+from django.db import transaction
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import UserProfile, OutboxEvent
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -31,6 +32,14 @@ class UserCreateSerializer(serializers.ModelSerializer):
         phone = validated_data.pop('phone', '')
         address = validated_data.pop('address', '')
         
-        user = User.objects.create_user(**validated_data)
-        UserProfile.objects.create(user=user, phone=phone, address=address)
+        # The user.created event is written with the profile; keep both in one transaction
+        with transaction.atomic():
+            user = User.objects.create_user(**validated_data)
+            UserProfile.objects.create(user=user, phone=phone, address=address)
         return user
+
+
+class OutboxEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OutboxEvent
+        fields = ['id', 'event_type', 'aggregate_id', 'payload', 'created_at']
@@ -1,3 +1,206 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import OutboxEvent, UserProfile
+
+
+class QueryCountTestCase(TestCase):
+    """Asserts that list endpoints run a constant number of queries per page"""
+
+    def setUp(self):
+        self.client = APIClient()
+        for index in range(5):
+            user = User.objects.create_user(username=f'user{index}', password='password123')
+            UserProfile.objects.create(user=user, phone='123', address='Somewhere')
+        self.user_ids = list(User.objects.values_list('id', flat=True))
+
+    def test_user_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_user_by_id(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/user/{self.user_ids[0]}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['id'], self.user_ids[0])
+
+    def test_users_batch(self):
+        ids = ','.join(str(user_id) for user_id in self.user_ids)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/users/batch/', {'ids': ids})
+        self.assertEqual(len(response.data), 5)
+
+    def test_profile_detail(self):
+        profile = UserProfile.objects.first()
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/profiles/{profile.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+
+class BatchLookupTestCase(TestCase):
+    """GET /api/users/batch/ returns several users in one call"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='alice', password='password123')
+        UserProfile.objects.create(user=self.user, phone='123')
+
+    def test_unknown_ids_are_omitted(self):
+        response = self.client.get('/api/users/batch/', {'ids': f'{self.user.id},{self.user.id},999999'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([profile['user']['username'] for profile in response.data], ['alice'])
+
+    def test_invalid_ids(self):
+        for ids in ('1,two', ','.join(str(user_id) for user_id in range(1, 1002))):
+            response = self.client.get('/api/users/batch/', {'ids': ids})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.data)
+
+
+class KeysetPaginationTestCase(TestCase):
+    """GET /users/ pages follow a cursor on (date_joined, id), newest first"""
+
+    def setUp(self):
+        self.client = APIClient()
+        for index in range(5):
+            User.objects.create_user(username=f'user{index}', password='password123')
+        # Users who joined in the same instant are ordered by ID
+        User.objects.update(date_joined=timezone.now() - timedelta(days=1))
+
+    def test_pages_follow_the_cursor(self):
+        expected = list(User.objects.order_by('-date_joined', '-id').values_list('id', flat=True))
+        response = self.client.get('/users/', {'page_size': 2})
+        User.objects.create_user(username='newcomer', password='password123')
+
+        ids = []
+        while True:
+            ids += [user['id'] for user in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/users/', {'cursor': 'WzFd'}).status_code, 404)
+
+
+class OutboxEventTestCase(TestCase):
+    """User changes other services copy are published to the outbox"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_created_and_profile_updated(self):
+        response = self.client.post('/users/', {
+            'username': 'alice', 'email': 'alice@example.com', 'password': 'password123', 'phone': '123',
+        }, format='json')
+        user_id = response.data['id']
+
+        self.client.patch(f'/users/{user_id}/', {'first_name': 'Alice'}, format='json')
+        self.client.patch(f'/profiles/{UserProfile.objects.get(user_id=user_id).id}/',
+                          {'address': 'Elsewhere'}, format='json')
+        user = User.objects.get(id=user_id)
+        user.set_password('changed-password')  # not part of the published profile
+        user.save()
+
+        events = list(OutboxEvent.objects.all())
+        self.assertEqual([event.event_type for event in events],
+                         ['user.created', 'user.profile_updated', 'user.profile_updated'])
+        self.assertEqual(events[1].payload['user']['first_name'], 'Alice')
+        self.assertEqual(events[2].payload['address'], 'Elsewhere')
+        self.assertEqual(events[2].payload, self.client.get(f'/api/user/{user_id}/').data)
+
+    def test_user_update_and_event_commit_together(self):
+        user = User.objects.create_user(username='alice', password='password123')
+        UserProfile.objects.create(user=user)
+        with mock.patch('users.events.publish', side_effect=DatabaseError('outbox unavailable')):
+            with self.assertRaises(DatabaseError):
+                self.client.patch(f'/users/{user.id}/', {'first_name': 'Alice'}, format='json')
+        user.refresh_from_db()
+        self.assertEqual(user.first_name, '')
+        self.assertEqual(OutboxEvent.objects.filter(event_type='user.profile_updated').count(), 0)
+
+    def create_events(self, count):
+        for index in range(count):
+            user = User.objects.create_user(username=f'user{index}', password='password123')
+            UserProfile.objects.create(user=user)
+        return list(OutboxEvent.objects.values_list('id', flat=True))
+
+    @override_settings(OUTBOX_SETTLE=0)
+    def test_event_feed(self):
+        first_id = self.create_events(3)[0]
+
+        response = self.client.get('/api/events/', {'after': first_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event['id'] for event in response.data['events']], [first_id + 1, first_id + 2])
+
+    @override_settings(OUTBOX_SETTLE=60)
+    def test_feed_stops_at_unsettled_event(self):
+        event_ids = self.create_events(3)
+        # The second event is recent: its transaction might still hide an earlier one
+        OutboxEvent.objects.exclude(id=event_ids[1]).update(created_at=timezone.now() - timedelta(minutes=5))
+
+        response = self.client.get('/api/events/')
+        self.assertEqual([event['id'] for event in response.data['events']], event_ids[:1])
+
+    @override_settings(OUTBOX_SETTLE=0)
+    def test_purge_keeps_unread_events(self):
+        event_ids = self.create_events(3)
+        OutboxEvent.objects.update(created_at=timezone.now() - timedelta(days=30))
+
+        err = StringIO()
+        call_command('purge_outbox_events', stdout=StringIO(), stderr=err)
+        self.assertEqual(OutboxEvent.objects.count(), 3)
+        self.assertIn('No consumer has read the feed', err.getvalue())
+
+        self.client.get('/api/events/', {'after': event_ids[1], 'consumer': 'order-service'})
+        self.client.get('/api/events/', {'after': event_ids[0], 'consumer': 'reporting'})
+        err = StringIO()
+        call_command('purge_outbox_events', stdout=StringIO(), stderr=err)
+        self.assertEqual(list(OutboxEvent.objects.values_list('id', flat=True)), event_ids[1:])
+        self.assertEqual(err.getvalue(), '')
+
+
+class ExplainQueriesTestCase(TestCase):
+    def test_no_endpoint_query_scans_a_whole_table(self):
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        self.assertIn('0 of ', out.getvalue().splitlines()[-1], out.getvalue())
+
+
+class ResponseCacheTestCase(TestCase):
+    """/api/user/<id>/ is served from the cache until the user changes, and revalidates with 304"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='alice', password='password123')
+        UserProfile.objects.create(user=self.user, phone='123', address='Somewhere')
+        self.url = f'/api/user/{self.user.id}/'
+
+    def test_hit_not_modified_and_invalidation(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        # Logging in only writes last_login, which the response does not show
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+
+        self.client.patch(f'/users/{self.user.id}/', {'email': 'alice@example.com'}, format='json')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['email'], 'alice@example.com')
@@ -1,10 +1,13 @@
 from django.urls import path
 from . import views
+from .response_cache import cache_response, user_scope
 
 urlpatterns = [
     path('users/', views.UserListCreateView.as_view(), name='user-list-create'),
     path('users/<int:pk>/', views.UserDetailView.as_view(), name='user-detail'),
     path('profiles/<int:pk>/', views.UserProfileDetailView.as_view(), name='profile-detail'),
-    path('api/user/<int:user_id>/', views.user_by_id, name='user-by-id'),
+    path('api/user/<int:user_id>/', cache_response(user_scope)(views.user_by_id), name='user-by-id'),
+    path('api/users/batch/', views.users_by_ids, name='users-by-ids'),
     path('api/verify/', views.verify_user, name='verify-user'),
+    path('api/events/', views.event_feed, name='event-feed'),
 ]
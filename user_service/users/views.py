@@ -3,12 +3,31 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
+from django.db import transaction
 from .models import UserProfile
-from .serializers import UserSerializer, UserProfileSerializer, UserCreateSerializer
+from .serializers import UserSerializer, UserProfileSerializer, UserCreateSerializer, OutboxEventSerializer
+from .pagination import KeysetPagination
+from .events import acknowledge, settled_events
+
+
+MAX_BATCH_IDS = 1000
+MAX_EVENTS_PER_PAGE = 500
+
+
+def parse_ids(raw_ids):
+    """Parse a comma separated ``?ids=`` value into a list of unique integer IDs"""
+    try:
+        ids = {int(value) for value in raw_ids.split(',') if value.strip()}
+    except ValueError:
+        raise ValueError('ids must be a comma separated list of integers')
+    if len(ids) > MAX_BATCH_IDS:
+        raise ValueError(f'At most {MAX_BATCH_IDS} ids can be requested at once')
+    return sorted(ids)
 
 
 class UserListCreateView(generics.ListCreateAPIView):
     queryset = User.objects.all()
+    pagination_class = KeysetPagination
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -31,9 +50,14 @@ class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
+    def perform_update(self, serializer):
+        # Commit the user and its user.profile_updated event together
+        with transaction.atomic():
+            serializer.save()
+
 
 class UserProfileDetailView(generics.RetrieveUpdateAPIView):
-    queryset = UserProfile.objects.all()
+    queryset = UserProfile.objects.select_related('user')
     serializer_class = UserProfileSerializer
 
 
@@ -41,14 +65,26 @@ class UserProfileDetailView(generics.RetrieveUpdateAPIView):
 def user_by_id(request, user_id):
     """API endpoint to get user by ID - used by other services"""
     try:
-        user = User.objects.get(id=user_id)
-        profile = UserProfile.objects.get(user=user)
+        profile = UserProfile.objects.select_related('user').get(user_id=user_id)
         profile_serializer = UserProfileSerializer(profile)
         return Response(profile_serializer.data)
-    except (User.DoesNotExist, UserProfile.DoesNotExist):
+    except UserProfile.DoesNotExist:
         return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['GET'])
+def users_by_ids(request):
+    """API endpoint to get several users in one query - used by other services"""
+    try:
+        user_ids = parse_ids(request.query_params.get('ids', ''))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    profiles = UserProfile.objects.filter(user_id__in=user_ids).select_related('user')
+    serializer = UserProfileSerializer(profiles, many=True)
+    return Response(serializer.data)
+
+
 @api_view(['POST'])
 def verify_user(request):
     """API endpoint to verify user credentials - used by other services"""
@@ -64,3 +100,26 @@ def verify_user(request):
         return Response({'valid': True, 'user': serializer.data})
     else:
         return Response({'valid': False, 'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
+
+
+@api_view(['GET'])
+def event_feed(request):
+    """API endpoint to read user change events in order - used by other services
+
+    Query params: ``after`` (last event ID already seen, default 0),
+    ``limit`` (at most MAX_EVENTS_PER_PAGE) and ``consumer``, a name under
+    which ``after`` is remembered so events are kept until it has read them.
+    """
+    try:
+        after = int(request.query_params.get('after', 0))
+        limit = int(request.query_params.get('limit', MAX_EVENTS_PER_PAGE))
+    except ValueError:
+        return Response({'error': 'after and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, MAX_EVENTS_PER_PAGE))
+
+    consumer = request.query_params.get('consumer')
+    if consumer:
+        acknowledge(consumer[:100], after)
+
+    serializer = OutboxEventSerializer(settled_events(after, limit), many=True)
+    return Response({'events': serializer.data})